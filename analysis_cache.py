@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+查询分析缓存模块
+
+这个模块缓存 analyze_query 的分析结果（是否需要搜索、问题类型和搜索关键词），
+缓存键由规范化后的用户问题、模型标识符和当前日期组成。
+
+由于分析提示词中包含当前日期，所有缓存条目最晚在当天结束时过期；
+对于包含"最新"、"今天"等时间限定词的问题，使用更短的过期时间。
+"""
+
+import os
+import json
+import datetime
+import threading
+from dotenv import load_dotenv
+
+from cache_store import TTLCache, normalize_query, seconds_until_midnight
+
+# 加载环境变量
+load_dotenv()
+
+# 时间敏感的问题中常见的时间限定词
+TIME_SENSITIVE_WORDS = [
+    "最新", "今天", "今日", "昨天", "昨日", "明天", "现在", "当前", "目前", "最近", "近期",
+    "本周", "这周", "本月", "这个月", "今年", "实时", "刚刚", "latest", "today", "now"
+]
+
+# 进程内共享的分析缓存
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def is_enabled():
+    """是否启用查询分析缓存，默认启用"""
+    return os.getenv('ANALYSIS_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def get_cache():
+    """
+    获取进程内共享的查询分析缓存
+
+    Returns:
+        TTLCache: 查询分析缓存
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TTLCache(
+                    'analysis',
+                    max_entries=int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '5000')),
+                    max_bytes=int(os.getenv('ANALYSIS_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+                )
+    return _cache
+
+
+def is_time_sensitive(normalized_query):
+    """判断问题是否包含时间限定词"""
+    return any(word in normalized_query for word in TIME_SENSITIVE_WORDS)
+
+
+def get_ttl(normalized_query, now=None):
+    """
+    计算缓存过期时间
+
+    Args:
+        normalized_query: 规范化后的用户问题
+        now: 当前时间
+
+    Returns:
+        float: 过期时间（秒），不超过距离午夜的秒数
+    """
+    if is_time_sensitive(normalized_query):
+        ttl = float(os.getenv('ANALYSIS_CACHE_TIME_SENSITIVE_TTL', '600'))
+    else:
+        ttl = float(os.getenv('ANALYSIS_CACHE_TTL', '3600'))
+    return min(ttl, seconds_until_midnight(now))
+
+
+def make_key(normalized_query, model_id, now=None):
+    """生成缓存键：规范化后的问题、模型标识符和当前日期"""
+    now = now or datetime.datetime.now()
+    return json.dumps([normalized_query, model_id or '', now.date().isoformat()], ensure_ascii=False)
+
+
+def get(query, model_id=None):
+    """
+    读取缓存的分析结果
+
+    Args:
+        query: 用户问题
+        model_id: 模型标识符
+
+    Returns:
+        tuple: (是否需要搜索, 问题类型, 搜索关键词列表)，未命中时返回 None
+    """
+    if not is_enabled():
+        return None
+    cached = get_cache().get(make_key(normalize_query(query), model_id))
+    if cached is None:
+        return None
+    return cached['need_search'], cached['question_type'], cached['keywords']
+
+
+def put(query, model_id, need_search, question_type, keywords):
+    """
+    缓存分析结果
+
+    Args:
+        query: 用户问题
+        model_id: 模型标识符
+        need_search: 是否需要搜索
+        question_type: 问题类型
+        keywords: 搜索关键词列表
+    """
+    if not is_enabled():
+        return
+    now = datetime.datetime.now()
+    normalized_query = normalize_query(query)
+    get_cache().set(
+        make_key(normalized_query, model_id, now),
+        {'need_search': need_search, 'question_type': question_type, 'keywords': keywords},
+        get_ttl(normalized_query, now)
+    )
+
+
+def get_stats():
+    """
+    获取查询分析缓存的统计信息
+
+    Returns:
+        dict: 命中、未命中、淘汰次数等统计信息
+    """
+    return get_cache().stats()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+回答缓存模块
+
+这个模块缓存不需要搜索的 DIRECT_ANSWER 回答（如定义、翻译、使用帮助等），
+缓存键由规范化后的用户问题、模型标识符、提示词版本、调用来源（普通聊天/智能联网搜索）
+和输出方式（流式/非流式）组成，不同来源和输出方式的数据格式不同，分别缓存。
+
+流式回答按数据块原样缓存，命中时按相同的数据块格式重放，前端的显示效果与实际调用模型时相同。
+调用出错的回答不会被缓存：非流式调用出错时返回 ErrorResponse，流式调用出错时输出错误数据块。
+默认不启用，需要设置 ANSWER_CACHE_ENABLED=true。
+"""
+
+import os
+import json
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+from cache_store import TTLCache, normalize_query
+from log_config import get_logger
+
+# 加载环境变量
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# 进程内共享的回答缓存
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class ErrorResponse(str):
+    """非流式调用大模型出错时返回的错误消息，可以像普通字符串一样使用，但不会被缓存"""
+
+
+def is_enabled():
+    """是否启用回答缓存，默认不启用"""
+    return os.getenv('ANSWER_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+
+def get_cache():
+    """
+    获取进程内共享的回答缓存
+
+    Returns:
+        TTLCache: 回答缓存
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TTLCache(
+                    'answer',
+                    max_entries=int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '2000')),
+                    max_bytes=int(os.getenv('ANSWER_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+                )
+    return _cache
+
+
+def get_prompt_version(system_prompt):
+    """
+    计算提示词版本：系统提示词内容的摘要
+
+    提示词修改后（包括提示词中的当前日期变化）旧的回答不再命中。
+
+    Args:
+        system_prompt: 系统提示词
+
+    Returns:
+        str: 提示词版本
+    """
+    return hashlib.sha1(system_prompt.encode('utf-8')).hexdigest()[:12]
+
+
+def make_key(query, model_id, system_prompt, stream=False, source='search'):
+    """
+    生成缓存键
+
+    Args:
+        query: 用户问题
+        model_id: 模型标识符
+        system_prompt: 系统提示词
+        stream: 是否为流式输出
+        source: 调用来源，"search"（智能联网搜索）或 "chat"（普通聊天）
+
+    Returns:
+        str: 缓存键，未启用回答缓存时返回 None
+    """
+    if not is_enabled():
+        return None
+    return json.dumps(
+        [normalize_query(query), model_id or '', get_prompt_version(system_prompt), source,
+         'stream' if stream else 'json'],
+        ensure_ascii=False
+    )
+
+
+def get(key):
+    """
+    读取缓存的回答
+
+    Args:
+        key: 缓存键
+
+    Returns:
+        非流式回答（字符串或包含推理内容的字典），或流式回答的数据块列表，未命中时返回 None
+    """
+    if key is None:
+        return None
+    return get_cache().get(key)
+
+
+def is_error_response(response):
+    """判断非流式回答是否为调用出错时返回的错误消息（ErrorResponse）或空回答"""
+    if isinstance(response, dict):
+        response = response.get('content', '')
+    return not isinstance(response, str) or not response or isinstance(response, ErrorResponse)
+
+
+def put(key, response):
+    """
+    缓存非流式回答，错误消息不会被缓存
+
+    Args:
+        key: 缓存键
+        response: 大模型的回答
+    """
+    if key is None or is_error_response(response):
+        return
+    get_cache().set(key, response, float(os.getenv('ANSWER_CACHE_TTL', '3600')))
+
+
+def _decode(line):
+    return line.decode('utf-8') if isinstance(line, bytes) else line
+
+
+def _is_error_line(line):
+    """判断流式数据块是否为错误消息"""
+    text = line[6:] if line.startswith('data: ') else line
+    if '"error"' not in text:
+        return False
+    try:
+        data = json.loads(text.strip())
+    except ValueError:
+        return False
+    return isinstance(data, dict) and 'error' in data
+
+
+def _put_stream(key, lines):
+    if not lines or any(_is_error_line(line) for line in lines):
+        return
+    get_cache().set(key, lines, float(os.getenv('ANSWER_CACHE_TTL', '3600')))
+    logger.info("流式回答已缓存，共 %s 个数据块", len(lines))
+
+
+def record_stream(key, lines):
+    """
+    逐个传递流式回答的数据块，完整输出且没有错误时缓存所有数据块
+
+    Args:
+        key: 缓存键
+        lines: 数据块迭代器（字符串或字节）
+
+    Returns:
+        generator: 与输入相同的数据块
+    """
+    recorded = []
+    for line in lines:
+        recorded.append(_decode(line))
+        yield line
+    _put_stream(key, recorded)
+
+
+async def record_stream_async(key, lines):
+    """
+    record_stream 的异步版本
+
+    Args:
+        key: 缓存键
+        lines: 数据块异步生成器
+
+    Returns:
+        异步生成器: 与输入相同的数据块
+    """
+    recorded = []
+    async for line in lines:
+        recorded.append(_decode(line))
+        yield line
+    _put_stream(key, recorded)
+
+
+async def replay_stream_async(lines):
+    """按原样重放缓存的流式回答（异步生成器）"""
+    for line in lines:
+        yield line
+
+
+class CachedStreamResponse:
+    """带有 iter_lines 方法的流式回答，与模型调用返回的流式响应对象兼容"""
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def iter_lines(self, *args, **kwargs):
+        return iter(self.lines)
+
+    def close(self):
+        """提前停止读取（客户端断开连接）时关闭数据块生成器，生成器链随之关闭上游响应"""
+        close = getattr(self.lines, 'close', None)
+        if close is not None:
+            close()
+
+
+def get_stats():
+    """
+    获取回答缓存的统计信息
+
+    Returns:
+        dict: 命中、未命中、淘汰次数等统计信息
+    """
+    return get_cache().stats()
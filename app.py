@@ -6,8 +6,8 @@
 """
 
 import os
-import json
-from flask import Flask, request, jsonify, send_from_directory, make_response, Response
+import time
+from flask import Flask, request, jsonify, send_from_directory, make_response, Response, g
 from flask_cors import CORS
 from dotenv import load_dotenv
 
@@ -22,14 +22,61 @@ import chat_api
 # 导入智能联网搜索模块
 import chat_with_intelligent_search_new as chat_with_intelligent_search
 
+# 导入请求合并模块
+import singleflight
+
+# 导入监控指标模块
+import metrics
+
+# 导入流式输出事件模块
+import sse_events
+
+# 导入请求取消模块
+import cancellation
+from log_config import get_logger, set_request_id, get_request_id, ChunkSampler
+
 # 加载环境变量
 load_dotenv()
 
+logger = get_logger(__name__)
+
+# 逐个数据块的调试日志只记录一部分
+_chunk_sampler = ChunkSampler()
+
 app = Flask(__name__, static_folder='.')
 
 # 启用CORS
 CORS(app)
 
+@app.before_request
+def assign_request_id():
+    """为每个请求分配请求 ID（优先使用请求头 X-Request-ID），日志中带有该 ID"""
+    set_request_id(request.headers.get('X-Request-ID'))
+
+@app.before_request
+def start_request_timer():
+    """记录收到请求的时间，用于统计请求耗时和首个数据块时间"""
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def add_request_id_header(response):
+    """在响应头中返回请求 ID，便于根据请求 ID 查找日志"""
+    response.headers['X-Request-ID'] = get_request_id()
+    return response
+
+@app.after_request
+def record_request_latency(response):
+    """在响应关闭时（流式响应在输出结束后）记录请求耗时"""
+    start = g.get('request_start')
+    if start is not None:
+        labels = {
+            'route': request.url_rule.rule if request.url_rule else 'unmatched',
+            'method': request.method,
+            'status': str(response.status_code)
+        }
+        response.call_on_close(lambda: metrics.REQUEST_LATENCY.observe(time.perf_counter() - start, **labels))
+    return response
+
 @app.route('/')
 def index():
     """提供首页，直接返回聊天页面"""
@@ -60,66 +107,31 @@ def chat():
         return jsonify({'error': '查询不能为空'}), 400
 
     try:
-        print(f'发送普通聊天请求: {query}, 模型: {model_id or "默认"}, 流式: {stream}')
+        logger.info("发送普通聊天请求: %s, 模型: %s, 流式: %s", query, model_id or '默认', stream)
 
         # 调用聊天API
         if stream:
             # 流式输出模式
             def generate():
-                print(f"\n>>> 开始普通聊天流式输出处理")
+                logger.info("开始普通聊天流式输出处理")
                 response = chat_api.chat(query, model_id, stream=True)
 
                 # 首先发送一个特殊的消息，表示流式输出开始
-                yield f"data: {{\"role\": \"assistant\", \"content\": \"\"}}\n\n"
-
-                # 恢复原始代码
-                for chunk in response.iter_lines():
-                    if chunk:
-                        # 如果 chunk 是字节对象，则解码，否则直接使用
-                        chunk_text = chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
-
-                        # 打印调试信息
-                        print(f">>> 原始数据块: {chunk_text}")
-
-                        # 尝试解析原始数据块，看是否已经是JSON
-                        try:
-                            # 如果数据块以 'data: ' 开头，则移除这个前缀
-                            json_text = chunk_text.replace('data: ', '', 1) if chunk_text.startswith('data: ') else chunk_text
-                            json_data = json.loads(json_text)
-
-                            # 如果已经是JSON且包含choices/delta/content，直接转发
-                            if 'choices' in json_data and len(json_data['choices']) > 0 and 'delta' in json_data['choices'][0] and 'content' in json_data['choices'][0]['delta']:
-                                content = json_data['choices'][0]['delta']['content']
-                                if content:
-                                    # 创建前端期望的格式
-                                    frontend_data = {
-                                        "content": content,
-                                        "role": "assistant"
-                                    }
-                                    yield f"data: {json.dumps(frontend_data)}\n\n"
-                                continue
-                        except json.JSONDecodeError:
-                            # 不是JSON，或格式不符，包装成标准格式
-                            pass
-
-                        # 如果不是特殊格式，将原始文本包装成前端期望的JSON格式
-                        if chunk_text.startswith('data: '):
-                            # 如果已经是 SSE 格式，直接转发
-                            yield chunk_text + "\n"
-                        else:
-                            # 否则包装成前端期望的JSON格式
-                            frontend_data = {
-                                "content": chunk_text,
-                                "role": "assistant"
-                            }
-                            yield f"data: {json.dumps(frontend_data)}\n\n"
-
-                # 发送结束消息 - 使用两种格式的结束消息，确保前端能正确处理
-                yield f"data: {{\"done\": true}}\n\n"
-                yield f"data: [DONE]\n\n"
-                print(f">>> 普通聊天流式输出完成")
-
-            return Response(generate(), content_type='text/event-stream')
+                yield sse_events.ROLE_FRAME
+
+                # chat_api 已经将模型输出转换为前端格式的数据块（包括搜索结果信息和结束标记），直接转发
+                try:
+                    for line in response.iter_lines():
+                        line_str = to_sse_line(line)
+                        if line_str:
+                            yield line_str
+                finally:
+                    # 客户端断开连接时服务器关闭生成器，同时关闭上游的流式响应
+                    response.close()
+
+            # 短时间内连续到达的内容数据块合并后写出
+            frames = sse_events.batch_frames(generate(), *sse_events.batch_settings('chat'))
+            return Response(metrics.track_stream(frames, '/api/chat', g.request_start), content_type='text/event-stream')
         else:
             # 非流式模式
             result = chat_api.chat(query, model_id)
@@ -133,7 +145,8 @@ def chat():
 
     except Exception as e:
         # 记录错误
-        print(f'聊天API错误: {str(e)}')
+        logger.exception("聊天API错误: %s", e)
+        metrics.record_error('request', type(e).__name__)
 
         # 返回错误信息
         error_response = {
@@ -143,13 +156,21 @@ def chat():
 
         return jsonify(error_response), 500
 
-@app.route('/api/chat_with_search', methods=['POST'])
-def chat_with_search():
-    """联网搜索聊天API端点"""
-    # 获取请求数据
-    data = request.json
+# 联网搜索聊天支持的搜索引擎
+VALID_ENGINES = ['search_std', 'bochaai', 'searxng', 'federated']
+
+def parse_chat_with_search_request(data):
+    """
+    解析并验证联网搜索聊天请求参数（同步和异步的联网搜索聊天端点共用）
+
+    Args:
+        data: 请求的JSON数据
+
+    Returns:
+        tuple: (请求参数字典, 错误信息)，验证失败时请求参数为 None
+    """
     if not data or 'query' not in data:
-        return jsonify({'error': '缺少必要的查询参数'}), 400
+        return None, '缺少必要的查询参数'
 
     query = data['query']
     engine = data.get('engine', 'search_std')  # 默认使用智谱基础搜索
@@ -157,6 +178,7 @@ def chat_with_search():
     model_id = data.get('model_id')  # 可选参数，指定使用的模型
     stream = data.get('stream', False)  # 是否使用流式输出
     skip_analysis = data.get('skip_analysis', False)  # 是否跳过分析步骤，直接搜索
+    speculative = data.get('speculative_search')  # 是否启用推测搜索，未指定时使用环境变量配置
 
     # SearXNG特殊参数，从环境变量中读取默认值
     searxng_engines = data.get('searxng_engines', os.getenv('SEARXNG_DEFAULT_ENGINES', 'bing,baidu,360search,quark,sogou'))
@@ -165,84 +187,138 @@ def chat_with_search():
     searxng_time_range = data.get('searxng_time_range', '')
 
     if not query.strip():
-        return jsonify({'error': '查询不能为空'}), 400
+        return None, '查询不能为空'
 
     # 验证搜索引擎
-    valid_engines = ['search_std', 'bochaai', 'searxng']
-    if engine not in valid_engines:
-        return jsonify({'error': f'无效的搜索引擎: {engine}'}), 400
+    if engine not in VALID_ENGINES:
+        return None, f'无效的搜索引擎: {engine}'
+
+    # 准备搜索参数
+    search_params = {}
+
+    # 如果是SearXNG搜索引擎（或包含SearXNG的联合搜索），添加特殊参数
+    if engine in ('searxng', 'federated'):
+        if searxng_engines:
+            search_params['engines'] = searxng_engines
+        search_params['language'] = searxng_language
+        search_params['safesearch'] = int(searxng_safesearch)
+        if searxng_time_range:
+            search_params['time_range'] = searxng_time_range
+
+    return {
+        'query': query,
+        'engine': engine,
+        'count': count,
+        'model_id': model_id,
+        'stream': stream,
+        'skip_analysis': skip_analysis,
+        'speculative': speculative,
+        'search_params': search_params
+    }, None
+
+def to_sse_line(line):
+    """
+    将流式输出的数据块转换为转发给前端的数据块
+
+    流水线输出的数据块（见 sse_events）已经是以空行结尾的完整 SSE 数据块，不做任何处理直接转发；
+    其他数据块（如之前版本写入回答缓存的数据行）补充 'data: ' 前缀和结尾的空行。
+
+    Args:
+        line: 数据块（字符串或字节）
+
+    Returns:
+        str: 以 'data: ' 开头、以空行结尾的数据块，空行返回 None
+    """
+    if not line:
+        return None
+
+    # 记录调试信息（采样）
+    if _chunk_sampler.should_log(logger):
+        logger.debug("转发数据块: %s", line)
+
+    # 已经是完整数据块时直接转发
+    if isinstance(line, str) and line.endswith('\n\n'):
+        return line
+
+    # 如果 line 是字节对象，则解码，否则直接使用
+    if isinstance(line, bytes):
+        line_str = line.decode('utf-8')
+    else:
+        line_str = line
+    if not line_str.strip():
+        return None
+
+    # 确保数据块以 'data: ' 开头、以空行结尾
+    if not line_str.startswith('data: '):
+        line_str = f"data: {line_str}"
+    return line_str.rstrip('\n') + '\n\n'
 
-    try:
-        print(f'发送联网搜索聊天请求: {query}, 搜索引擎: {engine}, 结果数量: {count}, 模型: {model_id or "默认"}, 流式: {stream}')
-
-        # 准备搜索参数
-        search_params = {}
-
-        # 如果是SearXNG搜索引擎，添加特殊参数
-        if engine == 'searxng':
-            if searxng_engines:
-                search_params['engines'] = searxng_engines
-            search_params['language'] = searxng_language
-            search_params['safesearch'] = int(searxng_safesearch)
-            if searxng_time_range:
-                search_params['time_range'] = searxng_time_range
+@app.route('/api/chat_with_search', methods=['POST'])
+def chat_with_search():
+    """联网搜索聊天API端点"""
+    # 获取并验证请求数据
+    params, error = parse_chat_with_search_request(request.json)
+    if error:
+        return jsonify({'error': error}), 400
+
+    query = params['query']
+    engine = params['engine']
+    count = params['count']
+    model_id = params['model_id']
+    stream = params['stream']
+    skip_analysis = params['skip_analysis']
+    speculative = params['speculative']
+    search_params = params['search_params']
+
+    # 相同的并发请求（规范化后的问题、搜索引擎、结果数量、模型和搜索参数相同）只执行一次
+    flight_key = singleflight.make_key(query, engine, count, model_id, skip_analysis, speculative, **search_params)
 
-        print(f'搜索参数: {search_params}')
+    try:
+        logger.info("发送联网搜索聊天请求: %s, 搜索引擎: %s, 结果数量: %s, 模型: %s, 流式: %s, 搜索参数: %s",
+                    query, engine, count, model_id or '默认', stream, search_params)
 
         # 调用智能联网搜索聊天API
         if stream:
             # 流式输出模式
             def generate():
-                print(f"\n>>> 开始流式输出处理")
-                response = chat_with_intelligent_search.chat_with_intelligent_search(query, engine, count, model_id, stream=True, skip_analysis=skip_analysis, **search_params)
-
-                # 不再首先发送空消息，让 chat_with_intelligent_search 控制初始块
+                logger.info("开始流式输出处理")
+                response = None
 
                 # 直接迭代并传递来自 chat_with_intelligent_search 的已格式化块
                 try:
-                    # 重新加入初始空消息，前端可能需要它来初始化
-                    yield f"data: {{\"role\": \"assistant\", \"content\": \"\"}}\n\n"
-                    for line in response.iter_lines():
-                        if line:
-                            # print(f">>> generate: 转发块: {line.strip()}") # 调试时取消注释
-                            # 如果 line 是字节对象，则解码，否则直接使用
-                            if isinstance(line, bytes):
-                                line_str = line.decode('utf-8')
-                            else:
-                                line_str = line
-
-                            # 打印调试信息
-                            print(f">>> 转发数据块: {line_str}")
-
-                            # 确保数据块以 'data: ' 开头
-                            if not line_str.startswith('data: '):
-                                line_str = f"data: {line_str}"
-                                print(f">>> 添加 'data: ' 前缀: {line_str}")
+                    response = chat_with_intelligent_search.chat_with_intelligent_search(query, engine, count, model_id, stream=True, skip_analysis=skip_analysis, speculative=speculative, **search_params)
 
+                    # 初始空消息，前端需要它来初始化
+                    yield sse_events.ROLE_FRAME
+                    for line in response.iter_lines():
+                        line_str = to_sse_line(line)
+                        if line_str:
                             yield line_str
-                    print(f">>> 流式输出转发完成")
+                    logger.info("流式输出转发完成")
+                except cancellation.Cancelled:
+                    # 所有订阅者都已断开连接，不需要发送错误消息
+                    raise
                 except Exception as e:
-                    print(f">>> 在 generate 函数中处理流时出错: {e}")
-                    # 尝试发送一个错误块给前端
-                    try:
-                        error_data = {
-                            "error": f"处理响应流时发生服务器错误: {e}"
-                        }
-                        yield f"data: {json.dumps(error_data)}\n\n"
-                        # 确保在错误后也发送 done 标记
-                        yield f"data: {{\"done\": true}}\n\n"
-                    except Exception as final_e:
-                        print(f">>> 发送最终错误块失败: {final_e}")
-                        # 即使发送错误块失败，也尝试发送 done 标记
-                        try:
-                            yield f"data: {{\"done\": true}}\n\n"
-                        except Exception as done_e:
-                            print(f">>> 发送最终 done 标记失败: {done_e}")
-
-            return Response(generate(), content_type='text/event-stream')
+                    logger.exception("在 generate 函数中处理流时出错: %s", e)
+                    metrics.record_error('stream', type(e).__name__)
+                    # 发送错误消息和结束标记给前端
+                    yield sse_events.stream_error_frames(e)
+                finally:
+                    # 客户端断开连接时服务器关闭生成器，同时关闭上游的流式响应
+                    if response is not None:
+                        response.close()
+
+            events = singleflight.stream(flight_key, generate) if singleflight.is_enabled() else generate()
+            # 短时间内连续到达的内容数据块合并后写出
+            events = sse_events.batch_frames(events, *sse_events.batch_settings('chat_with_search'))
+            return Response(metrics.track_stream(events, '/api/chat_with_search', g.request_start),
+                            content_type='text/event-stream')
         else:
             # 非流式模式
-            result = chat_with_intelligent_search.chat_with_intelligent_search(query, engine, count, model_id, skip_analysis=skip_analysis, **search_params)
+            def execute():
+                return chat_with_intelligent_search.chat_with_intelligent_search(query, engine, count, model_id, skip_analysis=skip_analysis, speculative=speculative, **search_params)
+
+            result = singleflight.do(flight_key, execute) if singleflight.is_enabled() else execute()
 
             # 创建响应并添加缓存控制头
             response = make_response(jsonify(result))
@@ -253,7 +329,8 @@ def chat_with_search():
 
     except Exception as e:
         # 记录错误
-        print(f'联网搜索聊天API错误: {str(e)}')
+        logger.exception("联网搜索聊天API错误: %s", e)
+        metrics.record_error('request', type(e).__name__)
 
         # 返回错误信息
         error_response = {
@@ -281,9 +358,15 @@ def get_settings():
         ]
     })
 
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus 格式的监控指标"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 if __name__ == '__main__':
     # 获取端口，默认为5000
     port = int(os.getenv('PORT', 5000))
 
-    # 启动服务器
-    app.run(host='0.0.0.0', port=port, debug=True)
+    # 开发服务器，仅用于本地调试；生产环境请使用 gunicorn -c gunicorn.conf.py app:app
+    debug = os.getenv('FLASK_DEBUG', 'false').lower() in ('1', 'true', 'yes')
+    app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
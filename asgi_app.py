@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+搜索引擎 - ASGI 入口
+
+/api/chat_with_search 由异步流水线（chat_with_intelligent_search_async）处理，
+等待搜索结果和大模型输出时不占用线程；其他路由（页面、静态文件、普通聊天、设置）
+通过 WsgiToAsgi 交给 Flask 应用处理（包括 /metrics 监控指标）。
+
+启动方式：
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000 --workers 4
+或使用 gunicorn 管理工作进程：
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi_app:app
+"""
+
+import json
+import time
+import asyncio
+from asgiref.wsgi import WsgiToAsgi
+
+import deepseek_api
+import singleflight
+import metrics
+import sse_events
+from search_engines import async_http
+from app import app as flask_app, parse_chat_with_search_request, to_sse_line
+import chat_with_intelligent_search_async
+from log_config import get_logger, set_request_id
+
+logger = get_logger(__name__)
+
+# 其他路由交给 Flask 应用处理
+flask_asgi_app = WsgiToAsgi(flask_app)
+
+# 联网搜索聊天响应的缓存控制头，与 Flask 端点一致
+NO_CACHE_HEADERS = [
+    (b'cache-control', b'no-store, no-cache, must-revalidate, max-age=0'),
+    (b'pragma', b'no-cache'),
+    (b'expires', b'0')
+]
+
+
+async def read_json_body(receive):
+    """读取并解析请求体中的JSON数据，解析失败时返回 None"""
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+    try:
+        return json.loads(body or b'null')
+    except ValueError:
+        return None
+
+
+async def send_json(send, data, status=200, headers=()):
+    """发送JSON响应"""
+    body = json.dumps(data).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('ascii')),
+            *headers
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def generate_events(params):
+    """
+    执行异步流水线并逐个生成 SSE 数据块，输出格式与 Flask 端点相同
+
+    Args:
+        params: parse_chat_with_search_request 返回的请求参数
+
+    Returns:
+        异步生成器: SSE 数据块
+    """
+    try:
+        lines = await chat_with_intelligent_search_async.chat_with_intelligent_search_async(
+            params['query'], params['engine'], params['count'], params['model_id'],
+            stream=True,
+            skip_analysis=params['skip_analysis'],
+            speculative=params['speculative'],
+            **params['search_params']
+        )
+
+        # 初始空消息，前端需要它来初始化
+        yield sse_events.ROLE_FRAME
+        async for line in lines:
+            line_str = to_sse_line(line)
+            if line_str:
+                yield line_str
+        logger.info("异步流式输出转发完成")
+    except Exception as e:
+        logger.exception("转发异步流式输出时出错: %s", e)
+        metrics.record_error('stream', type(e).__name__)
+        yield sse_events.stream_error_frames(e)
+
+
+async def wait_for_disconnect(receive):
+    """等待客户端断开连接（请求体已经读取完毕，之后只会收到 http.disconnect 消息）"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _send_events(send, events):
+    async for event in events:
+        await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def send_event_stream(send, events, headers=(), receive=None):
+    """
+    发送 SSE 流式响应
+
+    客户端在输出结束前断开连接时取消输出：取消会传递到正在等待的搜索、大模型调用和上游流式响应，
+    不再继续占用连接和消耗 token。
+
+    Args:
+        send: ASGI send 函数
+        events: 生成 SSE 数据块的异步生成器
+        headers: 其他响应头
+        receive: ASGI receive 函数，用于发现客户端断开连接，为 None 时不检测
+
+    Returns:
+        bool: 是否完整发送，客户端断开连接时返回 False
+    """
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream; charset=utf-8'), *headers]
+    })
+    if receive is None:
+        await _send_events(send, events)
+        return True
+
+    sending = asyncio.ensure_future(_send_events(send, events))
+    disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait((sending, disconnect), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        if not sending.done():
+            sending.cancel()
+    try:
+        await sending
+    except asyncio.CancelledError:
+        logger.info("客户端已断开连接，停止流式输出")
+        return False
+    return True
+
+
+async def chat_with_search(scope, receive, send):
+    """异步联网搜索聊天API端点，请求耗时在响应发送完成后记录"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        status = await _chat_with_search(scope, receive, send, start)
+    finally:
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - start, route='/api/chat_with_search', method='POST',
+                                        status=str(status))
+
+
+async def _chat_with_search(scope, receive, send, start):
+    """
+    处理异步联网搜索聊天请求
+
+    Returns:
+        int: 响应状态码
+    """
+    # 为请求分配请求 ID（优先使用请求头 X-Request-ID），日志和响应头中带有该 ID
+    request_headers = dict(scope.get('headers') or [])
+    request_id = set_request_id(request_headers.get(b'x-request-id', b'').decode('latin-1'))
+    id_headers = [(b'x-request-id', request_id.encode('latin-1'))]
+
+    params, error = parse_chat_with_search_request(await read_json_body(receive))
+    if error:
+        await send_json(send, {'error': error}, status=400, headers=id_headers)
+        return 400
+
+    logger.info("发送异步联网搜索聊天请求: %s, 搜索引擎: %s, 结果数量: %s, 模型: %s, 流式: %s, 搜索参数: %s",
+                params['query'], params['engine'], params['count'], params['model_id'] or '默认', params['stream'],
+                params['search_params'])
+
+    # 相同的并发请求（规范化后的问题、搜索引擎、结果数量、模型和搜索参数相同）只执行一次
+    flight_key = singleflight.make_key(
+        params['query'], params['engine'], params['count'], params['model_id'],
+        params['skip_analysis'], params['speculative'], **params['search_params']
+    )
+
+    if params['stream']:
+        if singleflight.is_enabled():
+            events = singleflight.stream_async(flight_key, lambda: generate_events(params))
+        else:
+            events = generate_events(params)
+        events = sse_events.batch_frames_async(events, *sse_events.batch_settings('chat_with_search'))
+        await send_event_stream(send, metrics.track_stream_async(events, '/api/chat_with_search', start), id_headers,
+                                receive)
+        return 200
+
+    def execute():
+        return chat_with_intelligent_search_async.chat_with_intelligent_search_async(
+            params['query'], params['engine'], params['count'], params['model_id'],
+            skip_analysis=params['skip_analysis'],
+            speculative=params['speculative'],
+            **params['search_params']
+        )
+
+    try:
+        if singleflight.is_enabled():
+            result = await singleflight.do_async(flight_key, execute)
+        else:
+            result = await execute()
+    except Exception as e:
+        logger.exception("异步联网搜索聊天API错误: %s", e)
+        metrics.record_error('request', type(e).__name__)
+        await send_json(send, {'error': '联网搜索聊天请求失败', 'message': str(e)}, status=500, headers=id_headers)
+        return 500
+
+    await send_json(send, result, headers=NO_CACHE_HEADERS + id_headers)
+    return 200
+
+
+async def lifespan(receive, send):
+    """处理服务启动和关闭事件：关闭时释放异步连接池"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_http.close_clients()
+            await deepseek_api.close_async_clients()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI 应用"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/api/chat_with_search' and scope['method'] == 'POST':
+        await chat_with_search(scope, receive, send)
+    else:
+        await flask_asgi_app(scope, receive, send)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+format_deepseek_output 基准测试
+
+生成 50-200 KB 的 DeepSeek Reasoner 风格长回答（多级标题、带引用的编号列表、嵌套列表、表格和正文），
+分别使用当前实现和参考实现（benchmarks/format_deepseek_reference.py）格式化，
+校验两者输出相同，并输出耗时和吞吐量。
+
+运行方式：
+    python benchmarks/bench_format_deepseek.py
+    python benchmarks/bench_format_deepseek.py --sizes 50 100 200 --repeat 5
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+# 从仓库根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from format_deepseek_output import format_deepseek_output, StreamingFormatter
+from benchmarks import format_deepseek_reference
+
+SECTION_NUMBERS = '一二三四五六七八九十'
+
+
+def generate_reasoner_output(size_kb, seed=0):
+    """
+    生成指定大小的 DeepSeek Reasoner 风格回答
+
+    Args:
+        size_kb: 目标大小（KB，按 UTF-8 编码计算）
+        seed: 随机数种子
+
+    Returns:
+        str: 生成的回答
+    """
+    rng = random.Random(seed)
+    target = size_kb * 1024
+    parts = []
+    size = 0
+    section = 0
+    while size < target:
+        number = SECTION_NUMBERS[section % len(SECTION_NUMBERS)]
+        section += 1
+        block = [f"#### {number}、第{section}部分的标题 这一部分概述了相关背景 (来源[{rng.randint(1, 9)}])：\n"]
+        for item in range(rng.randint(3, 8)):
+            block.append(f"1. 要点{item + 1}: 这是一段较长的说明文字，介绍具体的事实、数据和分析过程，"
+                         f"并引用多个来源进行佐证 (来源[{rng.randint(1, 9)}][{rng.randint(1, 9)}])\n")
+            for sub in range(rng.randint(0, 3)):
+                block.append(f"   {sub + 1}. 子项说明：补充细节和例子，例如 2024 年的统计数据 （来源[{rng.randint(1, 9)}]）\n")
+            block.append("\n")
+        if rng.random() < 0.3:
+            block.append("| 类型 | 代表机构 | 核心职能 | |------|------|------| "
+                         "| 研究型大学 | 示例大学 | 科研与教学 | | 应用型院校 | 示例学院 | 职业培训 |\n\n")
+        block.append("• 总结：这一部分的结论和需要注意的问题。\n\n")
+        text = ''.join(block)
+        parts.append(text)
+        size += len(text.encode('utf-8'))
+    return ''.join(parts)
+
+
+def best_time(fn, content, repeat):
+    """多次运行取最短耗时（秒）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def format_streaming(content, chunk_size=16):
+    """按固定大小的数据块输入增量格式化器，模拟流式输出"""
+    formatter = StreamingFormatter()
+    output = [formatter.feed(content[i:i + chunk_size]) for i in range(0, len(content), chunk_size)]
+    output.append(formatter.flush())
+    return ''.join(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='format_deepseek_output 基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 100, 200], help='回答大小（KB）')
+    parser.add_argument('--repeat', type=int, default=3, help='每个实现的运行次数，取最短耗时')
+    args = parser.parse_args()
+
+    print(f"{'大小':>8} {'参考实现(ms)':>14} {'当前实现(ms)':>14} {'流式(ms)':>10} "
+          f"{'参考(MB/s)':>12} {'当前(MB/s)':>12} {'加速比':>8}")
+    for size_kb in args.sizes:
+        content = generate_reasoner_output(size_kb)
+        megabytes = len(content.encode('utf-8')) / (1024 * 1024)
+
+        expected = format_deepseek_reference.format_deepseek_output(content)
+        if format_deepseek_output(content) != expected or format_streaming(content) != expected:
+            print(f"{size_kb}KB: 当前实现与参考实现的输出不同")
+            sys.exit(1)
+
+        reference = best_time(format_deepseek_reference.format_deepseek_output, content, args.repeat)
+        current = best_time(format_deepseek_output, content, args.repeat)
+        streaming = best_time(format_streaming, content, args.repeat)
+        print(f"{size_kb:>6}KB {reference * 1000:>14.1f} {current * 1000:>14.1f} {streaming * 1000:>10.1f} "
+              f"{megabytes / reference:>12.2f} {megabytes / current:>12.2f} {reference / current:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
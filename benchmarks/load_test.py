@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+联网搜索聊天接口压测工具
+
+以固定并发数持续向 /api/chat_with_search 发送请求（问题、搜索引擎和流式输出比例可配置），
+统计吞吐量、错误数，以及总耗时和首个 token 时间（TTFT）的 p50/p95/p99。
+TTFT 为发送请求到收到第一个带有回答内容的数据块的时间，只对流式请求统计。
+
+通常与 benchmarks/mock_upstreams.py 配合使用，不消耗付费额度：
+    python benchmarks/mock_upstreams.py --port 18080 &
+    eval "$(python benchmarks/mock_upstreams.py --port 18080 --print-env)" && python app.py
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --concurrency 20 --duration 60
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+
+import httpx
+
+# 真实场景的用户问题（包含时效性问题、开放性问题和准确答案问题）
+QUERIES = [
+    "最近一周人工智能领域有哪些重要新闻",
+    "2024年新能源汽车销量排名",
+    "如何评价最新发布的大语言模型",
+    "北京今天的天气怎么样",
+    "量子计算目前的发展现状和主要挑战",
+    "中国有哪些著名的人工智能研究机构",
+    "Python 3.13 有哪些新特性",
+    "全球气候变化对农业生产的影响",
+    "最新的半导体出口管制政策有哪些变化",
+    "如何准备研究生入学考试",
+    "今年诺贝尔物理学奖颁给了谁",
+    "电动汽车电池回收技术的最新进展"
+]
+
+
+def percentile(values, pct):
+    """
+    计算百分位数（线性插值）
+
+    Args:
+        values: 数值列表
+        pct: 百分位（0-100）
+
+    Returns:
+        float: 百分位数，列表为空时返回 None
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * pct / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (pos - lower)
+
+
+def summarize(values):
+    """统计耗时列表的 p50/p95/p99、平均值和最大值（毫秒）"""
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 1),
+        'p50_ms': round(percentile(values, 50) * 1000, 1),
+        'p95_ms': round(percentile(values, 95) * 1000, 1),
+        'p99_ms': round(percentile(values, 99) * 1000, 1),
+        'max_ms': round(max(values) * 1000, 1)
+    }
+
+
+def is_content_frame(payload):
+    """判断流式数据块是否带有回答内容"""
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return False
+    if not isinstance(data, dict):
+        return False
+    for choice in data.get('choices') or []:
+        delta = choice.get('delta') or choice.get('message') or {}
+        if delta.get('content') or delta.get('reasoning_content'):
+            return True
+    return bool(data.get('content'))
+
+
+class LoadTest:
+    """压测运行器：记录每个请求的结果"""
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.latencies = []
+        self.ttfts = []
+        self.errors = {}
+        self.completed = 0
+        self.bytes_received = 0
+
+    def next_request(self):
+        """生成下一个请求的参数"""
+        return {
+            'query': self.random.choice(QUERIES),
+            'engine': self.random.choice(self.args.engines),
+            'stream': self.random.random() < self.args.stream_ratio,
+            'model_id': self.args.model_id
+        }
+
+    def record_error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    async def send(self, client, body):
+        """发送一个请求并记录耗时、TTFT 和错误"""
+        url = self.args.url.rstrip('/') + '/api/chat_with_search'
+        start = time.perf_counter()
+        ttft = None
+        try:
+            async with client.stream('POST', url, json=body) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    self.record_error(f'HTTP {response.status_code}')
+                    return
+                if body['stream']:
+                    # 之前版本转发的智谱AI数据块之间没有空行分隔，因此按 'data: ' 前缀拆分，不按行读取
+                    buffer = ''
+                    async for text in response.aiter_text():
+                        self.bytes_received += len(text.encode('utf-8'))
+                        if ttft is not None:
+                            continue
+                        buffer += text
+                        payloads = buffer.split('data: ')
+                        buffer = payloads.pop()
+                        if any(is_content_frame(payload) for payload in payloads) or is_content_frame(buffer):
+                            ttft = time.perf_counter() - start
+                else:
+                    content = await response.aread()
+                    self.bytes_received += len(content)
+                    if 'error' in json.loads(content):
+                        self.record_error('error_response')
+                        return
+        except httpx.HTTPError as e:
+            self.record_error(type(e).__name__)
+            return
+
+        self.latencies.append(time.perf_counter() - start)
+        if ttft is not None:
+            self.ttfts.append(ttft)
+        self.completed += 1
+
+    async def worker(self, client, deadline, counter):
+        while time.perf_counter() < deadline:
+            if self.args.requests and next(counter) >= self.args.requests:
+                return
+            await self.send(client, self.next_request())
+
+    async def run(self):
+        """
+        运行压测
+
+        Returns:
+            dict: 压测结果
+        """
+        limits = httpx.Limits(max_connections=self.args.concurrency, max_keepalive_connections=self.args.concurrency)
+        timeout = httpx.Timeout(self.args.timeout, connect=5)
+        counter = itertools.count()
+        async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+            start = time.perf_counter()
+            deadline = start + self.args.duration if self.args.duration else float('inf')
+            await asyncio.gather(*(self.worker(client, deadline, counter) for _ in range(self.args.concurrency)))
+            elapsed = time.perf_counter() - start
+
+        failed = sum(self.errors.values())
+        return {
+            'url': self.args.url,
+            'concurrency': self.args.concurrency,
+            'duration_s': round(elapsed, 2),
+            'completed': self.completed,
+            'failed': failed,
+            'errors': self.errors,
+            'throughput_rps': round(self.completed / elapsed, 2) if elapsed else 0,
+            'received_kb': round(self.bytes_received / 1024, 1),
+            'latency': summarize(self.latencies),
+            'ttft': summarize(self.ttfts)
+        }
+
+
+def print_report(result):
+    print(f"URL: {result['url']}  并发数: {result['concurrency']}  耗时: {result['duration_s']}s")
+    print(f"完成: {result['completed']}  失败: {result['failed']}  吞吐量: {result['throughput_rps']} 请求/秒  "
+          f"接收: {result['received_kb']} KB")
+    if result['errors']:
+        print('错误: ' + ', '.join(f'{kind}={count}' for kind, count in result['errors'].items()))
+    print(f"{'指标':<8}{'次数':>8}{'平均':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'最大':>10}")
+    for name in ('latency', 'ttft'):
+        stats = result[name]
+        if not stats['count']:
+            print(f"{name:<8}{0:>8}")
+            continue
+        print(f"{name:<8}{stats['count']:>8}{stats['mean_ms']:>10}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='联网搜索聊天接口压测工具')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='服务地址')
+    parser.add_argument('--concurrency', type=int, default=10, help='并发请求数')
+    parser.add_argument('--duration', type=float, default=30, help='压测时长（秒），为 0 时只按 --requests 限制')
+    parser.add_argument('--requests', type=int, default=0, help='请求总数，为 0 时不限制')
+    parser.add_argument('--engines', nargs='+', default=['search_std'],
+                        choices=['search_std', 'bochaai', 'searxng', 'federated'], help='随机使用的搜索引擎')
+    parser.add_argument('--stream-ratio', type=float, default=1.0, help='流式请求的比例')
+    parser.add_argument('--model-id', default=None, help='使用的模型')
+    parser.add_argument('--timeout', type=float, default=120, help='单个请求的超时时间（秒）')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    parser.add_argument('--output', help='将结果保存为 JSON 文件')
+    args = parser.parse_args()
+
+    if not args.duration and not args.requests:
+        parser.error('--duration 和 --requests 不能同时为 0')
+
+    result = asyncio.run(LoadTest(args).run())
+    print_report(result)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 1 if result['failed'] and not result['completed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
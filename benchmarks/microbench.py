@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求热点路径的微基准测试
+
+对每个请求都会执行的 CPU 密集型代码进行基准测试，输入为 benchmarks/corpus/ 中录制的上游响应
+（由 benchmarks/mock_upstreams.py 生成，格式与真实接口相同）：
+
+- 搜索结果转换：searxng.convert_response、bochaai.convert_response
+- 搜索结果去重和格式化：result_dedup.deduplicate_results、format_search_results
+- 查询分析结果解析：parse_analysis_response 的 JSON 提取和文本回退
+- DeepSeek 输出格式化：format_deepseek_output、StreamingFormatter
+- 流式输出转发：app.to_sse_line、chat_api.chat 的数据块转换、deepseek_api.format_stream_for_flask，
+  以及从上游数据行（响应块）到转发给前端的数据块的完整流水线和数据块合并（sse_events）
+
+每个基准先自动确定循环次数（每个样本至少运行 --min-time 秒），再采集 --repeat 个样本，
+输出中位数、最小值、四分位距和每个单位（搜索结果、token 等）的耗时，并使用 tracemalloc 统计单次执行的内存峰值。
+结果可以保存为 JSON 文件，使用 --compare 与之前的结果对比，中位数变慢超过阈值且超出噪声范围时标记为回归。
+设置了单位耗时上限的基准测试（如每个搜索结果的去重耗时）超出上限时同样标记为回归。
+
+运行方式：
+    python benchmarks/microbench.py --output baseline.json
+    python benchmarks/microbench.py --compare baseline.json --threshold 0.1
+    python benchmarks/microbench.py --filter sse --repeat 20
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tracemalloc
+
+# 从仓库根目录导入被测模块；关闭缓存，避免被测函数读写缓存
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['ANALYSIS_CACHE_ENABLED'] = 'false'
+os.environ['ANSWER_CACHE_ENABLED'] = 'false'
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+QUERY = '量子计算目前的发展现状和主要挑战'
+
+# 已注册的基准测试：(名称, 准备函数, 单位耗时上限)
+BENCHMARKS = []
+
+
+def benchmark(name, max_per_unit=None):
+    """
+    装饰器：注册一个基准测试
+
+    被装饰的准备函数返回 (被测函数, 单位数量, 单位名称)，被测函数不接受参数，
+    准备工作（加载语料、构造输入）在准备函数中完成，不计入耗时。
+
+    Args:
+        name: 基准测试名称
+        max_per_unit: 每个单位耗时中位数的上限（秒），为 None 时不检查
+    """
+    def register(setup):
+        BENCHMARKS.append((name, setup, max_per_unit))
+        return setup
+    return register
+
+
+def load_corpus(name):
+    """读取 benchmarks/corpus/ 中的录制数据"""
+    with open(os.path.join(CORPUS_DIR, f'{name}.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def sse_lines(events):
+    """将录制的流式事件还原为上游返回的 SSE 数据行（字节）"""
+    return [f"data: {event if isinstance(event, str) else json.dumps(event, ensure_ascii=False)}".encode('utf-8')
+            for event in events]
+
+
+def stream_content(events):
+    """拼接录制的流式事件中的回答内容"""
+    return ''.join(event['choices'][0]['delta'].get('content') or '' for event in events if isinstance(event, dict))
+
+
+def search_items():
+    """三个搜索引擎转换后的搜索结果（联合搜索的输入）"""
+    from search_engines import searxng, bochaai
+    items = list(load_corpus('zhipu_web_search')['search_result'])
+    items += bochaai.convert_response(QUERY, load_corpus('bochaai_web_search'), summary=True)['search_result']
+    items += searxng.convert_response(searxng.create_result(QUERY), load_corpus('searxng_search'), 20)['search_result']
+    return items
+
+
+# ---- 搜索结果 ----
+
+@benchmark('searxng.convert_response')
+def bench_searxng_convert():
+    from search_engines import searxng
+    response = load_corpus('searxng_search')
+    return lambda: searxng.convert_response(searxng.create_result(QUERY), response, 20), len(response['results']), '结果'
+
+
+@benchmark('bochaai.convert_response')
+def bench_bochaai_convert():
+    from search_engines import bochaai
+    response = load_corpus('bochaai_web_search')
+    count = len(response['data']['webPages']['value'])
+    return lambda: bochaai.convert_response(QUERY, response, summary=True), count, '结果'
+
+
+# 每个结果的去重耗时应与结果数量无关（LSH 分桶只对候选结果计算相似度），上限留有机器差异的余量
+@benchmark('result_dedup.deduplicate_results', max_per_unit=300e-6)
+def bench_dedup():
+    import result_dedup
+    items = search_items()
+    return lambda: result_dedup.deduplicate_results(items), len(items), '结果'
+
+
+@benchmark('format_search_results')
+def bench_format_search_results():
+    from format_search_results_new import format_search_results
+    items = search_items()
+    return lambda: format_search_results(items, QUERY, '开放性问题'), len(items), '结果'
+
+
+@benchmark('format_search_results.budget')
+def bench_format_search_results_budget():
+    from format_search_results_new import format_search_results
+    items = search_items()
+    return lambda: format_search_results(items, QUERY, '开放性问题', token_budget=3000), len(items), '结果'
+
+
+# ---- 查询分析 ----
+
+def _analysis_benchmark(name):
+    import query_classifier
+    from chat_with_intelligent_search_new import parse_analysis_response
+    response = next(item['text'] for item in load_corpus('analysis_responses') if item['name'] == name)
+    classification = query_classifier.classify(QUERY)
+    return lambda: parse_analysis_response(QUERY, None, response, classification), 1, '次'
+
+
+@benchmark('parse_analysis_response.json')
+def bench_analysis_json():
+    return _analysis_benchmark('json')
+
+
+@benchmark('parse_analysis_response.markdown')
+def bench_analysis_markdown():
+    return _analysis_benchmark('json_in_markdown')
+
+
+@benchmark('parse_analysis_response.text_fallback')
+def bench_analysis_fallback():
+    return _analysis_benchmark('text_fallback')
+
+
+# ---- DeepSeek 输出格式化 ----
+
+@benchmark('format_deepseek_output.answer')
+def bench_format_deepseek_answer():
+    from format_deepseek_output import format_deepseek_output
+    content = stream_content(load_corpus('deepseek_reasoner_stream'))
+    return lambda: format_deepseek_output(content), len(content), '字符'
+
+
+@benchmark('format_deepseek_output.50kb')
+def bench_format_deepseek_long():
+    from format_deepseek_output import format_deepseek_output
+    from benchmarks.bench_format_deepseek import generate_reasoner_output
+    content = generate_reasoner_output(50)
+    return lambda: format_deepseek_output(content), len(content), '字符'
+
+
+@benchmark('StreamingFormatter.tokens')
+def bench_streaming_formatter():
+    from format_deepseek_output import StreamingFormatter
+    tokens = [event['choices'][0]['delta'].get('content') or '' for event in load_corpus('deepseek_reasoner_stream')
+              if isinstance(event, dict) and event['choices'][0]['delta'].get('content')]
+
+    def run():
+        formatter = StreamingFormatter()
+        for token in tokens:
+            formatter.feed(token)
+        formatter.flush()
+    return run, len(tokens), 'token'
+
+
+# ---- 流式输出转发 ----
+
+@benchmark('sse.app_to_sse_line')
+def bench_app_to_sse_line():
+    import sse_events
+    from app import to_sse_line
+    frames = list(sse_events.to_frames(sse_events.parse_lines(sse_lines(load_corpus('zhipu_chat_stream')))))
+    return lambda: [to_sse_line(frame) for frame in frames], len(frames), 'token'
+
+
+@benchmark('sse.chat_api_chat')
+def bench_chat_api_stream():
+    import chat_api
+    import sse_events
+    lines = sse_lines(load_corpus('zhipu_chat_stream'))
+
+    def run():
+        # 替换大模型调用，只测量 chat 对每个数据块的解析和转换
+        original = chat_api.call_llm_model
+        chat_api.call_llm_model = lambda *args, **kwargs: sse_events.parse_lines(iter(lines))
+        try:
+            for _ in chat_api.chat(QUERY, stream=True).iter_lines():
+                pass
+        finally:
+            chat_api.call_llm_model = original
+    return run, len(lines), 'token'
+
+
+@benchmark('sse.deepseek_format_stream')
+def bench_deepseek_format_stream():
+    import deepseek_api
+    from openai.types.chat import ChatCompletionChunk
+    chunks = [ChatCompletionChunk.model_validate(event) for event in load_corpus('deepseek_reasoner_stream')
+              if isinstance(event, dict)]
+    return lambda: list(deepseek_api.format_stream_for_flask(iter(chunks))), len(chunks), 'token'
+
+
+@benchmark('sse.pipeline_zhipu')
+def bench_pipeline_zhipu():
+    import sse_events
+    from app import to_sse_line
+    from chat_with_intelligent_search_new import stream_frames
+    lines = sse_lines(load_corpus('zhipu_chat_stream'))
+
+    def run():
+        # 智谱AI数据行 → 事件 → 数据块 → 转发，与 /api/chat_with_search 的流式输出相同
+        for frame in stream_frames(sse_events.parse_lines(iter(lines)), 'glm-4-flash'):
+            to_sse_line(frame)
+    return run, len(lines), 'token'
+
+
+@benchmark('sse.frame_batcher')
+def bench_frame_batcher():
+    import sse_events
+    frames = list(sse_events.to_frames(sse_events.parse_lines(sse_lines(load_corpus('zhipu_chat_stream')))))
+
+    def run():
+        # 每个数据块间隔 1 毫秒到达，合并窗口 20 毫秒
+        batcher = sse_events.FrameBatcher(0.02, 4096)
+        for index, frame in enumerate(frames):
+            batcher.add(frame, index * 0.001)
+        batcher.flush()
+    return run, len(frames), 'token'
+
+
+@benchmark('sse.pipeline_deepseek')
+def bench_pipeline_deepseek():
+    import deepseek_api
+    from app import to_sse_line
+    from chat_with_intelligent_search_new import stream_frames
+    from openai.types.chat import ChatCompletionChunk
+    chunks = [ChatCompletionChunk.model_validate(event) for event in load_corpus('deepseek_reasoner_stream')
+              if isinstance(event, dict)]
+
+    def run():
+        # DeepSeek 响应块 → 事件 → 增量格式化 → 数据块 → 转发
+        for frame in stream_frames(deepseek_api.stream_events(iter(chunks)), 'deepseek-reasoner'):
+            to_sse_line(frame)
+    return run, len(chunks), 'token'
+
+
+# ---- 测量 ----
+
+def _time_loops(func, loops):
+    """执行 loops 次并返回总耗时，计时期间关闭垃圾回收（与 timeit 相同）"""
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        return time.perf_counter() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def calibrate(func, min_time):
+    """确定循环次数，使每个样本至少运行 min_time 秒（同时起到预热作用）"""
+    loops = 1
+    while True:
+        elapsed = _time_loops(func, loops)
+        if elapsed >= min_time:
+            return loops
+        # 按已测得的耗时估算所需次数，至少翻倍
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9) * 1.2))
+
+
+def measure_memory(func):
+    """
+    使用 tracemalloc 统计单次执行的内存
+
+    Returns:
+        dict: peak_kb（执行期间新分配内存的峰值）和 retained_kb（执行后仍未释放的内存）
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = func()
+        after, peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+    return {'peak_kb': round((peak - before) / 1024, 1), 'retained_kb': round(max(0, after - before) / 1024, 1)}
+
+
+def run_benchmark(func, units, repeat, min_time):
+    """
+    测量一个基准测试
+
+    Returns:
+        dict: 每次执行耗时（秒）的统计信息和内存统计
+    """
+    loops = calibrate(func, min_time)
+    samples = [_time_loops(func, loops) / loops for _ in range(repeat)]
+    quartiles = statistics.quantiles(samples, n=4) if len(samples) > 1 else [samples[0]] * 3
+    median = statistics.median(samples)
+    result = {
+        'loops': loops,
+        'repeat': repeat,
+        'median': median,
+        'min': min(samples),
+        'mean': statistics.fmean(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'iqr': quartiles[2] - quartiles[0],
+        'units': units,
+        'per_unit': median / units if units else None
+    }
+    result.update(measure_memory(func))
+    return result
+
+
+def compare(results, baseline, threshold):
+    """
+    与之前的结果对比
+
+    中位数和最小值都变化超过阈值，并且中位数的变化量大于两次结果四分位距之和时，标记为回归或提升。
+    同时检查最小值可以排除机器负载波动造成的误报（最小值受其他进程干扰最少）。
+
+    Args:
+        results: 本次结果
+        baseline: 之前的结果
+        threshold: 相对变化阈值，如 0.1 表示 10%
+
+    Returns:
+        dict: {名称: {"ratio", "status"}}，status 为 regression、improvement 或 unchanged
+    """
+    comparison = {}
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        ratio = current['median'] / previous['median']
+        min_ratio = current['min'] / previous['min']
+        noise = current['iqr'] + previous['iqr']
+        change = current['median'] - previous['median']
+        if ratio > 1 + threshold and min_ratio > 1 + threshold and change > noise:
+            status = 'regression'
+        elif ratio < 1 - threshold and min_ratio < 1 - threshold and -change > noise:
+            status = 'improvement'
+        else:
+            status = 'unchanged'
+        comparison[name] = {'ratio': round(ratio, 3), 'status': status}
+    return comparison
+
+
+def format_time(seconds):
+    if seconds is None:
+        return '-'
+    if seconds >= 1e-3:
+        return f'{seconds * 1e3:.2f}ms'
+    return f'{seconds * 1e6:.1f}us'
+
+
+STATUS_LABELS = {'regression': '回归', 'improvement': '提升', 'unchanged': ''}
+
+
+def print_report(results, comparison):
+    print(f"{'基准测试':<40}{'中位数':>11}{'最小值':>11}{'四分位距':>11}{'单位耗时':>16}{'内存峰值':>12}{'对比':>14}")
+    for name, result in results.items():
+        per_unit = f"{format_time(result['per_unit'])}/{result['unit']}"
+        diff = ''
+        if name in comparison:
+            item = comparison[name]
+            diff = f"{item['ratio']:.2f}x {STATUS_LABELS[item['status']]}".strip()
+        print(f"{name:<40}{format_time(result['median']):>11}{format_time(result['min']):>11}"
+              f"{format_time(result['iqr']):>11}{per_unit:>16}{result['peak_kb']:>10}KB{diff:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='请求热点路径的微基准测试')
+    parser.add_argument('--filter', help='只运行名称包含该字符串的基准测试')
+    parser.add_argument('--list', action='store_true', help='列出所有基准测试')
+    parser.add_argument('--repeat', type=int, default=10, help='每个基准测试的样本数')
+    parser.add_argument('--min-time', type=float, default=0.05, help='每个样本的最短运行时间（秒）')
+    parser.add_argument('--output', help='将结果保存为 JSON 文件')
+    parser.add_argument('--compare', help='与之前保存的 JSON 结果对比')
+    parser.add_argument('--threshold', type=float, default=0.1, help='标记为回归的中位数相对变化阈值')
+    args = parser.parse_args()
+
+    selected = [item for item in BENCHMARKS if not args.filter or args.filter in item[0]]
+    if args.list:
+        for name, _, _ in selected:
+            print(name)
+        return 0
+
+    results = {}
+    over_budget = []
+    for name, setup, max_per_unit in selected:
+        func, units, unit = setup()
+        result = run_benchmark(func, units, args.repeat, args.min_time)
+        result['unit'] = unit
+        results[name] = result
+        if max_per_unit is not None and result['per_unit'] > max_per_unit:
+            over_budget.append(f"{name}（{format_time(result['per_unit'])}/{unit}，"
+                               f"上限 {format_time(max_per_unit)}/{unit}）")
+
+    comparison = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            comparison = compare(results, json.load(f)['benchmarks'], args.threshold)
+
+    print_report(results, comparison)
+
+    if args.output:
+        data = {
+            'meta': {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'repeat': args.repeat,
+                'min_time': args.min_time
+            },
+            'benchmarks': results
+        }
+        if comparison:
+            data['comparison'] = comparison
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    regressions = [name for name, item in comparison.items() if item['status'] == 'regression']
+    if regressions:
+        print(f"性能回归: {', '.join(regressions)}")
+    if over_budget:
+        print(f"超出单位耗时上限: {', '.join(over_budget)}")
+    if regressions or over_budget:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
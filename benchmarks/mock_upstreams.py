@@ -0,0 +1,518 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地模拟上游服务
+
+在一个端口上模拟服务依赖的所有上游接口，响应格式与真实接口相同，用于压测和性能对比，不消耗付费额度：
+
+    POST /zhipu/chat/completions        智谱AI对话（JSON 或 SSE 流式输出）
+    POST /zhipu/web_search              智谱AI搜索（search_result）
+    POST /deepseek/chat/completions     DeepSeek 对话（OpenAI 兼容格式，流式输出包含 reasoning_content）
+    POST /bocha/v1/web-search           Bocha AI搜索（data.webPages）
+    GET  /searxng/search?format=json    SearXNG 搜索（results）
+    GET  /stats                         请求统计：搜索和大模型请求数、已发送的 token 数、完整输出和被客户端断开的流式输出数
+
+大模型收到 ANALYZE_QUERY 任务时返回查询分析 JSON，其他任务返回带有标题、编号列表和来源引用的长回答。
+搜索延迟、首个 token 延迟、token 生成速率、回答长度和错误注入（HTTP 错误、流式输出中途断开）都可以配置。
+
+运行方式：
+    python benchmarks/mock_upstreams.py --port 18080 --search-latency 300 --token-rate 50
+    python benchmarks/mock_upstreams.py --print-env   # 输出让服务使用模拟上游的环境变量
+"""
+
+import json
+import time
+import random
+import argparse
+import itertools
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 回答内容的组成片段（DeepSeek Reasoner 风格，覆盖格式化规则）
+ANSWER_SECTIONS = [
+    "#### 一、背景与概述 这一部分介绍问题的背景 (来源[1][2])：\n\n",
+    "1. 发展历程: 相关领域经历了多个发展阶段，形成了较为成熟的体系 (来源[1])\n\n",
+    "1. 主要特点: 具有覆盖面广、更新速度快、参与主体多样等特点 （来源[3]）\n\n",
+    "   1. 子项说明：补充细节和例子，例如 2024 年的统计数据\n\n",
+    "#### 二、现状分析 当前的主要情况如下:\n\n",
+    "| 类型 | 代表机构 | 核心职能 | |------|------|------| | 研究型 | 示例大学 | 科研与教学 |\n\n",
+    "• 总结：综合来看，该问题需要结合具体情况分析。\n\n"
+]
+
+REASONING_TEXT = "首先分析用户的问题，确定需要回答的要点，然后结合搜索结果逐条整理，最后检查引用是否准确。"
+
+# 搜索结果摘要的组成句子，不同结果使用不同的组合，避免被去重逻辑判定为近似重复
+SNIPPET_SENTENCES = [
+    "{query}是近年来持续受到关注的话题。",
+    "据<em>2024年</em>发布的行业报告，相关市场规模同比增长约18%。",
+    "多位专家在接受采访时表示，短期内仍需关注政策和技术两方面的变化。",
+    "官方数据显示，全国已有超过300个城市开展了相关试点工作。",
+    "研究人员指出，成本下降和效率提升是推动发展的主要因素。",
+    "与国外相比，国内在标准制定和产业配套方面仍有差距。",
+    "该机构在最新的白皮书中提出了未来五年的发展路线图。",
+    "业内人士认为，{query}的关键在于核心技术的自主可控。",
+    "部分地区已出台专项扶持政策，涉及资金、人才和土地等方面。",
+    "公开资料显示，头部企业的研发投入占营业收入的比例超过10%。",
+    "调查结果表明，超过六成的受访者对未来发展持乐观态度。",
+    "相关负责人介绍，下一步将重点推进示范项目建设和经验推广。"
+]
+
+
+def search_snippet(query, index, sentences=3):
+    """生成第 index 条搜索结果的摘要（固定的句子组合，相同参数的结果相同）"""
+    combinations = list(itertools.combinations(range(len(SNIPPET_SENTENCES)), sentences))
+    chosen = combinations[(index * 37) % len(combinations)]
+    return ''.join(SNIPPET_SENTENCES[i] for i in chosen).format(query=query)
+
+
+class MockConfig:
+    """模拟上游服务的配置（时间单位为毫秒）"""
+
+    def __init__(self, search_latency=200, search_jitter=100, first_token_latency=500, token_rate=40,
+                 answer_tokens=300, reasoning_tokens=60, analysis_latency=400, results=10,
+                 error_rate=0.0, stream_abort_rate=0.0, seed=None):
+        self.search_latency = search_latency
+        self.search_jitter = search_jitter
+        self.first_token_latency = first_token_latency
+        self.token_rate = token_rate
+        self.answer_tokens = answer_tokens
+        self.reasoning_tokens = reasoning_tokens
+        self.analysis_latency = analysis_latency
+        self.results = results
+        self.error_rate = error_rate
+        self.stream_abort_rate = stream_abort_rate
+        self.random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def chance(self, rate):
+        """按给定概率返回 True"""
+        if rate <= 0:
+            return False
+        with self._random_lock:
+            return self.random.random() < rate
+
+    def search_delay(self):
+        """一次搜索的延迟（秒）"""
+        with self._random_lock:
+            jitter = self.random.uniform(-self.search_jitter, self.search_jitter)
+        return max(0.0, self.search_latency + jitter) / 1000
+
+
+def split_tokens(text, count):
+    """将文本重复并切分为指定数量的 token（每个 token 为 1-3 个字符）"""
+    tokens = []
+    pos = 0
+    while len(tokens) < count:
+        size = 1 + len(tokens) % 3
+        token = ''.join(text[(pos + i) % len(text)] for i in range(size))
+        tokens.append(token)
+        pos += size
+    return tokens
+
+
+def answer_tokens(count):
+    """生成回答内容的 token 列表"""
+    return split_tokens(''.join(ANSWER_SECTIONS), count)
+
+
+def extract_query(prompt):
+    """从任务提示词中提取用户问题"""
+    for line in prompt.splitlines():
+        if line.startswith('用户问题:'):
+            return line[len('用户问题:'):].strip()
+    return prompt[:50]
+
+
+def analysis_json(query):
+    """查询分析任务的回答"""
+    return json.dumps({
+        'need_search': True,
+        'question_type': '开放性问题',
+        'keywords': [query, f'{query} 最新进展']
+    }, ensure_ascii=False)
+
+
+def usage(prompt_text, completion_tokens):
+    return {
+        'prompt_tokens': len(prompt_text) // 2,
+        'completion_tokens': completion_tokens,
+        'total_tokens': len(prompt_text) // 2 + completion_tokens
+    }
+
+
+class StreamAborted(Exception):
+    """注入的流式输出中途断开"""
+
+
+class MockStats:
+    """模拟上游服务的请求统计，用于检查客户端断开连接后服务是否停止搜索和读取模型输出"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """模拟上游接口的请求处理器"""
+
+    protocol_version = 'HTTP/1.1'
+    config = MockConfig()
+    stats = MockStats()
+
+    def log_message(self, format, *args):
+        pass
+
+    # ---- 通用响应 ----
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def inject_error(self):
+        """按配置的概率返回 HTTP 错误，返回 True 表示已发送错误响应"""
+        if not self.config.chance(self.config.error_rate):
+            return False
+        status = 429 if self.config.chance(0.5) else 500
+        self.send_json({'error': {'code': str(status), 'message': '模拟上游错误'}}, status)
+        return True
+
+    def start_event_stream(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+    def send_event(self, data):
+        payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+        self.wfile.write(f'data: {payload}\n\n'.encode('utf-8'))
+        self.wfile.flush()
+
+    def stream_tokens(self, tokens, build_event, abort_at=None):
+        """按配置的速率发送 token，abort_at 为注入断开的位置"""
+        interval = 1.0 / self.config.token_rate if self.config.token_rate > 0 else 0
+        start = time.perf_counter()
+        for index, token in enumerate(tokens):
+            if abort_at is not None and index == abort_at:
+                raise StreamAborted()
+            # 按开始时间计算每个 token 的发送时间，避免 sleep 误差累积
+            delay = start + index * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.send_event(build_event(token))
+            self.stats.inc('tokens_sent')
+
+    def abort_position(self, total):
+        if self.config.chance(self.config.stream_abort_rate):
+            return total // 2
+        return None
+
+    # ---- 路由 ----
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/searxng/search':
+            self.handle_searxng(parse_qs(url.query))
+        elif url.path == '/stats':
+            self.send_json(self.stats.snapshot())
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        path = urlparse(self.path).path
+        try:
+            if path == '/zhipu/chat/completions':
+                self.handle_chat(body, deepseek=False)
+            elif path == '/zhipu/web_search':
+                self.handle_zhipu_search(body)
+            elif path.startswith('/deepseek') and path.endswith('/chat/completions'):
+                self.handle_chat(body, deepseek=True)
+            elif path == '/bocha/v1/web-search':
+                self.handle_bocha_search(body)
+            else:
+                self.send_json({'error': 'not found'}, 404)
+        except StreamAborted:
+            self.close_connection = True
+        except (BrokenPipeError, ConnectionResetError):
+            # 服务在输出结束前关闭了连接
+            self.stats.inc('streams_closed_by_client')
+            self.close_connection = True
+
+    # ---- 搜索接口 ----
+
+    def handle_zhipu_search(self, body):
+        self.stats.inc('search_requests')
+        time.sleep(self.config.search_delay())
+        if self.inject_error():
+            return
+        query = body.get('search_query', '')
+        self.send_json({
+            'id': f'mock-{int(time.time() * 1000)}',
+            'created': int(time.time()),
+            'search_intent': [{'query': query, 'intent': 'SEARCH_ALL', 'keywords': query}],
+            'search_result': [
+                {
+                    'title': f'{query} - 结果{index}',
+                    'content': search_snippet(query, index),
+                    'link': f'https://zhipu.example.com/{index}?q={query}',
+                    'media': f'示例网站{index}',
+                    'icon': '',
+                    'refer': f'ref_{index}',
+                    'publish_date': '2024-05-01'
+                }
+                for index in range(1, self.config.results + 1)
+            ]
+        })
+
+    def handle_bocha_search(self, body):
+        self.stats.inc('search_requests')
+        time.sleep(self.config.search_delay())
+        if self.inject_error():
+            return
+        query = body.get('query', '')
+        count = body.get('count') or self.config.results
+        self.send_json({
+            'code': 200,
+            'log_id': f'mock-{int(time.time() * 1000)}',
+            'msg': None,
+            'data': {
+                '_type': 'SearchResponse',
+                'queryContext': {'originalQuery': query},
+                'webPages': {
+                    'webSearchUrl': f'https://bochaai.com/search?q={query}',
+                    'totalEstimatedMatches': 1000,
+                    'someResultsRemoved': False,
+                    'value': [
+                        {
+                            'id': f'https://api.bochaai.com/v1/#WebPages.{index}',
+                            'name': f'{query} - 博查结果{index}',
+                            'url': f'https://bocha.example.com/{index}?q={query}',
+                            'displayUrl': f'https://bocha.example.com/{index}',
+                            'snippet': search_snippet(query, index),
+                            'summary': search_snippet(query, index, 6),
+                            'siteName': f'示例站点{index}',
+                            'siteIcon': '',
+                            'datePublished': '2024-05-01T08:00:00+08:00',
+                            'dateLastCrawled': '2024-05-01T08:00:00Z',
+                            'language': 'zh'
+                        }
+                        for index in range(1, count + 1)
+                    ]
+                }
+            }
+        })
+
+    def handle_searxng(self, params):
+        self.stats.inc('search_requests')
+        time.sleep(self.config.search_delay())
+        if self.inject_error():
+            return
+        query = params.get('q', [''])[0]
+        engines = ['bing', 'baidu', 'sogou']
+        self.send_json({
+            'query': query,
+            'number_of_results': 1000,
+            'results': [
+                {
+                    'title': f'{query} - SearXNG结果{index}',
+                    'url': f'https://searx{index % 3}.example.com/{index}?q={query}',
+                    'content': search_snippet(query, index),
+                    'engine': engines[index % 3],
+                    'engines': [engines[index % 3]],
+                    'score': round(1.0 / index, 4),
+                    'category': 'general',
+                    'publishedDate': '2024-05-01T00:00:00'
+                }
+                for index in range(1, self.config.results + 1)
+            ],
+            'answers': [],
+            'corrections': [],
+            'infoboxes': [],
+            'suggestions': [f'{query} 是什么'],
+            'unresponsive_engines': []
+        })
+
+    # ---- 大模型接口 ----
+
+    def handle_chat(self, body, deepseek):
+        messages = body.get('messages') or [{}]
+        prompt = messages[-1].get('content', '')
+        prompt_text = ''.join(message.get('content', '') for message in messages)
+        is_analysis = 'ANALYZE_QUERY' in prompt
+        model = body.get('model') or ('deepseek-chat' if deepseek else 'glm-4')
+        reasoning = deepseek and 'reasoner' in model and not is_analysis
+        self.stats.inc('analysis_requests' if is_analysis else 'chat_requests')
+
+        time.sleep((self.config.analysis_latency if is_analysis else self.config.first_token_latency) / 1000)
+        if self.inject_error():
+            return
+
+        if is_analysis:
+            tokens = [analysis_json(extract_query(prompt))]
+        else:
+            tokens = answer_tokens(self.config.answer_tokens)
+        reasoning_tokens = split_tokens(REASONING_TEXT, self.config.reasoning_tokens) if reasoning else []
+
+        if not body.get('stream'):
+            self.send_chat_completion(model, tokens, reasoning_tokens, prompt_text, deepseek)
+        elif deepseek:
+            self.stream_deepseek(model, tokens, reasoning_tokens, prompt_text)
+        else:
+            self.stream_zhipu(model, tokens, prompt_text)
+
+    def send_chat_completion(self, model, tokens, reasoning_tokens, prompt_text, deepseek):
+        # 非流式输出在生成全部 token 后返回
+        if self.config.token_rate > 0:
+            time.sleep((len(tokens) + len(reasoning_tokens)) / self.config.token_rate)
+        message = {'role': 'assistant', 'content': ''.join(tokens)}
+        if reasoning_tokens:
+            message['reasoning_content'] = ''.join(reasoning_tokens)
+        data = {
+            'id': f'mock-{int(time.time() * 1000)}',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': message}],
+            'usage': usage(prompt_text, len(tokens) + len(reasoning_tokens))
+        }
+        if deepseek:
+            data['object'] = 'chat.completion'
+        self.send_json(data)
+
+    def stream_deepseek(self, model, tokens, reasoning_tokens, prompt_text):
+        base = {'id': f'mock-{int(time.time() * 1000)}', 'object': 'chat.completion.chunk',
+                'created': int(time.time()), 'model': model}
+
+        def chunk(delta, finish_reason=None):
+            return dict(base, choices=[{'index': 0, 'delta': delta, 'finish_reason': finish_reason}])
+
+        self.start_event_stream()
+        self.send_event(chunk({'role': 'assistant', 'content': ''}))
+        self.stream_tokens(reasoning_tokens, lambda token: chunk({'content': None, 'reasoning_content': token}))
+        self.stream_tokens(tokens, lambda token: chunk({'content': token}), self.abort_position(len(tokens)))
+        final = chunk({'content': ''}, 'stop')
+        final['usage'] = usage(prompt_text, len(tokens) + len(reasoning_tokens))
+        self.send_event(final)
+        self.send_event('[DONE]')
+        self.stats.inc('streams_completed')
+
+    def stream_zhipu(self, model, tokens, prompt_text):
+        base = {'id': f'mock-{int(time.time() * 1000)}', 'created': int(time.time()), 'model': model}
+
+        def chunk(delta, finish_reason=None):
+            choice = {'index': 0, 'delta': delta}
+            if finish_reason:
+                choice['finish_reason'] = finish_reason
+            return dict(base, choices=[choice])
+
+        self.start_event_stream()
+        self.stream_tokens(tokens, lambda token: chunk({'role': 'assistant', 'content': token}),
+                           self.abort_position(len(tokens)))
+        final = chunk({'role': 'assistant', 'content': ''}, 'stop')
+        final['usage'] = usage(prompt_text, len(tokens))
+        self.send_event(final)
+        self.send_event('[DONE]')
+        self.stats.inc('streams_completed')
+
+
+def service_env(base_url):
+    """
+    让服务使用模拟上游的环境变量
+
+    Args:
+        base_url: 模拟上游服务的地址，如 http://127.0.0.1:18080
+
+    Returns:
+        dict: 环境变量
+    """
+    base_url = base_url.rstrip('/')
+    return {
+        'ZHIPUAI_API_KEY': 'mock',
+        'ZHIPUAI_API_URL': f'{base_url}/zhipu/chat/completions',
+        'ZHIPUAI_SEARCH_URL': f'{base_url}/zhipu/web_search',
+        'DEEPSEEK_API_KEY': 'mock',
+        'DEEPSEEK_API_URL': f'{base_url}/deepseek',
+        'BOCHAAI_API_KEY': 'mock',
+        'BOCHAAI_API_URL': f'{base_url}/bocha/v1/web-search',
+        'SEARXNG_API_HOST': f'{base_url}/searxng'
+    }
+
+
+def start(config=None, host='127.0.0.1', port=18080):
+    """
+    在后台线程中启动模拟上游服务
+
+    Args:
+        config: MockConfig，默认使用默认配置
+        host: 监听地址
+        port: 监听端口，为 0 时自动选择
+
+    Returns:
+        ThreadingHTTPServer: 服务对象，server.server_address 为实际监听的地址
+    """
+    handler = type('ConfiguredMockHandler', (MockHandler,), {'config': config or MockConfig(), 'stats': MockStats()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟上游服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=18080, help='监听端口')
+    parser.add_argument('--search-latency', type=float, default=200, help='搜索接口的平均延迟（毫秒）')
+    parser.add_argument('--search-jitter', type=float, default=100, help='搜索延迟的随机波动范围（毫秒）')
+    parser.add_argument('--analysis-latency', type=float, default=400, help='查询分析任务的延迟（毫秒）')
+    parser.add_argument('--first-token-latency', type=float, default=500, help='回答的首个 token 延迟（毫秒）')
+    parser.add_argument('--token-rate', type=float, default=40, help='每秒生成的 token 数，为 0 时不限速')
+    parser.add_argument('--answer-tokens', type=int, default=300, help='每个回答的 token 数')
+    parser.add_argument('--reasoning-tokens', type=int, default=60, help='deepseek-reasoner 每个回答的推理 token 数')
+    parser.add_argument('--results', type=int, default=10, help='每次搜索返回的结果数')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 HTTP 429/500 错误的概率')
+    parser.add_argument('--stream-abort-rate', type=float, default=0.0, help='流式输出中途断开的概率')
+    parser.add_argument('--seed', type=int, default=None, help='随机数种子')
+    parser.add_argument('--print-env', action='store_true', help='输出让服务使用模拟上游的环境变量后退出')
+    args = parser.parse_args()
+
+    base_url = f'http://{args.host}:{args.port}'
+    if args.print_env:
+        for name, value in service_env(base_url).items():
+            print(f'export {name}={value}')
+        return
+
+    config = MockConfig(
+        search_latency=args.search_latency, search_jitter=args.search_jitter,
+        first_token_latency=args.first_token_latency, token_rate=args.token_rate,
+        answer_tokens=args.answer_tokens, reasoning_tokens=args.reasoning_tokens,
+        analysis_latency=args.analysis_latency, results=args.results,
+        error_rate=args.error_rate, stream_abort_rate=args.stream_abort_rate, seed=args.seed
+    )
+    server = start(config, args.host, args.port)
+    print(f'模拟上游服务已启动: {base_url}')
+    print('使用以下环境变量启动服务:')
+    for name, value in service_env(base_url).items():
+        print(f'  {name}={value}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
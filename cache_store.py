@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+缓存存储模块
+
+这个模块提供了带过期时间的 LRU 缓存，按内存占用和条目数量限制大小，
+记录命中、未命中和淘汰次数，并支持可选的 SQLite 持久化后端，使缓存在重启后仍然有效。
+"""
+
+import re
+import json
+import time
+import sqlite3
+import datetime
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# 句末的问号、感叹号和句号（全角问号、感叹号经 NFKC 折叠为半角）
+_TRAILING_PUNCTUATION_RE = re.compile(r'[?!。\s]+$')
+# 中文等非ASCII字符两侧的空白
+_NON_ASCII_SPACE_RE = re.compile(r'(?<=[^\x00-\x7f]) | (?=[^\x00-\x7f])')
+
+
+def normalize_query(query):
+    """
+    规范化用户问题，用于生成缓存键
+
+    进行全角/半角折叠（NFKC）、转换为小写、去除句末的问号、感叹号和句号并合并连续空白，
+    中文等非ASCII字符两侧的空白会被删除，使仅有空白、大小写、全半角或句末标点差异的问题得到相同的结果。
+    其他标点符号保持不变，避免"C#"与"C"、"3.5"与"35"等不同的问题得到相同的结果。
+
+    Args:
+        query: 用户问题
+
+    Returns:
+        str: 规范化后的问题
+    """
+    text = unicodedata.normalize('NFKC', str(query)).lower()
+    text = ' '.join(_TRAILING_PUNCTUATION_RE.sub('', text).split())
+    return _NON_ASCII_SPACE_RE.sub('', text)
+
+
+def seconds_until_midnight(now=None):
+    """
+    计算距离下一个自然日开始的秒数
+
+    Args:
+        now: 当前时间，默认为 datetime.datetime.now()
+
+    Returns:
+        float: 距离午夜的秒数
+    """
+    now = now or datetime.datetime.now()
+    tomorrow = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time.min)
+    return (tomorrow - now).total_seconds()
+
+
+class SQLiteBackend:
+    """
+    SQLite 持久化缓存后端
+
+    多个缓存可以共享同一个数据库文件，通过缓存名称区分。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expire_at REAL NOT NULL, '
+                'PRIMARY KEY (name, key))'
+            )
+            self._conn.commit()
+
+    def get(self, name, key):
+        """读取未过期的缓存值，返回 (value, expire_at) 或 None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expire_at FROM cache WHERE name = ? AND key = ?', (name, key)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row
+
+    def set(self, name, key, value, expire_at):
+        """写入缓存值"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache (name, key, value, expire_at) VALUES (?, ?, ?, ?)',
+                (name, key, value, expire_at)
+            )
+            self._conn.commit()
+
+    def delete(self, name, key):
+        """删除缓存值"""
+        with self._lock:
+            self._conn.execute('DELETE FROM cache WHERE name = ? AND key = ?', (name, key))
+            self._conn.commit()
+
+    def purge_expired(self):
+        """删除所有已过期的缓存值"""
+        with self._lock:
+            self._conn.execute('DELETE FROM cache WHERE expire_at <= ?', (time.time(),))
+            self._conn.commit()
+
+
+# 按数据库路径共享的 SQLite 后端
+_sqlite_backends = {}
+_sqlite_backends_lock = threading.Lock()
+
+
+def get_sqlite_backend(path):
+    """
+    获取指定路径的 SQLite 后端，同一路径在进程内只打开一次
+
+    Args:
+        path: 数据库文件路径
+
+    Returns:
+        SQLiteBackend: SQLite 后端
+    """
+    with _sqlite_backends_lock:
+        backend = _sqlite_backends.get(path)
+        if backend is None:
+            backend = SQLiteBackend(path)
+            backend.purge_expired()
+            _sqlite_backends[path] = backend
+        return backend
+
+
+def create_backend(backend_name, sqlite_path):
+    """
+    根据配置创建持久化后端
+
+    Args:
+        backend_name: 后端名称，"memory" 或 "sqlite"
+        sqlite_path: SQLite 数据库文件路径
+
+    Returns:
+        SQLiteBackend 或 None（仅使用内存）
+    """
+    if (backend_name or 'memory').lower() == 'sqlite':
+        return get_sqlite_backend(sqlite_path)
+    return None
+
+
+class TTLCache:
+    """
+    带过期时间的 LRU 缓存
+
+    缓存值以 JSON 字符串形式保存，用于估算内存占用，同时保证每次读取都返回独立的副本。
+    """
+
+    def __init__(self, name, max_entries=10000, max_bytes=64 * 1024 * 1024, backend=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self._data = OrderedDict()  # key -> (value_json, expire_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def _store(self, key, value_json, expire_at):
+        size = len(key) + len(value_json.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (value_json, expire_at, size)
+        self._bytes += size
+
+        # 超出条目数量或内存限制时，淘汰最久未使用的条目
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._data))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def get(self, key):
+        """
+        读取缓存值
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存值，未命中或已过期时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(entry[0])
+                self._remove(key)
+                self.expirations += 1
+
+        # 内存未命中时查询持久化后端
+        if self.backend is not None:
+            row = self.backend.get(self.name, key)
+            if row is not None:
+                with self._lock:
+                    self._store(key, row[0], row[1])
+                    self.hits += 1
+                return json.loads(row[0])
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value, ttl):
+        """
+        写入缓存值
+
+        Args:
+            key: 缓存键
+            value: 可 JSON 序列化的缓存值
+            ttl: 过期时间（秒），小于等于 0 时不缓存
+        """
+        if ttl <= 0:
+            return
+        value_json = json.dumps(value, ensure_ascii=False)
+        expire_at = time.time() + ttl
+        with self._lock:
+            self._store(key, value_json, expire_at)
+        if self.backend is not None:
+            self.backend.set(self.name, key, value_json, expire_at)
+
+    def delete(self, key):
+        """删除缓存值"""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+        if self.backend is not None:
+            self.backend.delete(self.name, key)
+
+    def clear(self):
+        """清空内存中的缓存"""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        获取缓存统计信息
+
+        Returns:
+            dict: 命中、未命中、淘汰、过期次数以及当前条目数和内存占用
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'name': self.name,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'backend': 'sqlite' if self.backend is not None else 'memory'
+            }
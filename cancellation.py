@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求取消模块
+
+客户端断开连接后，为该请求进行的工作（排队中的搜索、尚未开始的大模型调用、上游的流式输出）应尽快停止。
+
+同步服务中，合并请求（singleflight）的后台线程在所有订阅者都断开连接后取消令牌。令牌保存在 contextvars 中，
+随请求上下文传递到搜索线程：搜索执行器在令牌取消时取消排队中的搜索并停止等待，
+智能联网搜索流水线在搜索和调用大模型之前检查令牌。
+异步服务直接取消处理请求的任务，不需要令牌。
+"""
+
+import threading
+import contextvars
+
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+# 当前请求的取消令牌
+_current_token = contextvars.ContextVar('cancel_token', default=None)
+
+
+class Cancelled(Exception):
+    """请求已取消（客户端已断开连接）"""
+
+
+class CancelToken:
+    """取消令牌：可以在任意线程中取消，取消时依次调用注册的回调函数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        """取消令牌，重复取消时不再调用回调函数"""
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("执行取消回调时出错: %s", e)
+
+    def add_callback(self, callback):
+        """注册取消时调用的函数，令牌已取消时立即调用"""
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        """移除注册的回调函数"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def set_token(token):
+    """设置当前上下文的取消令牌"""
+    _current_token.set(token)
+
+
+def current_token():
+    """
+    获取当前上下文的取消令牌
+
+    Returns:
+        CancelToken: 取消令牌，请求不可取消时返回 None
+    """
+    return _current_token.get()
+
+
+def is_cancelled():
+    """当前请求是否已取消"""
+    token = _current_token.get()
+    return token is not None and token.cancelled
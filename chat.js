@@ -339,6 +339,11 @@ document.addEventListener('DOMContentLoaded', function() {
                                         console.log('收到流式输出结束消息（JSON格式）');
                                         continue;
                                     }
+                                    // 耗时数据块（启用 TRACING_ENABLED 时发送），不显示在回答中
+                                    if (jsonData.timings) {
+                                        console.log('请求耗时:', jsonData.timings);
+                                        continue;
+                                    }
                                 } catch (e) {
                                     // 不是JSON格式的结束消息，继续处理
                                 }
@@ -8,24 +8,35 @@
 """
 
 import os
-import json
 import time
 import requests
 from urllib.parse import quote
 from dotenv import load_dotenv
+from log_config import get_logger
 
 # 加载环境变量
 load_dotenv()
 
+logger = get_logger(__name__)
+
 # 导入搜索引擎模块
 from search_engines import zhipuai, searxng, bochaai
 
 # 导入智能联网搜索提示词
-from chat_with_intelligent_search_new import INTELLIGENT_SEARCH_PROMPT
+from intelligent_search_prompt import get_intelligent_search_prompt
 
 # 导入DeepSeek API模块
 import deepseek_api
 
+# 导入回答缓存模块
+import answer_cache
+
+# 导入监控指标模块
+import metrics
+
+# 导入流式输出事件模块
+import sse_events
+
 # 系统提示词
 SYSTEM_PROMPT = '''你是一个有用的AI助手。你可以回答用户的各种问题，提供有用的信息和建议。
 
@@ -148,7 +159,7 @@ def call_llm_model(prompt, system_prompt=SYSTEM_PROMPT, model_id=None, stream=Fa
         stream: 是否使用流式输出
 
     Returns:
-        大模型的回复或流式响应对象
+        大模型的回复，流式输出时返回输出事件的迭代器（见 sse_events）
     """
     # 准备消息
     messages = [
@@ -165,14 +176,18 @@ def call_llm_model(prompt, system_prompt=SYSTEM_PROMPT, model_id=None, stream=Fa
 
             if stream:
                 # 流式输出模式
-                response = deepseek_api.chat(messages, stream=True, model=model_name)
-                return deepseek_api.format_stream_for_flask(response)
+                with metrics.measure(metrics.LLM_LATENCY, 'llm', model=model_name, stream='true'):
+                    response = deepseek_api.chat(messages, stream=True, model=model_name)
+                return deepseek_api.stream_events(response)
             else:
                 # 非流式模式
-                response = deepseek_api.chat(messages, stream=False, model=model_name)
+                with metrics.measure(metrics.LLM_LATENCY, 'llm', model=model_name, stream='false'):
+                    response = deepseek_api.chat(messages, stream=False, model=model_name)
                 return deepseek_api.extract_response_content(response)['content']
         except Exception as e:
-            return f"调用DeepSeek模型时出错: {str(e)}"
+            if stream:
+                return iter(sse_events.error_events(f"调用DeepSeek模型时出错: {str(e)}"))
+            return answer_cache.ErrorResponse(f"调用DeepSeek模型时出错: {str(e)}")
     else:
         # 使用智谱AI模型
         # 获取模型配置
@@ -181,7 +196,8 @@ def call_llm_model(prompt, system_prompt=SYSTEM_PROMPT, model_id=None, stream=Fa
         # 获取API密钥
         api_key = os.getenv(config['api_key_env'])
         if not api_key:
-            return f"{config['name']} API密钥未配置。请在.env文件中设置{config['api_key_env']}环境变量。"
+            message = f"{config['name']} API密钥未配置。请在.env文件中设置{config['api_key_env']}环境变量。"
+            return iter(sse_events.error_events(message)) if stream else answer_cache.ErrorResponse(message)
 
         # 准备请求参数
         url = config['url']
@@ -195,23 +211,51 @@ def call_llm_model(prompt, system_prompt=SYSTEM_PROMPT, model_id=None, stream=Fa
             # 发送请求
             if stream:
                 # 流式输出模式
-                response = requests.post(url, json=payload, headers=headers, stream=True, timeout=60)
-                response.raise_for_status()
-                return response  # 返回原始响应对象，由调用者处理流式输出
+                with metrics.measure(metrics.LLM_LATENCY, 'llm', model=payload['model'], stream='true'):
+                    response = requests.post(url, json=payload, headers=headers, stream=True, timeout=60)
+                    response.raise_for_status()
+                return sse_events.parse_lines(response.iter_lines(), response)
             else:
                 # 非流式模式
-                response = requests.post(url, json=payload, headers=headers, timeout=60)
-                response.raise_for_status()
+                with metrics.measure(metrics.LLM_LATENCY, 'llm', model=payload['model'], stream='false'):
+                    response = requests.post(url, json=payload, headers=headers, timeout=60)
+                    response.raise_for_status()
 
                 # 解析响应
                 result = response.json()
+                metrics.record_token_usage(result.get('model'), result.get('usage'))
                 if 'choices' in result and len(result['choices']) > 0:
                     return result['choices'][0]['message']['content']
                 else:
-                    return f"{config['name']}未返回有效回复。"
+                    return answer_cache.ErrorResponse(f"{config['name']}未返回有效回复。")
 
         except Exception as e:
-            return f"调用{config['name']}模型时出错: {str(e)}"
+            if stream:
+                return iter(sse_events.error_events(f"调用{config['name']}模型时出错: {str(e)}"))
+            return answer_cache.ErrorResponse(f"调用{config['name']}模型时出错: {str(e)}")
+
+def stream_frames(events, first_event=None):
+    """
+    将模型的流式输出事件序列化为前端格式的数据块
+
+    Args:
+        events: 模型流式输出的事件迭代器
+        first_event: 在模型输出之前发送的事件（如搜索结果信息）
+
+    Returns:
+        generator: SSE 数据块，以结束标记结尾
+    """
+    if first_event is not None:
+        yield sse_events.serialize(first_event)
+    for event in events:
+        yield sse_events.serialize(event)
+        # 模型流的结束标记之后不再有内容
+        if event.type == sse_events.DONE:
+            break
+    else:
+        # 模型流没有以结束标记结尾时补充结束标记
+        yield sse_events.DONE_FRAMES
+    logger.info("普通聊天流式输出完成")
 
 def chat(query, model_id=None, stream=False):
     """
@@ -237,106 +281,39 @@ def chat(query, model_id=None, stream=False):
         "search_results": []  # 添加空的搜索结果列表
     }
 
+    # 先查询回答缓存，命中时直接返回缓存的回答
+    answer_key = answer_cache.make_key(query, model_id, get_intelligent_search_prompt(), stream, source='chat')
+    cached_answer = answer_cache.get(answer_key)
+    if cached_answer is not None:
+        logger.info("回答缓存命中: %s", query)
+        if stream:
+            return answer_cache.CachedStreamResponse(cached_answer)
+        result["response"] = cached_answer
+        return result
+
     # 使用与智能联网搜索相同的系统提示词
     # 但是使用DIRECT_ANSWER任务类型
     task_prompt = f"任务类型: DIRECT_ANSWER\n用户问题: {query}"
 
     # 调用大模型，使用与智能联网搜索相同的提示词
-    response = call_llm_model(task_prompt, INTELLIGENT_SEARCH_PROMPT, model_id, stream)
+    response = call_llm_model(task_prompt, get_intelligent_search_prompt(), model_id, stream)
 
     # 如果是流式输出，需要修改返回方式
     if stream:
         # 在流式响应的第一个块中包含空的搜索结果信息
-        if hasattr(response, 'iter_lines'):
-            original_iter_lines = response.iter_lines
-
-            def modified_iter_lines(*args, **kwargs):
-                # 首先发送一个包含空搜索结果的特殊块
-                search_info = json.dumps({
-                    "search_results": [],
-                    "question_type": ""
-                })
-                yield search_info.encode('utf-8')
-
-                # 然后发送原始的流式响应
-                for line in original_iter_lines(*args, **kwargs):
-                    # 处理智谱AI和DeepSeek的流式输出格式
-                    try:
-                        line_text = line.decode('utf-8')
-                        if line_text.startswith('{') and '"choices"' in line_text:
-                            json_data = json.loads(line_text)
-
-                            # 提取内容
-                            if 'choices' in json_data and len(json_data['choices']) > 0:
-                                # 智谱AI格式
-                                if 'delta' in json_data['choices'][0] and 'content' in json_data['choices'][0]['delta']:
-                                    content = json_data['choices'][0]['delta']['content']
-                                    # 创建前端期望的格式
-                                    frontend_data = {
-                                        "content": content,
-                                        "role": "assistant"
-                                    }
-                                    # 发送给前端
-                                    yield f"data: {json.dumps(frontend_data)}\n\n"
-                                    continue
-                                # DeepSeek格式
-                                elif 'message' in json_data['choices'][0] and 'content' in json_data['choices'][0]['message']:
-                                    content = json_data['choices'][0]['message']['content']
-                                    # 创建前端期望的格式
-                                    frontend_data = {
-                                        "content": content,
-                                        "role": "assistant"
-                                    }
-                                    # 发送给前端
-                                    yield f"data: {json.dumps(frontend_data)}\n\n"
-                                    continue
-                                # DeepSeek Reasoner模型的推理过程格式 - 非流式模式
-                                elif 'message' in json_data['choices'][0] and 'reasoning_content' in json_data['choices'][0]['message']:
-                                    reasoning = json_data['choices'][0]['message']['reasoning_content']
-                                    # 检查推理内容是否为空或null
-                                    if reasoning and reasoning != 'null' and reasoning.strip():
-                                        # 创建前端期望的格式
-                                        frontend_data = {
-                                            "content": reasoning,
-                                            "role": "assistant",
-                                            "is_reasoning": True
-                                        }
-                                        # 发送给前端
-                                        yield f"data: {json.dumps(frontend_data)}\n\n"
-                                    continue
-                                # DeepSeek Reasoner模型的推理过程格式 - 流式模式
-                                elif 'delta' in json_data['choices'][0] and 'reasoning_content' in json_data['choices'][0]['delta']:
-                                    print(f">>> 检测到推理内容: {json_data['choices'][0]['delta']['reasoning_content'][:30]}...")
-                                    reasoning = json_data['choices'][0]['delta']['reasoning_content']
-                                    # 检查推理内容是否为空或null
-                                    if reasoning and reasoning != 'null' and reasoning.strip():
-                                        # 创建前端期望的格式
-                                        frontend_data = {
-                                            "content": reasoning,
-                                            "role": "assistant",
-                                            "is_reasoning": True
-                                        }
-                                        # 发送给前端
-                                        yield f"data: {json.dumps(frontend_data)}\n\n"
-                                    continue
-                    except Exception as e:
-                        print(f">>> 解析JSON出错: {str(e)}")
-
-                    # 如果不是特殊格式，直接传递
-                    yield line
-
-                # 发送结束消息 - 使用两种格式的结束消息，确保前端能正确处理
-                # 首先发送JSON格式的结束消息
-                yield f"data: {{\"done\": true}}\n\n"
-                # 然后发送旧格式的结束消息
-                yield f"data: [DONE]\n\n"
-                print(f">>> 普通聊天流式输出完成")
-
-            response.iter_lines = modified_iter_lines
-
-        return response
+        search_info = sse_events.Event(sse_events.DATA, data={
+            "search_results": [],
+            "question_type": ""
+        })
+        lines = stream_frames(response, first_event=search_info)
+
+        # 完整输出后写入回答缓存
+        if answer_key is not None:
+            lines = answer_cache.record_stream(answer_key, lines)
+        return answer_cache.CachedStreamResponse(lines)
 
     # 保存AI回复
+    answer_cache.put(answer_key, response)
     result["response"] = response
 
     return result
@@ -392,7 +369,7 @@ def chat_with_search(query, engine="search_std", count=10, model_id=None, stream
             searxng_params['time_range'] = kwargs['time_range']
 
         # 调用SearXNG搜索
-        print(f'SearXNG搜索参数: {searxng_params}')
+        logger.debug("SearXNG搜索参数: %s", searxng_params)
         search_result = searxng.search(query, count=count, **searxng_params)
     else:
         result["error"] = f"不支持的搜索引擎: {engine}"
@@ -415,9 +392,9 @@ def chat_with_search(query, engine="search_std", count=10, model_id=None, stream
     # 调用大模型
     response = call_llm_model(prompt, SEARCH_SYSTEM_PROMPT, model_id, stream)
 
-    # 如果是流式输出，直接返回响应对象
+    # 如果是流式输出，返回序列化后的数据块
     if stream:
-        return response
+        return answer_cache.CachedStreamResponse(stream_frames(response))
 
     # 保存AI回复
     result["response"] = response
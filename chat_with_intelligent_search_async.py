@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+智能联网搜索聊天模块（异步版本）
+
+流程与 chat_with_intelligent_search_new 相同（分析问题 → 搜索 → 回答），但所有网络调用都基于 asyncio：
+搜索引擎使用共享的 httpx.AsyncClient，DeepSeek 模型使用 AsyncOpenAI，智谱AI模型使用异步流式请求。
+等待搜索结果和大模型输出时不占用线程，单个进程可以同时保持大量流式连接。
+
+缓存、本地快速分类、结果去重和提示词组装等逻辑与同步版本共用。
+"""
+
+import os
+import time
+from dotenv import load_dotenv
+
+# 导入智能联网搜索提示词
+from intelligent_search_prompt import get_intelligent_search_prompt, get_system_prompt
+
+# 导入搜索引擎模块
+from search_engines import zhipuai, bochaai, searxng, async_http
+
+import deepseek_api
+import search_executor
+import search_cache
+import answer_cache
+import federated_search
+import tracing
+import metrics
+import sse_events
+
+# 与同步版本共用的处理逻辑
+from chat_with_intelligent_search_new import (
+    ZHIPUAI_KEY_MISSING_MESSAGE,
+    build_zhipuai_request,
+    parse_zhipuai_result,
+    format_deepseek_result,
+    log_llm_call,
+    get_search_params,
+    cache_search_result,
+    analyze_query_locally,
+    parse_analysis_response,
+    insert_speculative_slot,
+    new_result,
+    skip_analysis_keywords,
+    record_analysis,
+    build_answer_task_prompt,
+    new_stream_formatter,
+    save_response,
+    save_timings
+)
+from log_config import get_logger
+
+# 加载环境变量
+load_dotenv()
+
+logger = get_logger(__name__)
+
+
+async def error_stream(error_message):
+    """只包含错误消息和结束标记的流式输出事件"""
+    for event in sse_events.error_events(error_message):
+        yield event
+
+
+async def _stream_zhipuai_model(url, payload, headers, trace=None):
+    """逐行解析智谱AI模型的流式输出（SSE 格式）为事件，trace 为调用时的追踪记录"""
+    start = time.perf_counter()
+    try:
+        async with async_http.get_client().stream('POST', url, json=payload, headers=headers, timeout=60) as response:
+            response.raise_for_status()
+            if trace is not None:
+                trace.add_span('llm', start, time.perf_counter(), {'model': payload['model'], 'stream': True})
+            metrics.LLM_LATENCY.observe(time.perf_counter() - start, model=payload['model'], stream='true')
+            logger.info("智谱AI模型调用完成，响应类型: 异步流式输出，响应状态码: %s", response.status_code)
+            async for event in sse_events.parse_lines_async(response.aiter_lines()):
+                yield event
+    except Exception as e:
+        logger.error("智谱AI模型调用出错: %s", e)
+        metrics.record_error('llm', type(e).__name__)
+        async for event in error_stream(f"调用智谱AI模型时出错: {str(e)}"):
+            yield event
+
+
+async def call_zhipuai_model_async(prompt, system_prompt, stream=False):
+    """
+    异步调用智谱AI模型
+
+    Args:
+        prompt: 用户提示
+        system_prompt: 系统提示
+        stream: 是否使用流式输出
+
+    Returns:
+        智谱AI模型的回复，流式输出时返回输出事件的异步生成器
+    """
+    zhipuai_request = build_zhipuai_request(prompt, system_prompt, stream)
+    if zhipuai_request is None:
+        return error_stream(ZHIPUAI_KEY_MISSING_MESSAGE) if stream else ZHIPUAI_KEY_MISSING_MESSAGE
+    url, payload, headers = zhipuai_request
+
+    if stream:
+        return _stream_zhipuai_model(url, payload, headers, tracing.current_trace())
+
+    try:
+        with tracing.span('llm', model=payload['model'], stream=False), \
+                metrics.measure(metrics.LLM_LATENCY, 'llm', model=payload['model'], stream='false'):
+            response = await async_http.post(url, json=payload, headers=headers, timeout=60)
+            response.raise_for_status()
+        logger.debug("响应状态码: %s", response.status_code)
+        return parse_zhipuai_result(response.json())
+    except Exception as e:
+        logger.error("智谱AI模型调用出错: %s", e)
+        return answer_cache.ErrorResponse(f"调用智谱AI模型时出错: {str(e)}")
+
+
+async def _stream_deepseek_model(messages, model_name, trace=None):
+    """将 DeepSeek 模型的流式回复转换为事件，trace 为调用时的追踪记录"""
+    start = time.perf_counter()
+    try:
+        response = await deepseek_api.chat_async(messages, stream=True, model=model_name)
+        if trace is not None:
+            trace.add_span('llm', start, time.perf_counter(), {'model': model_name, 'stream': True})
+        metrics.LLM_LATENCY.observe(time.perf_counter() - start, model=model_name, stream='true')
+    except Exception as e:
+        logger.error("DeepSeek 模型调用出错: %s", e)
+        metrics.record_error('llm', type(e).__name__)
+        async for event in error_stream(f"调用 DeepSeek 模型时出错: {str(e)}"):
+            yield event
+        return
+
+    async for event in deepseek_api.stream_events_async(response):
+        yield event
+
+
+async def call_llm_model_async(prompt, system_prompt=None, model_id=None, stream=False):
+    """
+    异步调用大模型
+
+    Args:
+        prompt: 用户提示
+        system_prompt: 系统提示，默认为基本系统提示词
+        model_id: 模型标识符
+        stream: 是否使用流式输出
+
+    Returns:
+        大模型的回复，流式输出时返回输出事件的异步生成器
+    """
+    system_prompt = system_prompt or get_system_prompt()
+    log_llm_call(prompt, system_prompt, model_id, stream)
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+
+    if model_id and model_id.startswith('deepseek'):
+        model_name = os.getenv('DEEPSEEK_MODEL', 'deepseek-chat')
+        if stream:
+            return _stream_deepseek_model(messages, model_name, tracing.current_trace())
+
+        try:
+            with tracing.span('llm', model=model_name, stream=False), \
+                    metrics.measure(metrics.LLM_LATENCY, 'llm', model=model_name, stream='false'):
+                response = await deepseek_api.chat_async(messages, stream=False, model=model_name)
+            return format_deepseek_result(deepseek_api.extract_response_content(response))
+        except Exception as e:
+            logger.error("DeepSeek 模型调用出错: %s", e)
+            return answer_cache.ErrorResponse(f"调用DeepSeek模型时出错: {str(e)}")
+
+    # 默认使用智谱 AI 模型
+    return await call_zhipuai_model_async(prompt, system_prompt, stream)
+
+
+async def perform_search_async(query, engine="search_std", count=10, **kwargs):
+    """
+    异步执行搜索，参数和返回值与同步版本的 perform_search 相同
+    """
+    # 联合搜索：并发调用多个搜索引擎并融合结果（各引擎的结果分别缓存）
+    if engine == federated_search.FEDERATED_ENGINE:
+        return await federated_search.search_async(perform_search_async, query, count, **kwargs)
+
+    # 根据搜索引擎准备搜索参数，不支持的搜索引擎返回空结果
+    search_params = get_search_params(engine, **kwargs)
+    if search_params is None:
+        return []
+
+    # 先查询搜索结果缓存
+    cache_key = search_cache.make_key(engine, query, count, **search_params)
+    cached_results = search_cache.get(cache_key)
+    if cached_results is not None:
+        logger.info("搜索结果缓存命中: %s (%s)", query, engine)
+        return cached_results
+
+    with tracing.span('perform_search', engine=engine, query=query), \
+            metrics.measure(metrics.SEARCH_LATENCY, engine=engine):
+        if engine.startswith("search_"):
+            search_result = await zhipuai.search_async(query, engine)
+        elif engine == "bochaai":
+            search_result = await bochaai.search_async(query, count=count, **search_params)
+        else:
+            logger.debug("SearXNG搜索参数: %s", search_params)
+            search_result = await searxng.search_async(query, count=count, **search_params)
+
+    return cache_search_result(cache_key, engine, search_result)
+
+
+async def analyze_query_async(query, model_id=None):
+    """
+    异步分析用户查询，参数和返回值与同步版本的 analyze_query 相同
+    """
+    logger.info("开始一次性分析用户查询: %s", query)
+
+    # 先使用分析缓存和本地快速分类，命中时跳过大模型调用
+    analysis, classification = analyze_query_locally(query, model_id)
+    if analysis is not None:
+        return analysis
+
+    task_prompt = f"任务类型: ANALYZE_QUERY\n用户问题: {query}"
+    response = await call_llm_model_async(task_prompt, get_intelligent_search_prompt(), model_id)
+    return parse_analysis_response(query, model_id, response, classification)
+
+
+async def search_keywords_async(query, keywords, engine, count, speculative_search=None, **kwargs):
+    """
+    异步并发搜索所有关键词，并合并推测搜索的结果，参数和返回值与同步版本的 search_keywords 相同
+    """
+    if speculative_search is None:
+        return await search_executor.run_concurrent_searches_async(perform_search_async, keywords, engine, count, **kwargs)
+
+    # 原始问题已经在推测搜索中执行，不再重复搜索
+    other_keywords = [keyword for keyword in keywords if keyword != query]
+    keyword_searches = await search_executor.run_concurrent_searches_async(
+        perform_search_async, other_keywords, engine, count, **kwargs
+    )
+    speculative_slot = await speculative_search.collect()
+    return insert_speculative_slot(keyword_searches, speculative_slot, query, keywords)
+
+
+async def _format_stream(events, model_id):
+    """格式化模型的流式输出事件并序列化为数据块，与同步版本的 stream_frames 相同"""
+    event_count = 0
+    try:
+        async for event in sse_events.format_content_async(events, new_stream_formatter(model_id)):
+            event_count += 1
+            yield sse_events.serialize(event)
+    except Exception as e:
+        logger.exception("处理模型流时出错: %s", e)
+        for event in sse_events.error_events(f"处理模型响应流时发生错误: {e}"):
+            yield sse_events.serialize(event)
+
+    logger.debug("流式输出已处理 %s 个事件", event_count)
+
+
+def trace_stream_async(lines):
+    """启用耗时追踪时，在流式输出的最后发送耗时数据块，未启用时原样返回"""
+    trace = tracing.current_trace()
+    if trace is None:
+        return lines
+    return tracing.trace_stream_async(trace, lines)
+
+
+@tracing.trace_request_async
+async def chat_with_intelligent_search_async(query, engine="search_std", count=10, model_id=None, stream=False,
+                                             skip_analysis=False, speculative=None, **kwargs):
+    """
+    异步智能联网搜索聊天，参数与同步版本的 chat_with_intelligent_search 相同
+
+    Returns:
+        dict: 包含搜索结果和AI回复的字典（启用耗时追踪时包含 timings 字段）；
+            流式输出时返回逐行输出 SSE 数据的异步生成器
+    """
+    logger.info("开始处理异步智能联网搜索聊天请求: %s, 搜索引擎: %s, 结果数量: %s, 模型: %s, 流式: %s, 跳过分析: %s",
+                query, engine, count, model_id or '默认', stream, skip_analysis)
+
+    result = new_result(query, engine, model_id)
+
+    # 推测搜索：在分析问题的同时使用原始问题开始搜索
+    speculative_search = None
+    if not skip_analysis and search_executor.is_speculative_enabled(speculative):
+        logger.info("启动推测搜索: %s", query)
+        speculative_search = search_executor.AsyncSpeculativeSearch(perform_search_async, query, engine, count, **kwargs)
+
+    if not skip_analysis:
+        with tracing.span('analyze_query'):
+            need_search, question_type, keywords = await analyze_query_async(query, model_id)
+        record_analysis(result, question_type, keywords)
+    else:
+        need_search, question_type, keywords = skip_analysis_keywords(query, result)
+
+    if need_search:
+        logger.info("正在并发搜索关键词: %s", keywords)
+        with tracing.span('search', keywords=len(keywords)):
+            keyword_searches = await search_keywords_async(query, keywords, engine, count, speculative_search, **kwargs)
+        with tracing.span('format_prompt'):
+            task_prompt = build_answer_task_prompt(result, keyword_searches, query, question_type, model_id, count)
+    else:
+        # 不需要搜索，丢弃推测搜索的结果
+        if speculative_search is not None:
+            speculative_search.discard()
+
+        logger.info("不需要搜索，使用普通聊天模式回答")
+
+        # 先查询回答缓存，命中时直接返回缓存的回答
+        answer_key = answer_cache.make_key(query, model_id, get_intelligent_search_prompt(), stream)
+        cached_answer = answer_cache.get(answer_key)
+        if cached_answer is not None:
+            logger.info("回答缓存命中: %s", query)
+            if stream:
+                return trace_stream_async(answer_cache.replay_stream_async(cached_answer))
+            save_response(result, cached_answer)
+            save_timings(result)
+            return result
+
+        task_prompt = f"任务类型: DIRECT_ANSWER\n用户问题: {query}"
+
+    response = await call_llm_model_async(task_prompt, get_intelligent_search_prompt(), model_id, stream)
+
+    if stream:
+        logger.debug("返回异步流式响应")
+        lines = _format_stream(response, model_id)
+        # 不需要搜索的回答在完整输出后写入回答缓存
+        if not need_search and answer_key is not None:
+            lines = answer_cache.record_stream_async(answer_key, lines)
+        # 耗时数据块在写入回答缓存之后添加，不会被缓存
+        return trace_stream_async(lines)
+
+    if not need_search:
+        answer_cache.put(answer_key, response)
+    save_response(result, response)
+    save_timings(result)
+
+    logger.info("处理完成，返回结果")
+    return result
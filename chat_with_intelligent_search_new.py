@@ -16,21 +16,23 @@ import datetime
 import re
 from urllib.parse import quote
 from dotenv import load_dotenv
+from log_config import get_logger
 
 # 导入 DeepSeek 输出格式化模块
-from format_deepseek_output import format_deepseek_output
+from format_deepseek_output import format_deepseek_output, StreamingFormatter
 
 # 导入智能联网搜索提示词
 from intelligent_search_prompt import (
-    INTELLIGENT_SEARCH_PROMPT,
-    SYSTEM_PROMPT,
-    SEARCH_SYSTEM_PROMPT,
+    get_intelligent_search_prompt,
+    get_system_prompt,
     get_current_time_info
 )
 
 # 加载环境变量
 load_dotenv()
 
+logger = get_logger(__name__)
+
 # 导入搜索引擎模块
 from search_engines import zhipuai, bochaai, searxng
 
@@ -38,16 +40,53 @@ from search_engines import zhipuai, bochaai, searxng
 DEFAULT_MODEL = 'zhipuai'
 
 # 导入格式化搜索结果模块
-from format_search_results_new import format_search_results
+from format_search_results_new import format_search_results, build_search_prompt
 
 import openai
 
 # 导入DeepSeek API模块
 import deepseek_api
 
-def call_zhipuai_model(prompt, system_prompt, stream=False):
+# 导入并发搜索执行模块
+import search_executor
+
+# 导入搜索结果缓存模块
+import search_cache
+
+# 导入查询分析缓存模块
+import analysis_cache
+
+# 导入回答缓存模块
+import answer_cache
+
+# 导入搜索结果去重模块
+import result_dedup
+
+# 导入多引擎联合搜索模块
+import federated_search
+
+# 导入本地查询分类模块
+import query_classifier
+
+# 导入耗时追踪模块
+import tracing
+
+# 导入监控指标模块
+import metrics
+
+# 导入请求取消模块
+import cancellation
+
+# 导入流式输出事件模块
+import sse_events
+from query_classifier import TIME_ONLY_PATTERNS
+
+# 智谱AI API密钥未配置时的回复
+ZHIPUAI_KEY_MISSING_MESSAGE = answer_cache.ErrorResponse("智谱AI API密钥未配置。请在.env文件中设置ZHIPUAI_API_KEY环境变量。")
+
+def build_zhipuai_request(prompt, system_prompt, stream=False):
     """
-    调用智谱AI模型
+    准备智谱AI模型的请求参数
 
     Args:
         prompt: 用户提示
@@ -55,12 +94,12 @@ def call_zhipuai_model(prompt, system_prompt, stream=False):
         stream: 是否使用流式输出
 
     Returns:
-        智谱AI模型的回复或流式响应对象
+        tuple: (请求URL, 请求负载, 请求头)，API密钥未配置时返回 None
     """
     # 获取API密钥和URL
     api_key = os.getenv('ZHIPUAI_API_KEY')
     if not api_key:
-        return "智谱AI API密钥未配置。请在.env文件中设置ZHIPUAI_API_KEY环境变量。"
+        return None
 
     url = os.getenv('ZHIPUAI_API_URL')
     model = os.getenv('ZHIPUAI_MODEL')
@@ -84,82 +123,120 @@ def call_zhipuai_model(prompt, system_prompt, stream=False):
         "top_p": float(os.getenv('ZHIPUAI_TOP_P', 0.8)),
         "stream": stream
     }
+    return url, payload, headers
+
+def parse_zhipuai_result(result):
+    """
+    从智谱AI模型的非流式响应中提取回复内容
+
+    Args:
+        result: 解析后的响应JSON
+
+    Returns:
+        str: 回复内容
+    """
+    metrics.record_token_usage(result.get('model'), result.get('usage'))
+    if 'choices' in result and len(result['choices']) > 0:
+        content = result['choices'][0]['message']['content']
+        logger.info("智谱AI模型调用完成，响应类型: 普通响应，响应内容长度: %s", len(content))
+        return content
+    else:
+        logger.warning("智谱AI模型调用完成，但未返回有效回复")
+        return answer_cache.ErrorResponse("智谱AI模型未返回有效回复。")
+
+def call_zhipuai_model(prompt, system_prompt, stream=False):
+    """
+    调用智谱AI模型
+
+    Args:
+        prompt: 用户提示
+        system_prompt: 系统提示
+        stream: 是否使用流式输出
+
+    Returns:
+        智谱AI模型的回复，流式输出时返回事件迭代器（见 sse_events）
+    """
+    zhipuai_request = build_zhipuai_request(prompt, system_prompt, stream)
+    if zhipuai_request is None:
+        return iter(sse_events.error_events(ZHIPUAI_KEY_MISSING_MESSAGE)) if stream else ZHIPUAI_KEY_MISSING_MESSAGE
+    url, payload, headers = zhipuai_request
 
     try:
         # 发送请求
         if stream:
             # 流式输出模式
-            response = requests.post(url, json=payload, headers=headers, stream=True, timeout=60)
-            response.raise_for_status()
-            print(f"=== 智谱AI模型调用完成 ===")
-            print(f"响应类型: 流式输出")
-            print(f"响应状态码: {response.status_code}\n")
-            return response  # 返回原始响应对象，由调用者处理流式输出
+            with tracing.span('llm', model=payload['model'], stream=True), \
+                    metrics.measure(metrics.LLM_LATENCY, 'llm', model=payload['model'], stream='true'):
+                response = requests.post(url, json=payload, headers=headers, stream=True, timeout=60)
+                response.raise_for_status()
+            logger.info("智谱AI模型调用完成，响应类型: 流式输出，响应状态码: %s", response.status_code)
+            # 每个数据行在这里解析一次，之后的流水线只处理事件对象
+            return sse_events.parse_lines(response.iter_lines(), response)
         else:
             # 非流式模式
-            response = requests.post(url, json=payload, headers=headers, timeout=60)
-            response.raise_for_status()
+            with tracing.span('llm', model=payload['model'], stream=False), \
+                    metrics.measure(metrics.LLM_LATENCY, 'llm', model=payload['model'], stream='false'):
+                response = requests.post(url, json=payload, headers=headers, timeout=60)
+                response.raise_for_status()
 
             # 解析响应
-            result = response.json()
-            if 'choices' in result and len(result['choices']) > 0:
-                content = result['choices'][0]['message']['content']
-                print(f"=== 智谱AI模型调用完成 ===")
-                print(f"响应类型: 普通响应")
-                print(f"响应状态码: {response.status_code}")
-                print(f"响应内容长度: {len(content)}\n")
-                return content
-            else:
-                print(f"=== 智谱AI模型调用完成，但未返回有效回复 ===\n")
-                return "智谱AI模型未返回有效回复。"
+            logger.debug("响应状态码: %s", response.status_code)
+            return parse_zhipuai_result(response.json())
 
     except Exception as e:
-        print(f"=== 智谱AI模型调用出错 ===")
-        print(f"错误信息: {str(e)}\n")
-        error_message = f"调用智谱AI模型时出错: {str(e)}"
+        logger.error("智谱AI模型调用出错: %s", e)
+        error_message = answer_cache.ErrorResponse(f"调用智谱AI模型时出错: {str(e)}")
 
-        # 如果是流式输出模式，返回一个带有iter_lines方法的对象
+        # 如果是流式输出模式，返回只包含错误消息和结束标记的事件
         if stream:
-            class ErrorResponse:
-                def __init__(self, error_message):
-                    self.error_message = error_message
-
-                def iter_lines(self, *args, **kwargs):
-                    # 返回一个只包含错误消息的迭代器
-                    error_data = {
-                        "error": f"调用智谱AI模型时出错: {self.error_message}"
-                    }
-                    yield f"data: {json.dumps(error_data)}\n\n"
-
-                    # 发送结束消息
-                    yield f"data: {{\"done\": true}}\n\n"
-                    # yield f"data: [DONE]\n\n" # 移除多余的结束标记
-
-            return ErrorResponse(error_message)
+            return iter(sse_events.error_events(f"调用智谱AI模型时出错: {error_message}"))
         else:
             return error_message
 
-def call_llm_model(prompt, system_prompt=SYSTEM_PROMPT, model_id=None, stream=False):
+def format_deepseek_result(result):
+    """
+    格式化 DeepSeek 模型的非流式回复
+
+    Args:
+        result: deepseek_api.extract_response_content 的返回值
+
+    Returns:
+        str 或 dict: 格式化后的回复，有推理内容时返回包含 content 和 reasoning_content 的字典
+    """
+    # 格式化 DeepSeek 输出
+    formatted_content = format_deepseek_output(result['content'])
+
+    # 如果有推理内容，返回字典
+    if 'reasoning_content' in result:
+        return {
+            "content": formatted_content,
+            "reasoning_content": result['reasoning_content']
+        }
+    return formatted_content
+
+def log_llm_call(prompt, system_prompt, model_id, stream):
+    """记录调用大模型的日志"""
+    system_prompt_type = "INTELLIGENT_SEARCH_PROMPT" if system_prompt == get_intelligent_search_prompt() else "SYSTEM_PROMPT"
+    logger.info("正在调用大模型: 提示词类型: %s, 提示词长度: %s, 模型 ID: %s, 流式输出: %s",
+                system_prompt_type, len(prompt), model_id or '默认', stream)
+
+def call_llm_model(prompt, system_prompt=None, model_id=None, stream=False):
     """
     调用大模型
 
     Args:
         prompt: 用户提示
-        system_prompt: 系统提示
+        system_prompt: 系统提示，默认为基本系统提示词
         model_id: 模型标识符
         stream: 是否使用流式输出
 
     Returns:
-        大模型的回复或流式响应对象
+        大模型的回复，流式输出时返回输出事件的迭代器（见 sse_events）
     """
+    system_prompt = system_prompt or get_system_prompt()
+
     # 记录调用大模型的日志
-    system_prompt_type = "SEARCH_SYSTEM_PROMPT" if system_prompt == SEARCH_SYSTEM_PROMPT else \
-                        "INTELLIGENT_SEARCH_PROMPT" if system_prompt == INTELLIGENT_SEARCH_PROMPT else "SYSTEM_PROMPT"
-    print(f"\n=== 正在调用大模型 ===")
-    print(f"提示词类型: {system_prompt_type}")
-    print(f"提示词长度: {len(prompt)}")
-    print(f"模型 ID: {model_id or '默认'}")
-    print(f"流式输出: {stream}")
+    log_llm_call(prompt, system_prompt, model_id, stream)
 
     # 准备消息
     messages = [
@@ -176,57 +253,23 @@ def call_llm_model(prompt, system_prompt=SYSTEM_PROMPT, model_id=None, stream=Fa
 
             if stream:
                 # 流式输出模式
-                response = deepseek_api.chat(messages, stream=True, model=model_name)
-
-                # 创建一个带有 iter_lines 方法的对象，以兼容现有代码
-                class StreamResponse:
-                    def __init__(self, stream_generator):
-                        self.stream_generator = stream_generator
-
-                    def iter_lines(self, *args, **kwargs):
-                        for chunk in self.stream_generator:
-                            yield chunk
-
-                return StreamResponse(deepseek_api.format_stream_for_flask(response))
+                with tracing.span('llm', model=model_name, stream=True), \
+                        metrics.measure(metrics.LLM_LATENCY, 'llm', model=model_name, stream='true'):
+                    response = deepseek_api.chat(messages, stream=True, model=model_name)
+                return deepseek_api.stream_events(response)
             else:
                 # 非流式模式
-                response = deepseek_api.chat(messages, stream=False, model=model_name)
-                result = deepseek_api.extract_response_content(response)
-
-                # 如果有推理内容，返回字典
-                if 'reasoning_content' in result:
-                    # 格式化 DeepSeek 输出
-                    formatted_content = format_deepseek_output(result['content'])
-                    return {
-                        "content": formatted_content,
-                        "reasoning_content": result['reasoning_content']
-                    }
-                else:
-                    # 格式化 DeepSeek 输出
-                    formatted_content = format_deepseek_output(result['content'])
-                    return formatted_content
+                with tracing.span('llm', model=model_name, stream=False), \
+                        metrics.measure(metrics.LLM_LATENCY, 'llm', model=model_name, stream='false'):
+                    response = deepseek_api.chat(messages, stream=False, model=model_name)
+                return format_deepseek_result(deepseek_api.extract_response_content(response))
         except Exception as e:
-            error_message = f"调用DeepSeek模型时出错: {str(e)}"
-            print(f"=== DeepSeek 模型调用出错 ===")
-            print(f"错误信息: {str(e)}\n")
+            error_message = answer_cache.ErrorResponse(f"调用DeepSeek模型时出错: {str(e)}")
+            logger.error("DeepSeek 模型调用出错: %s", e)
 
-            # 如果是流式输出模式，返回一个带有iter_lines方法的对象
+            # 如果是流式输出模式，返回只包含错误消息和结束标记的事件
             if stream:
-                class ErrorResponse:
-                    def __init__(self, error_message):
-                        self.error_message = error_message
-
-                    def iter_lines(self, *args, **kwargs):
-                        # 返回一个只包含错误消息的迭代器
-                        error_data = {
-                            "error": f"调用 DeepSeek 模型时出错: {self.error_message}"
-                        }
-                        yield f"data: {json.dumps(error_data)}\n\n"
-
-                        # 发送结束消息
-                        yield f"data: {{\"done\": true}}\n\n"
-
-                return ErrorResponse(error_message)
+                return iter(sse_events.error_events(f"调用 DeepSeek 模型时出错: {error_message}"))
             else:
                 return error_message
     else:
@@ -244,11 +287,11 @@ def analyze_search_need(query, model_id=None):
     Returns:
         bool: 是否需要搜索
     """
-    print(f"\n>>> 开始分析是否需要搜索: {query}")
+    logger.info("开始分析是否需要搜索: %s", query)
 
     # 使用合并提示词
     task_prompt = f"任务类型: ANALYZE_SEARCH_NEED\n用户问题: {query}"
-    response = call_llm_model(task_prompt, INTELLIGENT_SEARCH_PROMPT, model_id)
+    response = call_llm_model(task_prompt, get_intelligent_search_prompt(), model_id)
 
     # 解析响应 - 修复后的逻辑，支持DeepSeek模型返回的字典格式
     need_search = False
@@ -262,12 +305,12 @@ def analyze_search_need(query, model_id=None):
         need_search = True
 
     if need_search:
-        print(f">>> 分析结果: 需要搜索")
-        print(f">>> 大模型原始响应: {response}\n")
+        logger.info("分析结果: 需要搜索")
+        logger.debug("大模型原始响应: %s", response)
         return True
     else:
-        print(f">>> 分析结果: 不需要搜索")
-        print(f">>> 大模型原始响应: {response}\n")
+        logger.info("分析结果: 不需要搜索")
+        logger.debug("大模型原始响应: %s", response)
         return False
 
 def analyze_question_type(query, model_id=None):
@@ -281,11 +324,11 @@ def analyze_question_type(query, model_id=None):
     Returns:
         str: 问题类型，"开放性问题"或"准确答案问题"
     """
-    print(f"\n>>> 开始分析问题类型: {query}")
+    logger.info("开始分析问题类型: %s", query)
 
     # 使用合并提示词
     task_prompt = f"任务类型: ANALYZE_QUESTION_TYPE\n用户问题: {query}"
-    response = call_llm_model(task_prompt, INTELLIGENT_SEARCH_PROMPT, model_id)
+    response = call_llm_model(task_prompt, get_intelligent_search_prompt(), model_id)
 
     # 解析响应 - 修复后的逻辑，支持DeepSeek模型返回的字典格式
     is_open_question = False
@@ -299,12 +342,12 @@ def analyze_question_type(query, model_id=None):
         is_open_question = True
 
     if is_open_question:
-        print(f">>> 分析结果: 开放性问题")
-        print(f">>> 大模型原始响应: {response}\n")
+        logger.info("分析结果: 开放性问题")
+        logger.debug("大模型原始响应: %s", response)
         return "开放性问题"
     else:
-        print(f">>> 分析结果: 准确答案问题")
-        print(f">>> 大模型原始响应: {response}\n")
+        logger.info("分析结果: 准确答案问题")
+        logger.debug("大模型原始响应: %s", response)
         return "准确答案问题"
 
 def extract_search_keywords(query, model_id=None):
@@ -318,11 +361,11 @@ def extract_search_keywords(query, model_id=None):
     Returns:
         list: 搜索关键词列表
     """
-    print(f"\n>>> 开始提取搜索关键词: {query}")
+    logger.info("开始提取搜索关键词: %s", query)
 
     # 使用合并提示词
     task_prompt = f"任务类型: EXTRACT_KEYWORDS\n用户问题: {query}"
-    response = call_llm_model(task_prompt, INTELLIGENT_SEARCH_PROMPT, model_id)
+    response = call_llm_model(task_prompt, get_intelligent_search_prompt(), model_id)
 
     # 解析响应 - 修复后的逻辑，支持DeepSeek模型返回的字典格式
     response_text = ""
@@ -340,27 +383,18 @@ def extract_search_keywords(query, model_id=None):
 
     if not keywords:
         # 如果没有提取到关键词，使用原始查询
-        print(f">>> 未提取到关键词，使用原始查询: {query}")
-        print(f">>> 大模型原始响应: {response}\n")
+        logger.info("未提取到关键词，使用原始查询: %s", query)
+        logger.debug("大模型原始响应: %s", response)
         return [query]
 
-    # 后处理：检查并删除单独的时间关键词
-    # 时间模式，如"2024年"、"2023年底"等
-    time_patterns = [
-        r'^\d{4}\s*[年月日]?$',  # 匹配年份，如"2024年"、"2024"
-        r'^\d{4}\s*-\s*\d{4}$',  # 匹配年份范围，如"2023-2024"
-        r'^\d{4}\s*[年]\s*\d{1,2}\s*[月]$',  # 匹配年月，如"2024年1月"
-        r'^[上下本今去明][年月周季度]$',  # 匹配相对时间，如"今年"、"上季度"
-    ]
-
-    # 过滤单独的时间关键词
+    # 后处理：检查并删除单独的时间关键词（时间模式见 query_classifier.TIME_ONLY_PATTERNS）
     filtered_keywords = []
     for kw in keywords:
         is_time_only = False
-        for pattern in time_patterns:
+        for pattern in TIME_ONLY_PATTERNS:
             if re.match(pattern, kw):
                 is_time_only = True
-                print(f">>> 过滤单独的时间关键词: {kw}")
+                logger.debug("过滤单独的时间关键词: %s", kw)
                 break
 
         if not is_time_only:
@@ -368,37 +402,33 @@ def extract_search_keywords(query, model_id=None):
 
     # 如果过滤后没有关键词了，使用原始查询
     if not filtered_keywords:
-        print(f">>> 过滤后没有关键词，使用原始查询: {query}")
+        logger.info("过滤后没有关键词，使用原始查询: %s", query)
         return [query]
 
-    print(f">>> 提取的搜索关键词(过滤后): {filtered_keywords}")
-    print(f">>> 大模型原始响应: {response}\n")
+    logger.info("提取的搜索关键词(过滤后): %s", filtered_keywords)
+    logger.debug("大模型原始响应: %s", response)
     return filtered_keywords
 
-def perform_search(query, engine="search_std", count=10, **kwargs):
+def get_search_params(engine, **kwargs):
     """
-    执行搜索
+    根据搜索引擎准备搜索参数
 
     Args:
-        query: 搜索查询
         engine: 搜索引擎
-        count: 结果数量
-        **kwargs: 其他搜索参数
+        **kwargs: 请求中的搜索参数
 
     Returns:
-        list: 搜索结果列表
+        dict: 传递给搜索引擎适配器的参数，不支持的搜索引擎返回 None
     """
-    # 根据搜索引擎执行搜索
+    # 根据搜索引擎准备搜索参数
     if engine.startswith("search_"):
-        # 使用智谱AI搜索
-        search_result = zhipuai.search(query, engine)
+        # 智谱AI搜索不支持额外参数
+        search_params = {}
     elif engine == "bochaai":
-        # 使用Bocha AI搜索
         # 默认使用最近一个月的数据，除非特别指定
         freshness = kwargs.get('freshness', os.getenv('BOCHAAI_DEFAULT_FRESHNESS', 'oneMonth'))
-        search_result = bochaai.search(query, freshness=freshness, count=count)
+        search_params = {'freshness': freshness}
     elif engine == "searxng":
-        # 使用SearXNG搜索
         # 提取SearXNG特殊参数
         searxng_params = {}
 
@@ -419,16 +449,76 @@ def perform_search(query, engine="search_std", count=10, **kwargs):
         if 'time_range' in kwargs:
             searxng_params['time_range'] = kwargs['time_range']
 
-        # 调用SearXNG搜索
-        print(f'SearXNG搜索参数: {searxng_params}')
-        search_result = searxng.search(query, count=count, **searxng_params)
+        search_params = searxng_params
     else:
+        return None
+
+    return search_params
+
+def perform_search(query, engine="search_std", count=10, **kwargs):
+    """
+    执行搜索
+
+    Args:
+        query: 搜索查询
+        engine: 搜索引擎
+        count: 结果数量
+        **kwargs: 其他搜索参数
+
+    Returns:
+        list: 搜索结果列表
+    """
+    # 联合搜索：并发调用多个搜索引擎并融合结果（各引擎的结果分别缓存）
+    if engine == federated_search.FEDERATED_ENGINE:
+        return federated_search.search(perform_search, query, count, **kwargs)
+
+    # 根据搜索引擎准备搜索参数，不支持的搜索引擎返回空结果
+    search_params = get_search_params(engine, **kwargs)
+    if search_params is None:
         return []
 
+    # 先查询搜索结果缓存
+    cache_key = search_cache.make_key(engine, query, count, **search_params)
+    cached_results = search_cache.get(cache_key)
+    if cached_results is not None:
+        logger.info("搜索结果缓存命中: %s (%s)", query, engine)
+        return cached_results
+
+    # 根据搜索引擎执行搜索
+    with tracing.span('perform_search', engine=engine, query=query), \
+            metrics.measure(metrics.SEARCH_LATENCY, engine=engine):
+        if engine.startswith("search_"):
+            # 使用智谱AI搜索
+            search_result = zhipuai.search(query, engine)
+        elif engine == "bochaai":
+            # 使用Bocha AI搜索
+            search_result = bochaai.search(query, count=count, **search_params)
+        else:
+            # 调用SearXNG搜索
+            logger.debug("SearXNG搜索参数: %s", search_params)
+            search_result = searxng.search(query, count=count, **search_params)
+
+    return cache_search_result(cache_key, engine, search_result)
+
+def cache_search_result(cache_key, engine, search_result):
+    """
+    提取搜索引擎适配器返回的结果列表并写入缓存
+
+    Args:
+        cache_key: 搜索结果缓存键
+        engine: 搜索引擎
+        search_result: 搜索引擎适配器的返回值
+
+    Returns:
+        list: 搜索结果列表
+    """
     # 检查搜索结果
     if not search_result or 'search_result' not in search_result or not search_result['search_result']:
         return []
 
+    # 缓存搜索结果（错误结果不会被缓存）
+    search_cache.put(cache_key, engine, search_result['search_result'])
+
     return search_result['search_result']
 
 def analyze_query(query, model_id=None):
@@ -442,12 +532,65 @@ def analyze_query(query, model_id=None):
     Returns:
         tuple: (是否需要搜索, 问题类型, 搜索关键词列表)
     """
-    print(f"\n>>> 开始一次性分析用户查询: {query}")
+    logger.info("开始一次性分析用户查询: %s", query)
+
+    # 先使用分析缓存和本地快速分类，命中时跳过大模型调用
+    analysis, classification = analyze_query_locally(query, model_id)
+    if analysis is not None:
+        return analysis
 
     # 使用合并提示词
     task_prompt = f"任务类型: ANALYZE_QUERY\n用户问题: {query}"
-    response = call_llm_model(task_prompt, INTELLIGENT_SEARCH_PROMPT, model_id)
+    response = call_llm_model(task_prompt, get_intelligent_search_prompt(), model_id)
+    return parse_analysis_response(query, model_id, response, classification)
+
+def analyze_query_locally(query, model_id=None):
+    """
+    不调用大模型分析用户查询：先查询分析缓存，再使用本地快速分类
+
+    Args:
+        query: 用户查询
+        model_id: 模型标识符
+
+    Returns:
+        tuple: (分析结果, 本地分类结果)，分析结果为 (是否需要搜索, 问题类型, 搜索关键词列表)，
+            需要调用大模型时为 None
+    """
+    # 先查询分析缓存，命中时跳过大模型调用
+    cached_analysis = analysis_cache.get(query, model_id)
+    if cached_analysis is not None:
+        need_search, question_type, keywords = cached_analysis
+        # 不需要搜索时关键词为原始查询，使用本次的查询替换缓存中的问题
+        if not need_search:
+            keywords = [query]
+        logger.info("分析缓存命中: 是否需要搜索=%s, 问题类型=%s, 搜索关键词=%s", need_search, question_type, keywords)
+        return (need_search, question_type, keywords), None
+
+    # 本地快速分类，置信度达到阈值时跳过大模型调用
+    classification = query_classifier.classify(query)
+    if query_classifier.should_use(classification):
+        need_search = classification['need_search']
+        question_type = classification['question_type']
+        keywords = classification['keywords']
+        logger.info("本地快速分类命中（规则: %s, 置信度: %s）: 是否需要搜索=%s, 问题类型=%s, 搜索关键词=%s",
+                    classification['rule'], classification['confidence'], need_search, question_type, keywords)
+        return (need_search, question_type, keywords), classification
+
+    return None, classification
+
+def parse_analysis_response(query, model_id, response, classification):
+    """
+    解析大模型返回的查询分析结果
 
+    Args:
+        query: 用户查询
+        model_id: 模型标识符
+        response: 大模型的回复
+        classification: 本地分类结果，用于统计一致率
+
+    Returns:
+        tuple: (是否需要搜索, 问题类型, 搜索关键词列表)
+    """
     # 解析JSON响应
     try:
         # 尝试直接解析JSON
@@ -478,18 +621,18 @@ def analyze_query(query, model_id=None):
             if not keywords or not need_search:
                 keywords = [query]
 
-            print(f">>> 分析结果:")
-            print(f">>> - 是否需要搜索: {need_search}")
-            print(f">>> - 问题类型: {question_type}")
-            print(f">>> - 搜索关键词: {keywords}")
-            print(f">>> 大模型原始响应: {response}\n")
+            logger.info("分析结果: 是否需要搜索=%s, 问题类型=%s, 搜索关键词=%s", need_search, question_type, keywords)
+            logger.debug("大模型原始响应: %s", response)
+
+            # 只缓存成功解析的JSON结果，并记录本地分类与大模型结果是否一致
+            analysis_cache.put(query, model_id, need_search, question_type, keywords)
+            query_classifier.record_agreement(classification, need_search, question_type)
 
             return need_search, question_type, keywords
     except Exception as e:
         # 如果JSON解析失败，尝试从文本中提取信息
-        print(f">>> JSON解析失败: {e}")
-        print(f">>> 尝试从文本中提取信息")
-        print(f">>> 大模型原始响应: {response}\n")
+        logger.warning("JSON解析失败，尝试从文本中提取信息: %s", e)
+        logger.debug("大模型原始响应: %s", response)
 
     # 如果JSON解析失败，使用备用方法提取信息
     # 提取是否需要搜索
@@ -522,37 +665,71 @@ def analyze_query(query, model_id=None):
         except:
             pass
 
-    print(f">>> 从文本中提取的结果:")
-    print(f">>> - 是否需要搜索: {need_search}")
-    print(f">>> - 问题类型: {question_type}")
-    print(f">>> - 搜索关键词: {keywords}")
+    logger.info("从文本中提取的结果: 是否需要搜索=%s, 问题类型=%s, 搜索关键词=%s", need_search, question_type, keywords)
 
     return need_search, question_type, keywords
 
-def chat_with_intelligent_search(query, engine="search_std", count=10, model_id=None, stream=False, skip_analysis=False, **kwargs):
+def search_keywords(query, keywords, engine, count, speculative_search=None, **kwargs):
     """
-    智能联网搜索聊天
+    并发搜索所有关键词，并合并推测搜索的结果
 
     Args:
         query: 用户问题
+        keywords: 搜索关键词列表
         engine: 搜索引擎
         count: 结果数量
-        model_id: 模型标识符
-        stream: 是否使用流式输出
-        skip_analysis: 是否跳过分析步骤，直接搜索
+        speculative_search: 使用原始问题提前开始的推测搜索，没有时为 None
         **kwargs: 其他搜索参数
 
     Returns:
-        dict: 包含搜索结果和AI回复的字典，或者流式响应对象
+        list: 按关键词顺序排列的搜索结果，格式见 search_executor.run_concurrent_searches
     """
-    print(f"\n===================================================")
-    print(f"开始处理智能联网搜索聊天请求: {query}")
-    print(f"搜索引擎: {engine}, 结果数量: {count}, 模型: {model_id or '默认'}, 流式: {stream}")
-    print(f"跳过分析: {skip_analysis}")
-    print(f"===================================================")
+    if speculative_search is None:
+        return search_executor.run_concurrent_searches(perform_search, keywords, engine, count, **kwargs)
 
-    # 初始化结果
-    result = {
+    # 原始问题已经在推测搜索中执行，不再重复搜索
+    other_keywords = [keyword for keyword in keywords if keyword != query]
+    keyword_searches = search_executor.run_concurrent_searches(perform_search, other_keywords, engine, count, **kwargs)
+    check_cancelled(speculative_search)
+    speculative_slot = speculative_search.collect()
+    return insert_speculative_slot(keyword_searches, speculative_slot, query, keywords)
+
+def check_cancelled(speculative_search=None):
+    """
+    请求已取消（客户端已断开连接）时停止处理，不再继续搜索或调用大模型
+
+    Args:
+        speculative_search: 尚未使用的推测搜索，请求已取消时丢弃
+
+    Raises:
+        cancellation.Cancelled: 请求已取消
+    """
+    if cancellation.is_cancelled():
+        if speculative_search is not None:
+            speculative_search.discard()
+        raise cancellation.Cancelled()
+
+def insert_speculative_slot(keyword_searches, speculative_slot, query, keywords):
+    """将推测搜索的结果放入关键词搜索结果：原始问题也是关键词时放在其原有位置，否则放在最后"""
+    if query in keywords:
+        keyword_searches.insert(keywords.index(query), speculative_slot)
+    else:
+        keyword_searches.append(speculative_slot)
+    return keyword_searches
+
+def new_result(query, engine, model_id=None):
+    """
+    初始化智能联网搜索聊天的结果
+
+    Args:
+        query: 用户问题
+        engine: 搜索引擎
+        model_id: 模型标识符
+
+    Returns:
+        dict: 结果字典
+    """
+    return {
         "id": f"chat_search_{int(time.time())}",
         "created": int(time.time()),
         "query": query,
@@ -563,164 +740,247 @@ def chat_with_intelligent_search(query, engine="search_std", count=10, model_id=
         "search_performed": False,
         "question_type": "准确答案问题",  # 默认问题类型
         "reconstructed_queries": [],  # 重构后的搜索关键词
-        "query_reconstructed": False  # 是否进行了问题重构
+        "query_reconstructed": False,  # 是否进行了问题重构
+        "keyword_latencies": [],  # 每个关键词的搜索耗时
+        "merged_duplicates": []  # 去重时被合并的搜索结果
     }
 
+def skip_analysis_keywords(query, result):
+    """跳过分析时直接使用原始查询作为搜索关键词，并记录到结果中"""
+    need_search = True
+    question_type = "准确答案问题"  # 默认问题类型
+    keywords = [query]  # 直接使用原始查询作为关键词
+
+    # 保存问题类型
+    result["question_type"] = question_type
+    result["reconstructed_queries"] = keywords
+    result["query_reconstructed"] = False
+
+    logger.info("跳过分析，直接使用原始查询作为搜索关键词: %s, 默认问题类型: %s", query, question_type)
+    return need_search, question_type, keywords
+
+def record_analysis(result, question_type, keywords):
+    """保存问题类型和重构的关键词"""
+    result["question_type"] = question_type
+    result["reconstructed_queries"] = keywords
+    result["query_reconstructed"] = True
+
+    logger.info("问题重构完成，重构后的搜索关键词: %s", keywords)
+
+def build_answer_task_prompt(result, keyword_searches, query, question_type, model_id, count):
+    """
+    处理关键词搜索结果（合并、去重、限制数量），记录到结果中并准备回答问题的提示词
+
+    Args:
+        result: 结果字典
+        keyword_searches: 按关键词顺序排列的搜索结果
+        query: 用户问题
+        question_type: 问题类型
+        model_id: 模型标识符
+        count: 结果数量
+
+    Returns:
+        str: 调用大模型回答问题的任务提示词
+    """
+    all_results = search_executor.merge_search_results(keyword_searches)
+    result["keyword_latencies"] = search_executor.get_keyword_latencies(keyword_searches)
+
+    # 去重（基于规范化链接和近似重复的摘要内容），保留排名最靠前的结果
+    unique_results, merged_duplicates = result_dedup.deduplicate_results(all_results)
+    result["merged_duplicates"] = merged_duplicates
+
+    # 限制结果数量
+    if len(unique_results) > count:
+        unique_results = unique_results[:count]
+
+    logger.info("搜索完成，共获取到 %s 条结果，去重后保留 %s 条", len(all_results), len(unique_results))
+
+    # 保存搜索结果
+    result["search_results"] = unique_results
+    result["search_performed"] = True
+
+    # 如果有搜索结果，格式化并准备提示词
+    if unique_results:
+        # 按模型的 token 预算格式化搜索结果，传入问题类型
+        formatted_results, prompt_stats = build_search_prompt(unique_results, query, question_type, model_id)
+        result["prompt_stats"] = prompt_stats
+        logger.info("搜索结果已格式化，提示词估算 token 数: %s, 预算: %s, 截断摘要的结果数: %s",
+                    prompt_stats['estimated_tokens'], prompt_stats['token_budget'], prompt_stats['truncated_results'])
+
+        # 准备提示词，使用合并提示词
+        return f"任务类型: ANSWER_WITH_SEARCH\n用户问题: {query}\n\n{formatted_results}"
+
+    # 如果没有搜索结果，使用普通聊天
+    logger.info("搜索结果为空，使用普通聊天模式回答")
+    # 使用INTELLIGENT_SEARCH_PROMPT而不是SYSTEM_PROMPT
+    return f"任务类型: DIRECT_ANSWER\n用户问题: 我尝试搜索了相关信息，但没有找到结果。请基于你已有的知识回答这个问题: {query}"
+
+def new_stream_formatter(model_id):
+    """
+    为一次流式输出创建增量格式化器，只有 DeepSeek 模型的输出需要格式化
+
+    Args:
+        model_id: 模型标识符
+
+    Returns:
+        StreamingFormatter: 增量格式化器，不需要格式化时返回 None
+    """
+    if model_id and model_id.startswith('deepseek'):
+        return StreamingFormatter()
+    return None
+
+def stream_frames(events, model_id):
+    """
+    格式化模型的流式输出事件并序列化为前端格式的数据块
+
+    Args:
+        events: 模型流式输出的事件迭代器（见 sse_events）
+        model_id: 模型标识符，DeepSeek 模型的回答内容会被增量格式化
+
+    Returns:
+        generator: SSE 数据块，出错时输出错误消息和结束标记
+    """
+    event_count = 0
+    try:
+        for event in sse_events.format_content(events, new_stream_formatter(model_id)):
+            event_count += 1
+            yield sse_events.serialize(event)
+    except Exception as e:
+        logger.exception("处理模型流时出错: %s", e)
+        yield from sse_events.to_frames(sse_events.error_events(f"处理模型响应流时发生错误: {e}"))
+    logger.debug("流式输出已处理 %s 个事件", event_count)
+
+def save_response(result, response):
+    """保存AI回复到结果中"""
+    if isinstance(response, dict) and "content" in response and "reasoning_content" in response:
+        # 如果响应是包含推理内容的字典，分别保存内容和推理内容
+        result["response"] = response["content"]
+        result["reasoning_content"] = response["reasoning_content"]
+    else:
+        # 如果响应是普通字符串，直接保存
+        result["response"] = response
+    return result
+
+def save_timings(result):
+    """启用耗时追踪时，结束追踪并将各阶段的耗时保存到结果的 timings 字段中"""
+    trace = tracing.current_trace()
+    if trace is not None:
+        result["timings"] = trace.finish()
+    return result
+
+def trace_stream_response(response):
+    """
+    启用耗时追踪时，在流式响应的最后发送耗时数据块
+
+    Args:
+        response: 带有 iter_lines 方法的流式响应对象
+
+    Returns:
+        带有 iter_lines 方法的流式响应对象，未启用耗时追踪时原样返回
+    """
+    trace = tracing.current_trace()
+    if trace is None:
+        return response
+    return answer_cache.CachedStreamResponse(tracing.trace_stream(trace, response.iter_lines()))
+
+@tracing.trace_request
+def chat_with_intelligent_search(query, engine="search_std", count=10, model_id=None, stream=False, skip_analysis=False, speculative=None, **kwargs):
+    """
+    智能联网搜索聊天
+
+    Args:
+        query: 用户问题
+        engine: 搜索引擎
+        count: 结果数量
+        model_id: 模型标识符
+        stream: 是否使用流式输出
+        skip_analysis: 是否跳过分析步骤，直接搜索
+        speculative: 是否在分析问题的同时使用原始问题进行推测搜索，为 None 时使用 SPECULATIVE_SEARCH_ENABLED 环境变量
+        **kwargs: 其他搜索参数
+
+    Returns:
+        dict: 包含搜索结果和AI回复的字典（启用耗时追踪时包含 timings 字段），或者流式响应对象
+    """
+    logger.info("开始处理智能联网搜索聊天请求: %s, 搜索引擎: %s, 结果数量: %s, 模型: %s, 流式: %s, 跳过分析: %s",
+                query, engine, count, model_id or '默认', stream, skip_analysis)
+
+    # 初始化结果
+    result = new_result(query, engine, model_id)
+
+    # 推测搜索：在分析问题的同时使用原始问题开始搜索
+    speculative_search = None
+    if not skip_analysis and search_executor.is_speculative_enabled(speculative):
+        logger.info("启动推测搜索: %s", query)
+        speculative_search = search_executor.SpeculativeSearch(perform_search, query, engine, count, **kwargs)
+
     # 如果不跳过分析，则进行一次性分析查询
     if not skip_analysis:
         # 一次性分析查询（包括是否需要搜索、问题类型和搜索关键词）
-        need_search, question_type, keywords = analyze_query(query, model_id)
+        with tracing.span('analyze_query'):
+            need_search, question_type, keywords = analyze_query(query, model_id)
 
         # 保存问题类型和重构的关键词
-        result["question_type"] = question_type
-        result["reconstructed_queries"] = keywords
-        result["query_reconstructed"] = True
-
-        print(f">>> 问题重构完成，重构后的搜索关键词: {keywords}")
+        record_analysis(result, question_type, keywords)
     else:
         # 跳过分析，直接搜索
-        need_search = True
-        question_type = "准确答案问题"  # 默认问题类型
-        keywords = [query]  # 直接使用原始查询作为关键词
-
-        # 保存问题类型
-        result["question_type"] = question_type
-        result["reconstructed_queries"] = keywords
-        result["query_reconstructed"] = False
+        need_search, question_type, keywords = skip_analysis_keywords(query, result)
 
-        print(f">>> 跳过分析，直接使用原始查询作为搜索关键词: {query}")
-        print(f">>> 默认问题类型: {question_type}")
+    # 分析问题期间客户端已断开连接时不再搜索和回答
+    check_cancelled(speculative_search)
 
     if need_search:
 
-        # 执行搜索
-        all_results = []
-        for keyword in keywords:
-            print(f"\n>>> 正在搜索关键词: {keyword}")
-            results = perform_search(keyword, engine, count, **kwargs)
-            all_results.extend(results)
-            print(f">>> 搜索关键词 '{keyword}' 完成，获取到 {len(results)} 条结果")
-
-        # 去重（基于链接）
-        unique_results = []
-        seen_urls = set()
-        for result_item in all_results:
-            url = result_item.get('link', '')
-            if url and url not in seen_urls:
-                seen_urls.add(url)
-                unique_results.append(result_item)
-
-        # 限制结果数量
-        if len(unique_results) > count:
-            unique_results = unique_results[:count]
-
-        print(f"\n>>> 搜索完成，共获取到 {len(all_results)} 条结果，去重后保留 {len(unique_results)} 条")
-
-        # 保存搜索结果
-        result["search_results"] = unique_results
-        result["search_performed"] = True
-
-        # 如果有搜索结果，格式化并准备提示词
-        if unique_results:
-            # 格式化搜索结果，传入问题类型
-            formatted_results = format_search_results(unique_results, query, question_type)
-            print(f"\n>>> 搜索结果已格式化，准备调用大模型处理")
-
-            # 准备提示词，使用合并提示词
-            task_prompt = f"任务类型: ANSWER_WITH_SEARCH\n用户问题: {query}\n\n{formatted_results}"
-
-            # 调用大模型
-            print(f"\n>>> 调用大模型处理搜索结果并回答问题")
-            response = call_llm_model(task_prompt, INTELLIGENT_SEARCH_PROMPT, model_id, stream)
-        else:
-            # 如果没有搜索结果，使用普通聊天
-            print(f"\n>>> 搜索结果为空，使用普通聊天模式回答")
-            # 使用INTELLIGENT_SEARCH_PROMPT而不是SYSTEM_PROMPT
-            task_prompt = f"任务类型: DIRECT_ANSWER\n用户问题: 我尝试搜索了相关信息，但没有找到结果。请基于你已有的知识回答这个问题: {query}"
-            response = call_llm_model(task_prompt, INTELLIGENT_SEARCH_PROMPT, model_id, stream)
+        # 并发执行所有关键词的搜索，结果按原始关键词顺序合并
+        logger.info("正在并发搜索关键词: %s", keywords)
+        with tracing.span('search', keywords=len(keywords)):
+            keyword_searches = search_keywords(query, keywords, engine, count, speculative_search, **kwargs)
+        check_cancelled()
+        with tracing.span('format_prompt'):
+            task_prompt = build_answer_task_prompt(result, keyword_searches, query, question_type, model_id, count)
+        response = call_llm_model(task_prompt, get_intelligent_search_prompt(), model_id, stream)
     else:
+        # 不需要搜索，丢弃推测搜索的结果
+        if speculative_search is not None:
+            speculative_search.discard()
+
         # 不需要搜索，使用普通聊天
-        print(f"\n>>> 不需要搜索，使用普通聊天模式回答")
+        logger.info("不需要搜索，使用普通聊天模式回答")
+
+        # 先查询回答缓存，命中时直接返回缓存的回答
+        answer_key = answer_cache.make_key(query, model_id, get_intelligent_search_prompt(), stream)
+        cached_answer = answer_cache.get(answer_key)
+        if cached_answer is not None:
+            logger.info("回答缓存命中: %s", query)
+            if stream:
+                return trace_stream_response(answer_cache.CachedStreamResponse(cached_answer))
+            save_response(result, cached_answer)
+            save_timings(result)
+            return result
+
         # 使用INTELLIGENT_SEARCH_PROMPT而不是SYSTEM_PROMPT
         task_prompt = f"任务类型: DIRECT_ANSWER\n用户问题: {query}"
-        response = call_llm_model(task_prompt, INTELLIGENT_SEARCH_PROMPT, model_id, stream)
+        response = call_llm_model(task_prompt, get_intelligent_search_prompt(), model_id, stream)
+        if not stream:
+            answer_cache.put(answer_key, response)
 
-    # 如果是流式输出，需要修改返回方式
+    # 如果是流式输出，返回逐个输出数据块的流式响应对象
     if stream:
-        # 在流式响应的第一个块中包含搜索结果信息
-        if hasattr(response, 'iter_lines'):
-            original_iter_lines = response.iter_lines
-
-            def modified_iter_lines(*args, **kwargs):
-                # 首先发送一个包含搜索结果和问题类型的特殊块 (如果需要)
-                # 注意：前端目前不直接使用这个块，但保留以备将来使用
-                # search_info = json.dumps({
-                #     "search_results": result["search_results"],
-                #     "question_type": result["question_type"]
-                # })
-                # yield f"data: {search_info}\n\n".encode('utf-8')
-
-                # 然后直接迭代并传递已经格式化好的流式响应
-                line_count = 0
-                try:
-                    for line in original_iter_lines(*args, **kwargs):
-                        line_count += 1
-                        # 打印调试信息
-                        if isinstance(line, bytes):
-                            line_str = line.decode('utf-8')
-                        else:
-                            line_str = line
-                        print(f">>> 原始数据块: {line_str[:100]}...")
-
-                        # 对 DeepSeek 模型的输出进行格式化处理
-                        if model_id and model_id.startswith('deepseek'):
-                            # 解析 JSON 数据
-                            try:
-                                if line_str.startswith('data: '):
-                                    data_json = json.loads(line_str[6:].strip())
-                                    # 只处理普通内容，不处理推理内容
-                                    if 'content' in data_json and not data_json.get('is_reasoning', False):
-                                        # 格式化内容
-                                        data_json['content'] = format_deepseek_output(data_json['content'])
-                                        # 重新构建数据行
-                                        line_str = f"data: {json.dumps(data_json)}\n\n"
-                            except Exception as e:
-                                print(f">>> 格式化 DeepSeek 流式输出时出错: {e}")
-                                # 出错时不修改原始数据
-                                pass
-
-                        yield line_str # 确保返回字符串而非字节
-                except Exception as e:
-                    print(f">>> 处理模型流时出错: {e}")
-                    # 产生一个错误块给前端
-                    error_data = {
-                        "error": f"处理模型响应流时发生错误: {e}"
-                    }
-                    yield f"data: {json.dumps(error_data)}\n\n"
-                    # 确保发送结束标记
-                    yield f"data: {{\"done\": true}}\n\n"
-
-                # 打印统计信息
-                print(f">>> 流式输出已处理 {line_count} 行数据（由模型函数生成）")
-                # 注意：结束标记 (`done: true`) 由模型函数内部的 iter_lines 发送
-
-            response.iter_lines = modified_iter_lines
-
-        print(f"\n>>> 返回流式响应对象")
-        print(f"===================================================")
-        return response
+        # 模型的流式输出（事件）在这里格式化并序列化，结束标记由模型的事件流发送
+        lines = stream_frames(response, model_id)
+
+        # 不需要搜索的回答在完整输出后写入回答缓存
+        if not need_search and answer_key is not None:
+            lines = answer_cache.record_stream(answer_key, lines)
+
+        # 耗时数据块在写入回答缓存之后添加，不会被缓存
+        logger.debug("返回流式响应对象")
+        return trace_stream_response(answer_cache.CachedStreamResponse(lines))
 
     # 保存AI回复
-    if isinstance(response, dict) and "content" in response and "reasoning_content" in response:
-        # 如果响应是包含推理内容的字典，分别保存内容和推理内容
-        result["response"] = response["content"]
-        result["reasoning_content"] = response["reasoning_content"]
-    else:
-        # 如果响应是普通字符串，直接保存
-        result["response"] = response
+    save_response(result, response)
+    save_timings(result)
 
-    print(f"\n>>> 处理完成，返回结果")
-    print(f"===================================================")
+    logger.info("处理完成，返回结果")
     return result
 
 
@@ -7,48 +7,154 @@ DeepSeek API 调用模块
 
 import os
 import json
+import logging
 import time
-from typing import Dict, Any, List, Optional, Union, Generator
-from openai import OpenAI
+import asyncio
+import threading
+import weakref
+from typing import Dict, Any, List, Optional, Union, Generator, AsyncGenerator, Tuple
+import httpx
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
+from log_config import get_logger
+import metrics
+import sse_events
 
 # 加载环境变量
 load_dotenv()
 
-def chat(
-    messages: List[Dict[str, Any]],
-    stream: bool = False,
-    model: str = None,
-    max_tokens: int = None
-) -> Union[Dict[str, Any], Generator]:
+logger = get_logger(__name__)
+
+# 按 (base_url, api_key) 缓存的 OpenAI 客户端，跨请求复用底层 httpx 连接池
+_clients: Dict[Tuple[str, str], OpenAI] = {}
+_clients_lock = threading.Lock()
+
+# 按事件循环缓存的 AsyncOpenAI 客户端（异步客户端绑定到创建它的事件循环）
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _get_pool_settings() -> Tuple[httpx.Limits, httpx.Timeout]:
+    """获取连接池和超时配置"""
+    limits = httpx.Limits(
+        max_connections=int(os.getenv('DEEPSEEK_MAX_CONNECTIONS', '100')),
+        max_keepalive_connections=int(os.getenv('DEEPSEEK_MAX_KEEPALIVE_CONNECTIONS', '20')),
+        keepalive_expiry=float(os.getenv('DEEPSEEK_KEEPALIVE_EXPIRY', '60'))
+    )
+    timeout = httpx.Timeout(
+        float(os.getenv('DEEPSEEK_TIMEOUT', '600')),
+        connect=float(os.getenv('DEEPSEEK_CONNECT_TIMEOUT', '5'))
+    )
+    return limits, timeout
+
+
+def _create_client(api_key: str, base_url: str) -> OpenAI:
     """
-    调用 DeepSeek API 进行对话
+    创建带有连接池配置的 OpenAI 客户端
 
     Args:
-        messages: 对话消息列表
-        stream: 是否使用流式输出
-        model: 使用的模型，默认为环境变量中的 DEEPSEEK_MODEL
-        max_tokens: 最大生成 token 数量
+        api_key: DeepSeek API 密钥
+        base_url: DeepSeek API 地址
 
     Returns:
-        如果 stream=False，返回完整的响应对象
-        如果 stream=True，返回一个生成器，用于流式输出
+        OpenAI 客户端
+    """
+    limits, timeout = _get_pool_settings()
+
+    logger.info("创建 DeepSeek 客户端: base_url=%s, 连接池=%s, 超时=%s", base_url, limits, timeout)
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=timeout,
+        max_retries=int(os.getenv('DEEPSEEK_MAX_RETRIES', '2')),
+        http_client=httpx.Client(limits=limits, timeout=timeout)
+    )
+
+
+def get_client(api_key: str, base_url: str) -> OpenAI:
+    """
+    获取缓存的 OpenAI 客户端，同一 (base_url, api_key) 在进程内只创建一次
+
+    OpenAI 客户端及其 httpx 连接池是线程安全的，可以在多个工作线程之间共享。
+
+    Args:
+        api_key: DeepSeek API 密钥
+        base_url: DeepSeek API 地址
+
+    Returns:
+        OpenAI 客户端
     """
-    # 获取API密钥和URL
+    key = (base_url, api_key)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _create_client(api_key, base_url)
+                _clients[key] = client
+    return client
+
+
+def close_clients() -> None:
+    """关闭所有缓存的客户端并释放连接"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def get_async_client(api_key: str, base_url: str) -> AsyncOpenAI:
+    """
+    获取当前事件循环缓存的 AsyncOpenAI 客户端
+
+    Args:
+        api_key: DeepSeek API 密钥
+        base_url: DeepSeek API 地址
+
+    Returns:
+        AsyncOpenAI 客户端
+    """
+    loop_clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    key = (base_url, api_key)
+    client = loop_clients.get(key)
+    if client is None:
+        limits, timeout = _get_pool_settings()
+        logger.info("创建 DeepSeek 异步客户端: base_url=%s, 连接池=%s, 超时=%s", base_url, limits, timeout)
+        client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=timeout,
+            max_retries=int(os.getenv('DEEPSEEK_MAX_RETRIES', '2')),
+            http_client=httpx.AsyncClient(limits=limits, timeout=timeout)
+        )
+        loop_clients[key] = client
+    return client
+
+
+async def close_async_clients() -> None:
+    """关闭当前事件循环缓存的异步客户端并释放连接"""
+    loop_clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in loop_clients.values():
+        await client.close()
+
+
+def _get_api_config() -> Tuple[str, str]:
+    """获取 DeepSeek API 密钥和地址"""
     api_key = os.getenv('DEEPSEEK_API_KEY')
     if not api_key:
         raise ValueError("DeepSeek API密钥未配置。请在.env文件中设置DEEPSEEK_API_KEY环境变量。")
 
     base_url = os.getenv('DEEPSEEK_API_URL', 'https://api.deepseek.com')
-    model_name = model or os.getenv('DEEPSEEK_MODEL', 'deepseek-chat')
+    return api_key, base_url
 
-    # 创建 OpenAI 客户端
-    client = OpenAI(
-        api_key=api_key,
-        base_url=base_url
-    )
 
-    # 准备请求参数
+def _build_params(
+    messages: List[Dict[str, Any]],
+    stream: bool,
+    model: str = None,
+    max_tokens: int = None
+) -> Dict[str, Any]:
+    """准备请求参数"""
+    model_name = model or os.getenv('DEEPSEEK_MODEL', 'deepseek-chat')
     params = {
         "model": model_name,
         "messages": messages,
@@ -64,86 +170,211 @@ def chat(
         params["temperature"] = float(os.getenv('DEEPSEEK_TEMPERATURE', 0.7))
         params["top_p"] = float(os.getenv('DEEPSEEK_TOP_P', 0.8))
 
-    # 打印请求参数
-    print(f"DeepSeek 请求参数: {json.dumps(params, ensure_ascii=False)}")
+    # 记录请求参数（包含完整的提示词，只在启用调试日志时序列化）
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("DeepSeek 请求参数: %s", json.dumps(params, ensure_ascii=False))
+    return params
+
+def chat(
+    messages: List[Dict[str, Any]],
+    stream: bool = False,
+    model: str = None,
+    max_tokens: int = None
+) -> Union[Dict[str, Any], Generator]:
+    """
+    调用 DeepSeek API 进行对话
+
+    Args:
+        messages: 对话消息列表
+        stream: 是否使用流式输出
+        model: 使用的模型，默认为环境变量中的 DEEPSEEK_MODEL
+        max_tokens: 最大生成 token 数量
+
+    Returns:
+        如果 stream=False，返回完整的响应对象
+        如果 stream=True，返回一个生成器，用于流式输出
+    """
+    # 获取缓存的 OpenAI 客户端
+    client = get_client(*_get_api_config())
+
+    # 准备请求参数
+    params = _build_params(messages, stream, model, max_tokens)
 
     try:
         # 发送请求
         if stream:
             # 流式输出模式
             response = client.chat.completions.create(**params)
-            print(f"=== DeepSeek 模型调用完成 ===")
-            print(f"响应类型: 流式输出\n")
+            logger.info("DeepSeek 模型调用完成，响应类型: 流式输出")
 
-            # 创建一个生成器，用于流式输出
+            # 创建一个生成器，用于流式输出；生成器被关闭时关闭 HTTP 响应，上游不再继续生成
             def stream_generator():
-                for chunk in response:
-                    yield chunk
+                try:
+                    for chunk in response:
+                        yield chunk
+                finally:
+                    response.close()
 
             return stream_generator()
         else:
             # 非流式模式
             response = client.chat.completions.create(**params)
-            print(f"=== DeepSeek 模型调用完成 ===")
-            print(f"响应类型: 非流式输出\n")
+            logger.info("DeepSeek 模型调用完成，响应类型: 非流式输出")
             return response
 
     except Exception as e:
-        print(f"调用 DeepSeek 模型时出错: {str(e)}")
+        logger.error("调用 DeepSeek 模型时出错: %s", e)
         raise
 
-def format_stream_for_flask(stream_response) -> Generator:
+async def chat_async(
+    messages: List[Dict[str, Any]],
+    stream: bool = False,
+    model: str = None,
+    max_tokens: int = None
+):
     """
-    将 DeepSeek 流式响应格式化为 Flask SSE 格式
+    异步调用 DeepSeek API 进行对话，参数与 chat 相同
+
+    Returns:
+        如果 stream=False，返回完整的响应对象
+        如果 stream=True，返回 AsyncStream，使用 async for 迭代
+    """
+    client = get_async_client(*_get_api_config())
+    params = _build_params(messages, stream, model, max_tokens)
+
+    try:
+        response = await client.chat.completions.create(**params)
+        logger.info("DeepSeek 模型异步调用完成，响应类型: %s", '流式输出' if stream else '非流式输出')
+        return response
+    except Exception as e:
+        logger.error("调用 DeepSeek 模型时出错: %s", e)
+        raise
+
+def _usage_dict(usage) -> Optional[Dict[str, int]]:
+    """将响应中的 usage 对象转换为字典，没有使用统计信息时返回 None"""
+    if not usage:
+        return None
+    # 旧版本 openai 库的流式响应块没有定义 usage 字段，原样保留为字典
+    if isinstance(usage, dict):
+        return {key: usage.get(key) for key in ("prompt_tokens", "completion_tokens", "total_tokens")}
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens
+    }
+
+def _chunk_events(chunk, state: Dict[str, str]) -> Tuple[List[sse_events.Event], bool]:
+    """
+    将一个 DeepSeek 流式响应块转换为流式输出事件
 
     Args:
-        stream_response: DeepSeek 流式响应
+        chunk: DeepSeek 流式响应块
+        state: 累积的 full_content 和 reasoning_content
 
     Returns:
-        生成器，用于 Flask SSE 输出
+        tuple: (事件列表, 是否已结束)
     """
-    try:
-        # 首先发送一个特殊的消息，表示流式输出开始
-        yield f"data: {{\"role\": \"assistant\", \"content\": \"\"}}\n\n"
+    # 带有使用统计信息的响应块（通常为最后一块）计入 token 消耗
+    usage = getattr(chunk, 'usage', None)
+    if usage:
+        metrics.record_token_usage(getattr(chunk, 'model', None), _usage_dict(usage))
+
+    events = []
+    choice = chunk.choices[0]
+    delta = choice.delta
+
+    # 处理推理内容 (deepseek-reasoner 模型特有)
+    reasoning = getattr(delta, 'reasoning_content', None)
+    if reasoning:
+        state['reasoning_content'] += reasoning
+        return [sse_events.Event(sse_events.REASONING, reasoning)], False
+
+    # 处理普通内容
+    if delta.content:
+        state['full_content'] += delta.content
+        events.append(sse_events.Event(sse_events.CONTENT, delta.content))
+
+    # 处理结束消息
+    if choice.finish_reason:
+        # 发送完整的推理内容和普通内容
+        if state['reasoning_content']:
+            # 保留推理内容信息，但不影响最终结果的格式
+            events.append(sse_events.Event(sse_events.DATA, data={
+                "reasoning_content": state['reasoning_content'],
+                "full_content": state['full_content']
+            }))
+        events.append(sse_events.DONE_EVENT)
+        return events, True
+
+    return events, False
+
+def _stream_error_events(e: Exception) -> List[sse_events.Event]:
+    """流式输出出错时发送的事件"""
+    logger.error("格式化流式响应时出错: %s", e)
+    return sse_events.error_events(str(e))
+
+def stream_events(stream_response) -> Generator[sse_events.Event, None, None]:
+    """
+    将 DeepSeek 流式响应转换为流式输出事件（响应块是已解析的对象，不需要 JSON 解析）
 
-        full_content = ""
-        reasoning_content = ""
+    Args:
+        stream_response: DeepSeek 流式响应
 
+    Returns:
+        生成器: 事件，出错时输出错误消息和结束标记
+    """
+    try:
+        state = {'full_content': '', 'reasoning_content': ''}
         for chunk in stream_response:
-            # 处理推理内容 (deepseek-reasoner 模型特有)
-            if hasattr(chunk.choices[0].delta, 'reasoning_content') and chunk.choices[0].delta.reasoning_content:
-                reasoning = chunk.choices[0].delta.reasoning_content
-                reasoning_content += reasoning
-                # 发送推理内容 - 使用与智谱AI模型兼容的格式，但添加is_reasoning标记
-                yield f"data: {{\"is_reasoning\": true, \"content\": {json.dumps(reasoning)}}}\n\n"
-                continue
-
-            # 处理普通内容
-            if hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content is not None:
-                content = chunk.choices[0].delta.content
-                full_content += content
-                # 发送普通内容 - 使用与智谱AI模型兼容的格式
-                yield f"data: {{\"content\": {json.dumps(content)}}}\n\n"
-
-            # 处理结束消息
-            if chunk.choices[0].finish_reason:
-                # 发送完整的推理内容和普通内容
-                if reasoning_content:
-                    # 保留推理内容信息，但不影响最终结果的格式
-                    yield f"data: {{\"reasoning_content\": {json.dumps(reasoning_content)}, \"full_content\": {json.dumps(full_content)}}}\n\n"
-
-                # 发送结束消息
-                yield f"data: {{\"done\": true}}\n\n"
-                yield f"data: [DONE]\n\n"
+            events, finished = _chunk_events(chunk, state)
+            yield from events
+            if finished:
                 break
+    except Exception as e:
+        yield from _stream_error_events(e)
+    finally:
+        # 读取结束或提前停止读取（客户端断开连接）时关闭响应，上游不再继续生成
+        close = getattr(stream_response, 'close', None)
+        if close is not None:
+            close()
+
+async def stream_events_async(stream_response) -> AsyncGenerator[sse_events.Event, None]:
+    """
+    stream_events 的异步版本
 
+    Args:
+        stream_response: chat_async 返回的 AsyncStream
+
+    Returns:
+        异步生成器: 事件
+    """
+    try:
+        state = {'full_content': '', 'reasoning_content': ''}
+        async for chunk in stream_response:
+            events, finished = _chunk_events(chunk, state)
+            for event in events:
+                yield event
+            if finished:
+                break
     except Exception as e:
-        print(f"格式化流式响应时出错: {str(e)}")
-        # 发送错误消息
-        yield f"data: {{\"error\": {json.dumps(str(e))}}}\n\n"
-        # 确保在错误后也发送 done 标记
-        yield f"data: {{\"done\": true}}\n\n"
-        yield f"data: [DONE]\n\n"
+        for event in _stream_error_events(e):
+            yield event
+    finally:
+        await stream_response.close()
+
+def format_stream_for_flask(stream_response) -> Generator:
+    """
+    将 DeepSeek 流式响应格式化为 Flask SSE 格式
+
+    Args:
+        stream_response: DeepSeek 流式响应
+
+    Returns:
+        生成器，用于 Flask SSE 输出
+    """
+    # 首先发送一个特殊的消息，表示流式输出开始
+    yield sse_events.ROLE_FRAME
+    yield from sse_events.to_frames(stream_events(stream_response))
 
 def extract_response_content(response) -> Dict[str, Any]:
     """
@@ -164,13 +395,10 @@ def extract_response_content(response) -> Dict[str, Any]:
     if hasattr(response.choices[0].message, 'reasoning_content') and response.choices[0].message.reasoning_content:
         result["reasoning_content"] = response.choices[0].message.reasoning_content
 
-    # 添加使用统计信息
+    # 添加使用统计信息，并计入 token 消耗
     if hasattr(response, 'usage') and response.usage:
-        result["usage"] = {
-            "prompt_tokens": response.usage.prompt_tokens,
-            "completion_tokens": response.usage.completion_tokens,
-            "total_tokens": response.usage.total_tokens
-        }
+        result["usage"] = _usage_dict(response.usage)
+        metrics.record_token_usage(getattr(response, 'model', None), result["usage"])
 
     return result
 
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+多引擎联合搜索模块
+
+这个模块在共享的截止时间内并发调用多个已配置的搜索引擎，
+使用倒数排名融合（Reciprocal Rank Fusion, RRF）合并各引擎的排序结果并跨引擎去重。
+截止时间从联合搜索开始时计算（包括在线程池中排队的时间），到达时直接使用已返回的结果，
+不等待最慢的搜索引擎。作为关键词搜索的一部分执行时，截止时间不超过外层关键词搜索剩余的时间，
+确保融合后的结果在外层截止之前返回。
+"""
+
+import os
+from dotenv import load_dotenv
+
+import search_executor
+from result_dedup import canonicalize_url
+from log_config import get_logger
+
+# 加载环境变量
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# 联合搜索的引擎名称
+FEDERATED_ENGINE = 'federated'
+
+# 可参与联合搜索的搜索引擎
+SUPPORTED_ENGINES = ['search_std', 'bochaai', 'searxng']
+
+# 在外层关键词搜索截止之前预留的时间（秒），用于融合结果并返回
+OUTER_DEADLINE_MARGIN = 0.5
+
+
+def get_engines():
+    """
+    获取参与联合搜索的搜索引擎列表
+
+    Returns:
+        list: 搜索引擎列表，来自 FEDERATED_SEARCH_ENGINES 环境变量
+    """
+    value = os.getenv('FEDERATED_SEARCH_ENGINES', 'search_std,bochaai,searxng')
+    engines = []
+    for engine in value.split(','):
+        engine = engine.strip()
+        if engine in SUPPORTED_ENGINES and engine not in engines:
+            engines.append(engine)
+    return engines
+
+
+def get_deadline():
+    """
+    获取联合搜索的截止时间（秒）
+
+    Returns:
+        float: FEDERATED_SEARCH_DEADLINE 环境变量（默认为8秒），
+            在关键词搜索中执行时不超过外层剩余的时间减去预留时间
+    """
+    deadline = float(os.getenv('FEDERATED_SEARCH_DEADLINE', '8'))
+    time_left = search_executor.get_time_left()
+    if time_left is not None:
+        deadline = min(deadline, max(0.0, time_left - OUTER_DEADLINE_MARGIN))
+    return deadline
+
+
+def get_rrf_k():
+    """获取倒数排名融合的平滑常数 k，默认为60"""
+    return float(os.getenv('FEDERATED_RRF_K', '60'))
+
+
+def _is_valid_result(item):
+    """过滤错误结果和没有链接的结果"""
+    link = item.get('link', '')
+    return item.get('refer') != '错误' and link and link != '#'
+
+
+def reciprocal_rank_fusion(ranked_lists, k=60):
+    """
+    使用倒数排名融合合并多个排序结果列表
+
+    每个结果的得分为其在各列表中 1 / (k + 排名) 之和，按规范化后的链接去重，
+    保留排名最靠前的列表中的结果项，得分相同时按首次出现的顺序排列。
+
+    Args:
+        ranked_lists: [(搜索引擎, 结果列表)] 列表
+        k: 平滑常数
+
+    Returns:
+        list: 融合后的结果列表，每项增加 rrf_score 和 federated_engines 字段
+    """
+    fused = {}
+    order = []
+    for engine, results in ranked_lists:
+        rank = 0
+        for item in results:
+            if not _is_valid_result(item):
+                continue
+            rank += 1
+            link = canonicalize_url(item['link'])
+            entry = fused.get(link)
+            if entry is None:
+                entry = dict(item)
+                entry['rrf_score'] = 0.0
+                entry['federated_engines'] = []
+                fused[link] = entry
+                order.append(link)
+            entry['rrf_score'] += 1.0 / (k + rank)
+            if engine not in entry['federated_engines']:
+                entry['federated_engines'].append(engine)
+
+    # 按得分从高到低排序，得分相同时保持首次出现的顺序
+    positions = {link: index for index, link in enumerate(order)}
+    merged = sorted(fused.items(), key=lambda pair: (-pair[1]['rrf_score'], positions[pair[0]]))
+    merged = [entry for _, entry in merged]
+    for entry in merged:
+        entry['rrf_score'] = round(entry['rrf_score'], 6)
+    return merged
+
+
+def _search_engine(engine, search_func, query, count, kwargs):
+    """调用单个搜索引擎"""
+    return search_func(query, engine, count, **kwargs)
+
+
+def search(search_func, query, count=10, **kwargs):
+    """
+    使用多个搜索引擎执行联合搜索
+
+    Args:
+        search_func: 单引擎搜索函数，签名为 search_func(query, engine, count, **kwargs)
+        query: 搜索查询
+        count: 结果数量
+        **kwargs: 传递给各搜索引擎的其他参数
+
+    Returns:
+        list: 融合后的搜索结果列表
+    """
+    engines = get_engines()
+    deadline = get_deadline()
+    logger.info("联合搜索: %s, 搜索引擎: %s, 截止时间: %s 秒", query, engines, deadline)
+
+    # 使用独立的线程池，避免与外层的关键词并发搜索互相占用线程
+    engine_searches = search_executor.run_concurrent_searches(
+        _search_engine, engines, search_func, query, count, kwargs,
+        deadline=deadline,
+        executor=search_executor.get_executor('federated')
+    )
+
+    ranked_lists = [(item['keyword'], item['results']) for item in engine_searches if item['status'] == 'ok']
+    merged = reciprocal_rank_fusion(ranked_lists, get_rrf_k())
+
+    arrived = [engine for engine, _ in ranked_lists]
+    logger.info("联合搜索完成: 已返回的搜索引擎 %s，融合后 %s 条结果", arrived, len(merged))
+    return merged[:count]
+
+
+async def _search_engine_async(engine, search_func, query, count, kwargs):
+    """异步调用单个搜索引擎"""
+    return await search_func(query, engine, count, **kwargs)
+
+
+async def search_async(search_func, query, count=10, **kwargs):
+    """
+    使用多个搜索引擎执行异步联合搜索，参数和返回值与 search 相同，
+    其中 search_func 为异步单引擎搜索函数
+    """
+    engines = get_engines()
+    deadline = get_deadline()
+    logger.info("异步联合搜索: %s, 搜索引擎: %s, 截止时间: %s 秒", query, engines, deadline)
+
+    engine_searches = await search_executor.run_concurrent_searches_async(
+        _search_engine_async, engines, search_func, query, count, kwargs,
+        deadline=deadline
+    )
+
+    ranked_lists = [(item['keyword'], item['results']) for item in engine_searches if item['status'] == 'ok']
+    merged = reciprocal_rank_fusion(ranked_lists, get_rrf_k())
+
+    arrived = [engine for engine, _ in ranked_lists]
+    logger.info("异步联合搜索完成: 已返回的搜索引擎 %s，融合后 %s 条结果", arrived, len(merged))
+    return merged[:count]
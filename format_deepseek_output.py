@@ -6,10 +6,61 @@ DeepSeek Reasoner 模型输出格式化模块
 
 这个模块提供了格式化 DeepSeek Reasoner 模型输出的功能，
 使其展示效果与智谱 AI 模型一样好。
+
+流式输出使用 StreamingFormatter：标题、表格和引用可能跨越数据块，
+因此只在安全的行边界处分段格式化，输出与对完整内容调用 format_deepseek_output 的结果完全相同。
 """
 
 import re
 
+# 格式化规则表：所有正则表达式在导入时编译一次
+# 标题：将 #### 格式的标题转换为标准 Markdown 标题
+HEADING_RE = re.compile(r'#{1,4}\s+([一二三四五六七八九十、]+、*)?([^#\n]+)')
+# 引用：(来源[1])、(来源[1][2])、(来源[1][2][3]) 和 （来源[1]） 在一次扫描中转换为 [参考文献N]
+CITATION_RE = re.compile(r'\(来源\[(\d+)\](?:\[(\d+)\](?:\[(\d+)\])?)?\)|（来源\[(\d+)\]）')
+# 编号列表项：带引用的标题行和不带引用的标题行
+NUMBERED_ITEM_RES = (
+    re.compile(r'(\d+)\. ([^\n]+)\s*\[\u53c2\u8003\u6587\u732e\d+\]:'),
+    re.compile(r'(\d+)\. ([^\n:]+):')
+)
+NUMBER_RE = re.compile(r'(\d+)\.')
+SECTION_RE = re.compile(r'^\s*##\s+[一二三四五六七八九十]+、', re.MULTILINE)
+# 表格：按顺序依次处理表格行、表格分隔线和剩余的 | 分隔符
+TABLE_ROW_RE = re.compile(r'\|([^|\n]+)\|([^|\n]+)\|([^|\n]+)\|')
+TABLE_RULES = (
+    (re.compile(r'\|\s*-+\s*\|\s*-+\s*\|'), ''),
+    (re.compile(r'\|([^|\n]+)\|'), r'- \1'),
+    (re.compile(r'([^\n])\|([^\n])'), r'\1\n- \2')
+)
+# 排版：确保段落之间有适当的空行
+PARAGRAPH_RULES = (
+    (re.compile(r'\n{3,}'), '\n\n'),  # 将多个连续空行替换为两个空行
+    (re.compile(r'([^\n])\n([^\n])'), r'\1\n\n\2')  # 确保段落之间有空行
+)
+# 列表格式和空白清理
+CLEANUP_RULES = (
+    (re.compile(r'^\s*(\d+)\.\s*', re.MULTILINE), r'\1. '),  # 确保编号列表格式正确
+    (re.compile(r'^\s*[•·]\s*', re.MULTILINE), r'- '),  # 将其他列表标记统一为 -
+    (re.compile(r'\n\s*\n\s*\n'), '\n\n'),  # 删除多余的空行
+    (re.compile(r'\n\s+'), '\n')  # 删除行首空格
+)
+
+
+def apply_rules(content, rules):
+    """
+    按顺序应用一组替换规则
+
+    Args:
+        content: 原始内容
+        rules: (编译后的正则表达式, 替换内容) 列表
+
+    Returns:
+        替换后的内容
+    """
+    for pattern, replacement in rules:
+        content = pattern.sub(replacement, content)
+    return content
+
 
 def format_deepseek_output(content):
     """
@@ -21,58 +72,55 @@ def format_deepseek_output(content):
     Returns:
         格式化后的内容
     """
+    return _format_deepseek_output(content)[0]
+
+
+def _format_deepseek_output(content, section_index=None):
+    """
+    格式化一段内容，编号修复从上一段内容结束时的状态继续
+
+    Args:
+        content: 原始内容
+        section_index: 上一段内容末尾所在部分已有的列表项数量，None 表示尚未进入任何部分
+
+    Returns:
+        tuple: (格式化后的内容, 本段内容末尾所在部分已有的列表项数量)
+    """
     if not content:
-        return content
+        return content, section_index
 
     # 1. 处理标题格式
     # 将 #### 格式的标题转换为标准 Markdown 标题
-    content = re.sub(r'#{1,4}\s+([一二三四五六七八九十、]+、*)?([^#\n]+)',
-                    lambda m: format_heading(m), content)
+    if '#' in content:
+        content = HEADING_RE.sub(format_heading, content)
 
     # 2. 处理引用和参考文献
     # 规范化引用格式
-    content = re.sub(r'\(来源\[(\d+)\]\)', r'[参考文献\1]', content)
-    content = re.sub(r'\(来源\[(\d+)\]\[(\d+)\]\[(\d+)\]\)', r'[参考文献\1][参考文献\2][参考文献\3]', content)
-    content = re.sub(r'（来源\[(\d+)\]）', r'[参考文献\1]', content)
-    content = re.sub(r'\(来源\[(\d+)\]\[(\d+)\]\)', r'[参考文献\1][参考文献\2]', content)
-    # 处理冒号后的引用
-    content = re.sub(r'(\s+)\(来源\[(\d+)\]\):', r'\1[参考文献\2]:', content)
+    if '来源' in content:
+        content = CITATION_RE.sub(format_citation, content)
 
     # 3. 处理编号问题
     # 修复重复的编号
-    content = fix_numbering(content)
+    content, section_index = _fix_numbering(content, section_index)
 
     # 4. 处理分隔符和表格
     # 将表格转换为列表
-    table_pattern = r'\|([^|\n]+)\|([^|\n]+)\|([^|\n]+)\|'
-    content = re.sub(table_pattern, lambda m: format_table_row(m), content)
-
-    # 处理表格分隔线
-    content = re.sub(r'\|\s*-+\s*\|\s*-+\s*\|', '', content)
-
-    # 处理剩余的 | 分隔符
-    content = re.sub(r'\|([^|\n]+)\|', r'- \1', content)
-    content = re.sub(r'([^\n])\|([^\n])', r'\1\n- \2', content)
+    if '|' in content:
+        content = TABLE_ROW_RE.sub(format_table_row, content)
+        content = apply_rules(content, TABLE_RULES)
 
     # 5. 优化整体排版
-    # 确保段落之间有适当的空行
-    content = re.sub(r'\n{3,}', '\n\n', content)  # 将多个连续空行替换为两个空行
-    content = re.sub(r'([^\n])\n([^\n])', r'\1\n\n\2', content)  # 确保段落之间有空行
+    content = apply_rules(content, PARAGRAPH_RULES)
 
     # 6. 处理特殊符号
     # 替换一些可能导致格式问题的特殊符号
     content = content.replace('：', ': ')
 
     # 7. 处理列表格式
-    # 确保列表项有正确的缩进和格式
-    content = re.sub(r'^\s*(\d+)\.\s*', r'\1. ', content, flags=re.MULTILINE)  # 确保编号列表格式正确
-    content = re.sub(r'^\s*[•·]\s*', r'- ', content, flags=re.MULTILINE)  # 将其他列表标记统一为 -
-
     # 8. 清理多余的空行和空格
-    content = re.sub(r'\n\s*\n\s*\n', '\n\n', content)  # 删除多余的空行
-    content = re.sub(r'\n\s+', '\n', content)  # 删除行首空格
+    content = apply_rules(content, CLEANUP_RULES)
 
-    return content
+    return content, section_index
 
 
 def format_heading(match):
@@ -101,6 +149,19 @@ def format_heading(match):
         return f'\n### {prefix}{title}\n'
 
 
+def format_citation(match):
+    """
+    将 (来源[1][2]) 格式的引用转换为 [参考文献1][参考文献2] 格式
+
+    Args:
+        match: CITATION_RE 的匹配对象
+
+    Returns:
+        格式化后的引用
+    """
+    return ''.join(f'[参考文献{number}]' for number in match.groups() if number)
+
+
 def format_table_row(match):
     """
     将表格行转换为列表项
@@ -135,79 +196,185 @@ def fix_numbering(content):
     Returns:
         修复编号后的内容
     """
-    # 首先处理第一级列表项的特殊模式
-    # 匹配形如 "1. 法国双轨制" 的模式
-    pattern1 = r'(\d+)\. ([^\n]+)\s*\[\u53c2\u8003\u6587\u732e\d+\]:'  # 匹配带引用的标题行
-    pattern2 = r'(\d+)\. ([^\n:]+):'  # 匹配不带引用的标题行
+    return _fix_numbering(content)[0]
+
 
-    # 存储所有匹配到的模式
-    matches = []
+def _fix_numbering(content, section_index=None):
+    """
+    修复一段内容中的编号，上一段内容末尾所在的部分延续到本段开头
 
-    # 匹配第一种模式
-    for match in re.finditer(pattern1, content):
-        matches.append((match.start(), match.group()))
+    Args:
+        content: 原始内容
+        section_index: 上一段内容末尾所在部分已有的列表项数量，None 表示尚未进入任何部分
 
-    # 匹配第二种模式
-    for match in re.finditer(pattern2, content):
-        matches.append((match.start(), match.group()))
+    Returns:
+        tuple: (修复编号后的内容, 本段内容末尾所在部分已有的列表项数量)
+    """
+    # 首先处理第一级列表项的特殊模式
+    # 匹配形如 "1. 法国双轨制" 的模式（带引用和不带引用的标题行）
+    # 带引用的标题行以 "]:" 结尾，内容中没有 "]:" 时跳过该模式（逐行回溯查找引用的开销较大）
+    patterns = NUMBERED_ITEM_RES if ']:' in content else NUMBERED_ITEM_RES[1:]
+    if '. ' not in content:
+        matches = []
+    else:
+        matches = [(match.start(), match.group()) for pattern in patterns for match in pattern.finditer(content)]
 
-    # 按位置排序匹配项
+    # 按位置排序匹配项，两种模式匹配到同一列表项（范围重叠）时只保留第一个，避免重复计数和重复替换
     matches.sort()
+    matches = _remove_overlapping(matches)
+
+    # 找到所有的部分标题
+    sections = [m.start() for m in SECTION_RE.finditer(content)] if '##' in content else []
+    # 每个部分的起始编号，上一段内容末尾所在的部分从已有的编号继续
+    section_bases = [0] * len(sections)
+    if section_index is not None:
+        sections.insert(0, 0)
+        section_bases.insert(0, section_index)
+
+    # 本段内容末尾所在部分已有的列表项数量
+    if sections:
+        section_index = section_bases[-1] + sum(1 for match in matches if match[0] >= sections[-1])
 
     # 如果没有匹配项，返回原始内容
     if not matches:
-        return content
-
-    # 处理每个匹配项
-    result = content
-    offset = 0  # 用于跟踪替换后的位置偏移
+        return content, section_index
+
+    # 按顺序扫描一次，每个部分内的列表项从该部分的起始编号开始重新编号，
+    # 替换结果拼接为片段列表，避免每次替换都复制整个字符串
+    pieces = []
+    last = 0
+    current = -1  # 当前列表项所在部分的下标，-1 表示位于第一个部分之前
+    count = 0
+    for pos, text in matches:
+        while current + 1 < len(sections) and sections[current + 1] <= pos:
+            current += 1
+            count = 0
+        # 第一个部分之前的列表项保持原样
+        if current < 0:
+            continue
 
-    # 跟踪当前的部分和编号
-    current_section = 0
-    section_pattern = r'^\s*##\s+[一二三四五六七八九十]+、'
+        count += 1
+        # 新编号是当前列表项在部分中的索引+1（延续的部分从已有的编号继续）
+        old_num = NUMBER_RE.match(text).group(1)
+        new_num = section_bases[current] + count
 
-    # 找到所有的部分标题
-    sections = [m.start() for m in re.finditer(section_pattern, content, re.MULTILINE)]
-    sections.append(len(content))  # 添加文档结尾作为最后一个部分的结束
-
-    # 对每个部分单独处理编号
-    for i in range(len(sections) - 1):
-        section_start = sections[i]
-        section_end = sections[i+1]
-        section_content = content[section_start:section_end]
-
-        # 在当前部分中找到所有的列表项
-        section_matches = []
-        for match in matches:
-            if section_start <= match[0] < section_end:
-                section_matches.append(match)
-
-        # 如果没有列表项，继续下一个部分
-        if not section_matches:
-            continue
+        # 替换编号
+        pieces.append(content[last:pos])
+        pieces.append(text.replace(f"{old_num}.", f"{new_num}."))
+        last = pos + len(text)
 
-        # 处理当前部分的列表项
-        for j, (pos, text) in enumerate(section_matches):
-            # 提取原始编号
-            old_num = re.match(r'(\d+)\.', text).group(1)
-            # 新编号是当前列表项的索引+1
-            new_num = j + 1
+    pieces.append(content[last:])
+    result = ''.join(pieces)
 
-            # 替换编号
-            new_text = text.replace(f"{old_num}.", f"{new_num}.")
+    return result, section_index
 
-            # 计算实际位置（考虑之前的替换导致的偏移）
-            actual_pos = pos + offset
 
-            # 替换文本
-            result = result[:actual_pos] + new_text + result[actual_pos + len(text):]
+def _remove_overlapping(matches):
+    """
+    去除与前一个匹配项范围重叠的匹配项
 
-            # 更新偏移
-            offset += len(new_text) - len(text)
+    Args:
+        matches: 按位置排序的 (位置, 匹配文本) 列表
 
+    Returns:
+        list: 互不重叠的匹配项
+    """
+    result = []
+    end = 0
+    for pos, text in matches:
+        if pos >= end:
+            result.append((pos, text))
+            end = pos + len(text)
     return result
 
 
+# 不能作为分段起点的字符：标题、表格、引用和列表标记的开头以及空白
+UNSAFE_SEGMENT_START = '#|([（•·'
+# 不能作为上一段结尾（最后一个非空白字符）的字符：标题标记和表格分隔符可能与下一行组成一个整体
+UNSAFE_SEGMENT_END = '#|'
+
+
+class StreamingFormatter:
+    """
+    DeepSeek 流式输出的增量格式化器
+
+    格式化规则中的标题、表格分隔线和带引用的编号列表项可能跨越换行，编号修复依赖前文中的部分标题和列表项。
+    格式化器缓存尚未确定的内容，只在安全的行边界（换行之后，下一行不以标题、表格、引用或列表标记开头，
+    上一段不以标题标记或表格分隔符结尾）处分段，分段格式化时延续上一段的编号状态。
+    每段内容只格式化一次，总耗时与内容长度成线性关系，输出最多延迟到下一个安全的行边界。
+
+    所有 feed() 和 flush() 的输出拼接起来，与对完整内容调用 format_deepseek_output 的结果完全相同。
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._scan = 0  # 下一次查找换行的起始位置
+        self._section_index = None
+
+    def _is_boundary(self, pos):
+        """判断缓冲区中的位置 pos（紧跟在换行之后）是否为安全的分段边界"""
+        char = self._buffer[pos]
+        if char.isspace() or char in UNSAFE_SEGMENT_START:
+            return False
+        end = pos - 1
+        while end >= 0 and self._buffer[end].isspace():
+            end -= 1
+        # 上一段只有空白时，文档开头的空白会被行首规则删除，不能单独格式化
+        return end >= 0 and self._buffer[end] not in UNSAFE_SEGMENT_END
+
+    def _format(self, segment):
+        formatted, self._section_index = _format_deepseek_output(segment, self._section_index)
+        return formatted
+
+    def feed(self, text):
+        """
+        输入一个数据块
+
+        Args:
+            text: 模型输出的内容片段
+
+        Returns:
+            str: 已经可以确定的格式化内容，可能为空字符串
+        """
+        if not text:
+            return ''
+        self._buffer += text
+
+        # 查找最后一个安全的分段边界
+        cut = 0
+        pos = self._scan
+        while True:
+            newline = self._buffer.find('\n', pos)
+            if newline < 0:
+                pos = len(self._buffer)
+                break
+            if newline + 1 >= len(self._buffer):
+                # 换行后的内容尚未到达，下次继续判断
+                pos = newline
+                break
+            if self._is_boundary(newline + 1):
+                cut = newline + 1
+            pos = newline + 1
+
+        self._scan = pos - cut
+        if not cut:
+            return ''
+        segment, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        return self._format(segment)
+
+    def flush(self):
+        """
+        输出结束时调用，格式化缓冲区中剩余的内容
+
+        Returns:
+            str: 剩余的格式化内容
+        """
+        segment, self._buffer, self._scan = self._buffer, '', 0
+        formatted = self._format(segment)
+        self._section_index = None
+        return formatted
+
+
 # 测试代码
 if __name__ == "__main__":
     test_content = """
@@ -5,8 +5,138 @@
 搜索结果格式化模块
 
 这个模块提供了格式化搜索结果的功能，根据不同问题类型提供不同的指导说明。
+同时支持按模型的 token 预算组装提示词：去除搜索结果中的HTML标记，并按排名比例截断摘要。
 """
 
+import os
+import re
+import html
+import math
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 搜索引擎适配器在摘要中添加的HTML标记
+IMG_TAG_RE = re.compile(r'<img\b[^>]*>', re.I)
+BR_TAG_RE = re.compile(r'<br\s*/?>', re.I)
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+WHITESPACE_RE = re.compile(r'[ \t\r\f\v]+')
+
+# 截断摘要时添加的省略号
+TRUNCATION_MARK = '…'
+
+# 查询类型关键词，用于判断问题属于哪一类
+DATA_KEYWORDS = ["税率", "关税", "经济", "数据", "统计", "价格", "比例", "数量", "多少"]
+NEWS_KEYWORDS = ["新闻", "时事", "最新", "近期", "发布", "公布", "宣布", "报道"]
+TECH_KEYWORDS = ["技术", "原理", "定义", "学术", "研究", "理论", "方法", "如何实现"]
+HISTORY_KEYWORDS = ["历史", "文化", "传统", "起源", "发展史", "演变"]
+
+def strip_markup(text):
+    """
+    去除文本中的HTML标记：删除图片标签，将换行标签转换为空格，去除其他标签并还原HTML实体
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        str: 纯文本
+    """
+    if not text or '<' not in text and '&' not in text:
+        return text
+    text = IMG_TAG_RE.sub('', text)
+    text = BR_TAG_RE.sub(' ', text)
+    text = HTML_TAG_RE.sub('', text)
+    text = html.unescape(text)
+    return WHITESPACE_RE.sub(' ', text).strip()
+
+def estimate_tokens(text):
+    """
+    快速估算文本的 token 数量
+
+    非ASCII字符（主要是中文）按每个字符 1 个 token 计算，ASCII字符按每 4 个字符 1 个 token 计算。
+
+    Args:
+        text: 文本
+
+    Returns:
+        int: 估算的 token 数量
+    """
+    if not text:
+        return 0
+    ascii_length = len(text.encode('ascii', 'ignore'))
+    return math.ceil(len(text) - ascii_length + ascii_length / 4)
+
+def get_token_budget(model_id=None):
+    """
+    获取模型的搜索结果提示词 token 预算
+
+    优先使用 PROMPT_TOKEN_BUDGET_<模型> 环境变量（如 PROMPT_TOKEN_BUDGET_DEEPSEEK），
+    其次使用 PROMPT_TOKEN_BUDGET 环境变量，小于等于 0 表示不限制。
+
+    Args:
+        model_id: 模型标识符
+
+    Returns:
+        int: token 预算，不限制时返回 None
+    """
+    model_key = 'DEEPSEEK' if model_id and model_id.startswith('deepseek') else 'ZHIPUAI'
+    budget = int(os.getenv(f'PROMPT_TOKEN_BUDGET_{model_key}', os.getenv('PROMPT_TOKEN_BUDGET', '6000')))
+    return budget if budget > 0 else None
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    将文本截断到指定的 token 数量以内
+
+    Args:
+        text: 文本
+        max_tokens: 最大 token 数量
+
+    Returns:
+        str: 截断后的文本
+    """
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ''
+    cut = int(len(text) * max_tokens / tokens)
+    while cut > 0 and estimate_tokens(text[:cut]) > max_tokens:
+        cut = int(cut * 0.9)
+    return text[:cut].rstrip() + TRUNCATION_MARK
+
+def allocate_snippet_budget(token_counts, budget):
+    """
+    按排名比例分配摘要的 token 预算
+
+    排名越靠前的结果权重越高（权重为 1/√排名），所需 token 少于分配额度的结果
+    只占用实际需要的部分，剩余额度重新分配给其他结果。
+
+    Args:
+        token_counts: 各结果摘要的 token 数量，按排名排序
+        budget: 所有摘要的 token 预算
+
+    Returns:
+        list: 各结果摘要的 token 额度
+    """
+    allocations = list(token_counts)
+    remaining = set(range(len(token_counts)))
+    remaining_budget = max(0, budget)
+
+    while remaining:
+        total_weight = sum(1 / math.sqrt(i + 1) for i in remaining)
+        shares = {i: remaining_budget * (1 / math.sqrt(i + 1)) / total_weight for i in remaining}
+        satisfied = [i for i in remaining if token_counts[i] <= shares[i]]
+        if not satisfied:
+            for i in remaining:
+                allocations[i] = int(shares[i])
+            break
+        for i in satisfied:
+            remaining.discard(i)
+            remaining_budget -= token_counts[i]
+
+    return allocations
+
 def get_common_instruction():
     """
     获取通用的指导文本
@@ -18,7 +148,29 @@ def get_common_instruction():
 
 重要：请对每个搜索结果进行审核。如果某个搜索结果的标题或内容含有不健康、不适当或有害的内容（如色情、暴力、仇恨言论、非法活动等），请不要在参考来源部分列出该结果，也不要在回答中引用该结果的内容。"""
 
-def format_search_results(results, query, question_type="准确答案问题"):
+def build_search_prompt(results, query, question_type="准确答案问题", model_id=None):
+    """
+    按模型的 token 预算组装搜索结果提示词
+
+    Args:
+        results: 搜索结果列表
+        query: 搜索查询
+        question_type: 问题类型，"开放性问题"或"准确答案问题"
+        model_id: 模型标识符，用于确定 token 预算
+
+    Returns:
+        tuple: (格式化的搜索结果文本, 提示词统计信息)
+            统计信息包含 estimated_tokens（估算的 token 数量）、token_budget（token 预算）
+            和 truncated_results（被截断摘要的结果数量）
+    """
+    token_budget = get_token_budget(model_id)
+    stats = {}
+    formatted_text = format_search_results(results, query, question_type, token_budget, stats)
+    stats['estimated_tokens'] = estimate_tokens(formatted_text)
+    stats['token_budget'] = token_budget
+    return formatted_text, stats
+
+def format_search_results(results, query, question_type="准确答案问题", token_budget=None, stats=None):
     """
     格式化搜索结果为文本
 
@@ -26,30 +178,27 @@ def format_search_results(results, query, question_type="准确答案问题"):
         results: 搜索结果列表
         query: 搜索查询
         question_type: 问题类型，"开放性问题"或"准确答案问题"
+        token_budget: 整个搜索结果文本的 token 预算，为 None 时不截断摘要
+        stats: 可选的字典，用于返回被截断摘要的结果数量（truncated_results）
 
     Returns:
         格式化的搜索结果文本
     """
+    if stats is not None:
+        stats['truncated_results'] = 0
+
     if not results:
         return "没有找到相关搜索结果。"
 
-    # 内容部分
-    content_text = f"以下是关于\"{query}\"的搜索结果：\n\n"
-
-    for i, result in enumerate(results, 1):
-        title = result.get('title', '无标题')
-        content = result.get('content', '无内容')
-        url = result.get('link', '#')
-
-        # 不包含链接，只包含内容和编号
-        content_text += f"{i}. {title}\n"
-        content_text += f"   {content}\n\n"
+    # 去除标题和摘要中的HTML标记
+    titles = [strip_markup(result.get('title', '无标题')) for result in results]
+    contents = [strip_markup(result.get('content', '无内容')) for result in results]
 
     # 参考来源部分
     sources_text = "\n## 参考来源\n"
 
     for i, result in enumerate(results, 1):
-        title = result.get('title', '无标题')
+        title = titles[i - 1]
         url = result.get('link', '#')
 
         # 添加参考来源，确保 URL 是有效的
@@ -61,18 +210,12 @@ def format_search_results(results, query, question_type="准确答案问题"):
     # 获取通用指导文本
     common_instruction = get_common_instruction()
 
-    # 检测查询中的关键词，判断是否是特定类型的问题
-    data_keywords = ["税率", "关税", "经济", "数据", "统计", "价格", "比例", "数量", "多少"]
-    news_keywords = ["新闻", "时事", "最新", "近期", "发布", "公布", "宣布", "报道"]
-    tech_keywords = ["技术", "原理", "定义", "学术", "研究", "理论", "方法", "如何实现"]
-    history_keywords = ["历史", "文化", "传统", "起源", "发展史", "演变"]
-    
     # 检测查询属于哪种类型
     query_lower = query.lower()
-    is_data_query = any(keyword in query_lower for keyword in data_keywords)
-    is_news_query = any(keyword in query_lower for keyword in news_keywords)
-    is_tech_query = any(keyword in query_lower for keyword in tech_keywords)
-    is_history_query = any(keyword in query_lower for keyword in history_keywords)
+    is_data_query = any(keyword in query_lower for keyword in DATA_KEYWORDS)
+    is_news_query = any(keyword in query_lower for keyword in NEWS_KEYWORDS)
+    is_tech_query = any(keyword in query_lower for keyword in TECH_KEYWORDS)
+    is_history_query = any(keyword in query_lower for keyword in HISTORY_KEYWORDS)
     
     # 根据问题类型和内容类型提供不同的指导说明
     if is_data_query:
@@ -146,6 +289,27 @@ def format_search_results(results, query, question_type="准确答案问题"):
 {common_instruction}
 '''
 
+    # 按 token 预算截断摘要：先扣除标题、参考来源和指导说明等固定部分，剩余额度按排名分配给摘要
+    if token_budget is not None:
+        fixed_tokens = estimate_tokens(sources_text) + estimate_tokens(instruction_text) + \
+            estimate_tokens(query) + sum(estimate_tokens(title) + 4 for title in titles) + 16
+        token_counts = [estimate_tokens(content) for content in contents]
+        if fixed_tokens + sum(token_counts) > token_budget:
+            allocations = allocate_snippet_budget(token_counts, token_budget - fixed_tokens)
+            for i, allocation in enumerate(allocations):
+                if allocation < token_counts[i]:
+                    contents[i] = truncate_to_tokens(contents[i], allocation)
+                    if stats is not None:
+                        stats['truncated_results'] += 1
+
+    # 内容部分
+    content_text = f"以下是关于\"{query}\"的搜索结果：\n\n"
+
+    for i, (title, content) in enumerate(zip(titles, contents), 1):
+        # 不包含链接，只包含内容和编号
+        content_text += f"{i}. {title}\n"
+        content_text += f"   {content}\n\n"
+
     # 合并所有部分
     formatted_text = content_text + sources_text + instruction_text
 
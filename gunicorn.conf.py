@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Gunicorn 生产环境配置
+
+使用方式：gunicorn -c gunicorn.conf.py app:app
+异步服务模式：GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi_app:app
+
+默认使用 gevent 协程工作进程，每个流式输出（SSE）只占用一个协程而不是一个线程，
+适合大量长时间保持的流式连接。所有配置项都可以通过环境变量调整。
+"""
+
+import os
+import multiprocessing
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+
+def _default_workers():
+    """默认工作进程数：CPU 核数，至少为2（gevent 工作进程依靠协程处理并发，不需要 2n+1 个进程）"""
+    return max(2, multiprocessing.cpu_count())
+
+
+# 监听地址
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+
+# 工作进程数量和类型（可选值: gevent, gthread, sync, uvicorn.workers.UvicornWorker）
+workers = int(os.getenv('GUNICORN_WORKERS', str(_default_workers())))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+
+# gevent 工作进程：每个进程的最大并发连接数
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# gthread 工作进程：每个进程的线程数
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+# 工作进程无响应超时（秒）。流式回答可能持续较长时间，gevent 工作进程的心跳不受单个请求阻塞，
+# sync/gthread 工作进程下该值需要大于最长的回答时间
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '300'))
+
+# 客户端连接保持时间（秒），应小于前端反向代理/负载均衡的空闲超时
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '75'))
+
+# 优雅关闭：收到 SIGTERM 后停止接受新连接，等待正在输出的回答完成的最长时间（秒）
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '60'))
+
+# 处理一定数量的请求后重启工作进程，避免内存持续增长（0 表示不重启）
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+
+# 日志输出到标准输出，便于 docker logs 查看
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    """主进程启动时输出服务配置"""
+    server.log.info("生产服务启动: 监听 %s，工作进程 %s 个 (%s)，每进程连接数 %s，keep-alive %s 秒，优雅关闭等待 %s 秒",
+                    bind, workers, worker_class, worker_connections, keepalive, graceful_timeout)
+
+
+def worker_exit(server, worker):
+    """工作进程退出时关闭到大模型接口的连接池"""
+    try:
+        import deepseek_api
+        deepseek_api.close_clients()
+    except Exception as e:
+        server.log.warning("关闭连接池时出错: %s", e)
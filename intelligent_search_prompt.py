@@ -5,20 +5,29 @@
 智能联网搜索提示词模块
 
 这个模块提供了智能联网搜索所需的提示词，包括智能联网搜索提示词和基本系统提示词。
+
+提示词由固定的指令正文和包含当前日期的简短后缀组成，日期放在末尾，使较长的前缀在所有请求中
+保持字节级相同，便于模型服务商的前缀缓存命中。渲染结果按自然日缓存，日期变化后首次获取时重新渲染，
+长时间运行的工作进程也不会使用过期的日期。调用方应通过 get_intelligent_search_prompt()
+和 get_system_prompt() 获取提示词，不要在导入时保存提示词。
 """
 
 import datetime
+import threading
 
 # 获取当前时间
-def get_current_time_info():
+def get_current_time_info(now=None):
     """
     获取当前时间信息，包括年、月、日、星期等
 
+    Args:
+        now: 当前时间，默认为 datetime.datetime.now()
+
     Returns:
         tuple: (年, 月, 月份名称, 日, 星期名称)
     """
     # 获取当前时间
-    now = datetime.datetime.now()
+    now = now or datetime.datetime.now()
     year = now.year
     month = now.month
     day = now.day
@@ -34,19 +43,11 @@ def get_current_time_info():
 
     return year, month, month_name, day, weekday_name
 
-# 智能联网搜索提示词（合并版）
-def get_intelligent_search_prompt():
-    """
-    获取智能联网搜索提示词，包含当前时间信息
+# 时间提示（动态后缀）
+TIME_SUFFIX_TEMPLATE = "重要信息：当前时间是{year}年{month}月{day}日（{month_name}，{weekday_name}），请在回答中考虑这一点。当用户提到\"今天\"、\"最近\"、\"近期\"等时间限定词时，请基于当前时间进行理解和回答。"
 
-    Returns:
-        str: 智能联网搜索提示词
-    """
-    year, month, month_name, day, weekday_name = get_current_time_info()
-    prompt = "你是一个AI智能联网搜索助手。根据指定的任务类型，你需要完成不同的任务。\n\n"
-    prompt += f"当前时间是{year}年{month}月{day}日（{month_name}，{weekday_name}），请在回答中考虑这一点。当用户提到\"今天\"、\"最近\"、\"近期\"等时间限定词时，请基于当前时间进行理解和回答。"
-
-    return prompt + '''
+# 智能联网搜索提示词（合并版）的固定正文
+INTELLIGENT_SEARCH_PROMPT_BODY = "你是一个AI智能联网搜索助手。根据指定的任务类型，你需要完成不同的任务。" + '''
 
 ## 任务类型
 
@@ -174,22 +175,8 @@ def get_intelligent_search_prompt():
 如果搜索结果不足以回答问题，请坦诚说明，并尽可能基于你已有的知识提供帮助。
 '''
 
-# 创建合并版提示词
-INTELLIGENT_SEARCH_PROMPT = get_intelligent_search_prompt()
-
-# 系统提示词
-def get_system_prompt():
-    """
-    获取基本系统提示词，包含当前时间信息
-
-    Returns:
-        str: 系统提示词
-    """
-    year, month, month_name, day, weekday_name = get_current_time_info()
-    prompt = "你是一个有用的AI助手。你可以回答用户的各种问题，提供有用的信息和建议。\n\n"
-    prompt += f"重要信息：当前时间是{year}年{month}月{day}日（{month_name}，{weekday_name}），请在回答中考虑这一点。当用户提到\"今天\"、\"最近\"、\"近期\"等时间限定词时，请基于当前时间进行理解和回答。"
-
-    return prompt + '''
+# 基本系统提示词的固定正文
+SYSTEM_PROMPT_BODY = "你是一个有用的AI助手。你可以回答用户的各种问题，提供有用的信息和建议。" + '''
 
 请遵循以下几点：
 1. 提供准确、有用的信息
@@ -204,8 +191,95 @@ def get_system_prompt():
 请用中文回答用户的问题，除非用户明确要求使用其他语言。
 '''
 
-SYSTEM_PROMPT = get_system_prompt()
+# 提示词注册表：名称 -> 固定正文
+PROMPTS = {
+    'intelligent_search': INTELLIGENT_SEARCH_PROMPT_BODY,
+    'system': SYSTEM_PROMPT_BODY
+}
+
+# 按自然日缓存的渲染结果：名称 -> (日期, 提示词)
+_rendered = {}
+_rendered_lock = threading.Lock()
+
+
+def get_time_suffix(now=None):
+    """
+    获取包含当前日期的时间提示
+
+    Args:
+        now: 当前时间，默认为 datetime.datetime.now()
+
+    Returns:
+        str: 时间提示
+    """
+    year, month, month_name, day, weekday_name = get_current_time_info(now)
+    return TIME_SUFFIX_TEMPLATE.format(
+        year=year, month=month, month_name=month_name, day=day, weekday_name=weekday_name
+    )
+
+
+def render_prompt(name, now=None):
+    """
+    渲染提示词：固定正文 + 时间提示
+
+    Args:
+        name: 提示词名称
+        now: 当前时间，默认为 datetime.datetime.now()
+
+    Returns:
+        str: 提示词
+    """
+    return PROMPTS[name].rstrip('\n') + "\n\n" + get_time_suffix(now) + "\n"
+
+
+def get_prompt(name, now=None):
+    """
+    获取提示词，同一自然日内返回缓存的渲染结果
+
+    Args:
+        name: 提示词名称
+        now: 当前时间，默认为 datetime.datetime.now()
+
+    Returns:
+        str: 提示词
+    """
+    now = now or datetime.datetime.now()
+    today = now.date()
+    cached = _rendered.get(name)
+    if cached is not None and cached[0] == today:
+        return cached[1]
+
+    with _rendered_lock:
+        cached = _rendered.get(name)
+        if cached is None or cached[0] != today:
+            cached = (today, render_prompt(name, now))
+            _rendered[name] = cached
+    return cached[1]
+
+
+# 智能联网搜索提示词（合并版）
+def get_intelligent_search_prompt():
+    """
+    获取智能联网搜索提示词，包含当前时间信息
+
+    Returns:
+        str: 智能联网搜索提示词
+    """
+    return get_prompt('intelligent_search')
+
+
+# 系统提示词
+def get_system_prompt():
+    """
+    获取基本系统提示词，包含当前时间信息
+
+    Returns:
+        str: 系统提示词
+    """
+    return get_prompt('system')
+
 
-# 为了兼容性，保留SEARCH_SYSTEM_PROMPT变量，但实际上使用INTELLIGENT_SEARCH_PROMPT
-# 这样可以避免修改其他代码
-SEARCH_SYSTEM_PROMPT = INTELLIGENT_SEARCH_PROMPT
+# 为了兼容性，保留 get_search_system_prompt，实际上使用智能联网搜索提示词
+def get_search_system_prompt():
+    """获取联网搜索系统提示词（与智能联网搜索提示词相同）"""
+    return get_intelligent_search_prompt()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+日志配置模块
+
+所有模块通过 get_logger(__name__) 获取各自的日志记录器，日志消息使用 % 占位符延迟格式化，
+低于日志级别的消息不会被格式化。
+
+- 日志记录先放入内存队列，由后台线程写入标准输出，请求线程不会因为输出阻塞；
+  队列已满时丢弃日志并计数，不会阻塞请求
+- 支持文本和 JSON 两种输出格式，每条日志都带有当前请求的请求 ID
+- 逐个数据块的调试日志通过 ChunkSampler 采样，只记录一部分
+
+配置项（环境变量）：LOG_LEVEL、LOG_FORMAT（text/json）、LOG_ASYNC、LOG_QUEUE_SIZE、LOG_CHUNK_SAMPLE_EVERY
+"""
+
+import os
+import sys
+import json
+import uuid
+import queue
+import atexit
+import logging
+import itertools
+import threading
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 当前请求的请求 ID，未处于请求中时为 "-"
+_request_id = contextvars.ContextVar('request_id', default='-')
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'
+
+_configured = False
+_setup_lock = threading.Lock()
+_listener = None
+_queue_handler = None
+
+
+def new_request_id():
+    """生成新的请求 ID"""
+    return uuid.uuid4().hex[:16]
+
+
+def set_request_id(request_id=None):
+    """
+    设置当前请求的请求 ID
+
+    Args:
+        request_id: 请求 ID（如请求头 X-Request-ID），为空时生成新的请求 ID
+
+    Returns:
+        str: 当前请求的请求 ID
+    """
+    request_id = (request_id or '').strip()[:64] or new_request_id()
+    _request_id.set(request_id)
+    return request_id
+
+
+def get_request_id():
+    """获取当前请求的请求 ID，未处于请求中时返回 "-" """
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """为日志记录添加请求 ID（在产生日志的线程中执行）"""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = _request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """将日志记录输出为一行 JSON，extra={'fields': {...}} 中的字段合并到输出中"""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage()
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            data.update(fields)
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """队列已满时丢弃日志记录而不是阻塞或报错"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _create_output_handler():
+    """创建写入标准输出的日志处理器"""
+    handler = logging.StreamHandler(sys.stdout)
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def _start_listener():
+    """创建日志队列并启动后台写入线程"""
+    global _listener
+    log_queue = queue.Queue(int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    _queue_handler.queue = log_queue
+    _listener = QueueListener(log_queue, _create_output_handler())
+    _listener.start()
+
+
+def _stop_listener():
+    """停止后台写入线程，写出队列中剩余的日志"""
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_listener_after_fork():
+    """fork 出的子进程中没有父进程的后台线程，需要重新启动"""
+    if _queue_handler is not None:
+        _start_listener()
+
+
+def setup_logging():
+    """配置根日志记录器，重复调用时不会重复配置"""
+    global _configured, _queue_handler
+    if _configured:
+        return
+    with _setup_lock:
+        if _configured:
+            return
+
+        root = logging.getLogger()
+        root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+        if os.getenv('LOG_ASYNC', 'true').lower() in ('1', 'true', 'yes'):
+            _queue_handler = DroppingQueueHandler(None)
+            _start_listener()
+            atexit.register(_stop_listener)
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=_restart_listener_after_fork)
+            handler = _queue_handler
+        else:
+            handler = _create_output_handler()
+
+        # 请求 ID 在产生日志的线程中读取，因此过滤器添加在入口处理器上
+        handler.addFilter(RequestIdFilter())
+        root.addHandler(handler)
+        _configured = True
+
+
+def get_logger(name):
+    """
+    获取模块的日志记录器
+
+    Args:
+        name: 模块名，通常为 __name__
+
+    Returns:
+        logging.Logger: 日志记录器
+    """
+    setup_logging()
+    return logging.getLogger(name)
+
+
+def get_dropped_count():
+    """获取因队列已满而丢弃的日志数量"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+class ChunkSampler:
+    """逐个数据块的调试日志采样器：每 N 个数据块只记录一次"""
+
+    def __init__(self, every=None):
+        """
+        Args:
+            every: 采样间隔，默认使用 LOG_CHUNK_SAMPLE_EVERY 环境变量（100）
+        """
+        self.every = max(1, every or int(os.getenv('LOG_CHUNK_SAMPLE_EVERY', '100')))
+        self._counter = itertools.count()
+
+    def should_log(self, logger):
+        """
+        判断当前数据块是否需要记录调试日志
+
+        Args:
+            logger: 日志记录器，未启用 DEBUG 级别时直接返回 False
+
+        Returns:
+            bool: 是否记录
+        """
+        return logger.isEnabledFor(logging.DEBUG) and next(self._counter) % self.every == 0
@@ -0,0 +1,462 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+监控指标模块
+
+提供 Prometheus 文本格式的监控指标（/metrics 端点）：
+- 直方图：请求耗时、首个数据块时间（TTFT）、各搜索引擎的搜索耗时、各模型的大模型调用耗时、流式输出时长
+- 计数器：按阶段和异常类型统计的错误数、大模型消耗的 token 数、客户端断开连接后取消的流式输出和后台工作
+- 仪表盘：正在进行的 SSE 流式输出数量
+- 各缓存的命中/未命中/淘汰次数、请求合并和推测搜索的统计信息在导出时读取
+
+记录指标时不加锁：每个操作系统线程写入自己的分片，导出时汇总所有分片，
+已结束线程的分片在导出时合并后释放。异步服务的所有记录都在事件循环线程中进行。
+gevent 工作进程中同一线程的协程共用一个分片（协程只在 IO 等待时切换，记录过程中不会被打断），
+分片数量不随协程数量增长。
+"""
+
+import time
+import bisect
+import asyncio
+import weakref
+import threading
+
+try:
+    from gevent import monkey as gevent_monkey
+except ImportError:
+    gevent_monkey = None
+
+# 默认的直方图分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# 所有已注册的指标
+_registry = []
+
+
+def _os_thread_local():
+    """
+    创建按操作系统线程隔离的 thread-local 对象
+
+    gevent 打补丁后 threading.local 按协程隔离，每个协程都会注册一个分片，
+    这里使用打补丁前的原始实现。
+
+    Returns:
+        _thread._local: 原始的 thread-local 对象
+    """
+    if gevent_monkey is not None:
+        return gevent_monkey.get_original('_thread', '_local')()
+    return threading.local()
+
+
+class _ShardOwner:
+    """分片的持有者，保存在线程的 thread-local 中，线程结束时随之释放"""
+
+
+class _Metric:
+    """指标基类：按操作系统线程分片保存各标签组合的值"""
+
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = _os_thread_local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(map(labels.__getitem__, self.labelnames))
+
+    def _shard(self):
+        """获取当前线程的分片，每个线程第一次记录时注册"""
+        try:
+            return self._local.data
+        except AttributeError:
+            owner = self._local.owner = _ShardOwner()
+            data = self._local.data = {}
+            with self._lock:
+                self._shards.append((weakref.ref(owner), data))
+            return data
+
+    def _merge(self, total, data):
+        raise NotImplementedError
+
+    def collect(self):
+        """
+        汇总所有线程分片的值
+
+        Returns:
+            dict: 标签值元组 -> 值
+        """
+        with self._lock:
+            alive = []
+            total = {}
+            self._merge(total, self._retired)
+            for owner_ref, data in self._shards:
+                # 先判断线程是否已结束，再复制分片，避免漏掉线程结束前最后的写入
+                retired = owner_ref() is None
+                # dict.copy() 在持有 GIL 时一次完成，写入线程不会在复制过程中修改字典
+                snapshot = data.copy()
+                self._merge(total, snapshot)
+                if retired:
+                    # 已结束的线程不会再写入，合并后释放其分片
+                    self._merge(self._retired, snapshot)
+                else:
+                    alive.append((owner_ref, data))
+            self._shards = alive
+        return total
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """
+        增加计数
+
+        Args:
+            amount: 增加的数量
+            **labels: 标签值，需要包含定义指标时的所有标签
+        """
+        data = self._shard()
+        key = self._key(labels)
+        data[key] = data.get(key, 0) + amount
+
+    def _merge(self, total, data):
+        for key, value in data.items():
+            total[key] = total.get(key, 0) + value
+
+
+class Gauge(Counter):
+    """可增可减的仪表盘，各线程的增减量在导出时相加"""
+
+    type_name = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        """减少数值"""
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """直方图：记录各分桶的观测次数和观测值之和"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """
+        记录一次观测值
+
+        Args:
+            value: 观测值（耗时以秒为单位）
+            **labels: 标签值，需要包含定义指标时的所有标签
+        """
+        data = self._shard()
+        key = self._key(labels)
+        state = data.get(key)
+        if state is None:
+            # 各分桶（最后一个为 +Inf）的观测次数，以及观测值之和
+            state = data[key] = [0] * (len(self.buckets) + 2)
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def _merge(self, total, data):
+        for key, state in data.items():
+            state = list(state)
+            merged = total.get(key)
+            if merged is None:
+                total[key] = state
+            else:
+                for index, value in enumerate(state):
+                    merged[index] += value
+
+
+class _Timer:
+    """记录代码块耗时的上下文管理器"""
+
+    __slots__ = ('histogram', 'error_stage', 'labels', 'start')
+
+    def __init__(self, histogram, error_stage, labels):
+        self.histogram = histogram
+        self.error_stage = error_stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None and self.error_stage:
+            record_error(self.error_stage, exc_type.__name__)
+        return False
+
+
+def measure(histogram, error_stage=None, **labels):
+    """
+    记录代码块的耗时
+
+    用法：
+        with metrics.measure(metrics.LLM_LATENCY, 'llm', model=model_name, stream='true'):
+            ...
+
+    Args:
+        histogram: 直方图
+        error_stage: 代码块抛出异常时记录到错误计数的阶段名称，为 None 时不记录
+        **labels: 直方图的标签值
+
+    Returns:
+        上下文管理器
+    """
+    return _Timer(histogram, error_stage, labels)
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP 请求耗时（流式请求到输出结束为止）', ('route', 'method', 'status')
+)
+TTFT = Histogram('time_to_first_token_seconds', '从收到请求到输出首个内容数据块的时间', ('route',))
+SSE_STREAM_DURATION = Histogram('sse_stream_duration_seconds', 'SSE 流式输出的持续时间', ('route',))
+SSE_STREAMS_ACTIVE = Gauge('sse_streams_active', '正在进行的 SSE 流式输出数量', ('route',))
+SEARCH_LATENCY = Histogram('search_latency_seconds', '单次搜索引擎调用的耗时', ('engine',))
+LLM_LATENCY = Histogram('llm_latency_seconds', '大模型调用的耗时（流式调用到收到响应为止）', ('model', 'stream'))
+ERRORS = Counter('errors_total', '按阶段和异常类型统计的错误数', ('stage', 'type'))
+LLM_TOKENS = Counter('llm_tokens_total', '大模型消耗的 token 数', ('model', 'kind'))
+SSE_STREAMS_CANCELLED = Counter('sse_streams_cancelled_total', '输出结束前客户端断开连接的 SSE 流式输出数量', ('route',))
+CANCELLATIONS = Counter('cancellations_total', '客户端断开连接后停止的后台工作数量', ('stage',))
+
+# 不包含模型输出内容的初始消息和心跳数据块，不计入首个数据块时间
+_EMPTY_FRAMES = ('data: {"role": "assistant", "content": ""}', 'data: {"content": ""}', ':')
+
+
+def record_error(stage, error_type):
+    """
+    记录一次错误
+
+    Args:
+        stage: 出错的阶段，如 search、llm、stream、request
+        error_type: 错误类型，通常为异常类名
+    """
+    ERRORS.inc(stage=stage, type=error_type)
+
+
+def record_cancellation(stage):
+    """
+    记录一次因客户端断开连接而停止的后台工作
+
+    Args:
+        stage: 停止的工作，如 search（未完成的搜索）、singleflight（合并请求的后台执行）
+    """
+    CANCELLATIONS.inc(stage=stage)
+
+
+def record_token_usage(model, usage):
+    """
+    记录大模型消耗的 token 数
+
+    Args:
+        model: 模型名称
+        usage: 包含 prompt_tokens、completion_tokens 的字典，可以为 None
+    """
+    if not usage:
+        return
+    model = model or 'unknown'
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        count = usage.get(kind)
+        if count:
+            LLM_TOKENS.inc(count, model=model, kind=kind[:-len('_tokens')])
+
+
+def is_token_frame(line):
+    """判断流式数据块是否包含模型输出的内容（跳过空的初始消息）"""
+    return bool(line) and not (isinstance(line, str) and line.startswith(_EMPTY_FRAMES))
+
+
+def track_stream(lines, route, start=None):
+    """
+    逐个传递 SSE 数据块，记录正在进行的流式输出数量、首个数据块时间和流式输出时长
+
+    Args:
+        lines: 数据块迭代器
+        route: 路由，用作指标标签
+        start: 收到请求的时间（time.perf_counter()），默认为开始输出的时间
+
+    Returns:
+        generator: 与输入相同的数据块
+    """
+    stream_start = time.perf_counter()
+    start = start or stream_start
+    first = True
+    SSE_STREAMS_ACTIVE.inc(route=route)
+    try:
+        for line in lines:
+            if first and is_token_frame(line):
+                first = False
+                TTFT.observe(time.perf_counter() - start, route=route)
+            yield line
+    except GeneratorExit:
+        # 输出结束前被关闭：客户端已断开连接，服务器停止读取
+        SSE_STREAMS_CANCELLED.inc(route=route)
+        raise
+    finally:
+        SSE_STREAMS_ACTIVE.dec(route=route)
+        SSE_STREAM_DURATION.observe(time.perf_counter() - stream_start, route=route)
+
+
+async def track_stream_async(lines, route, start=None):
+    """
+    track_stream 的异步版本
+
+    Args:
+        lines: 数据块异步生成器
+        route: 路由，用作指标标签
+        start: 收到请求的时间（time.perf_counter()），默认为开始输出的时间
+
+    Returns:
+        异步生成器: 与输入相同的数据块
+    """
+    stream_start = time.perf_counter()
+    start = start or stream_start
+    first = True
+    SSE_STREAMS_ACTIVE.inc(route=route)
+    try:
+        async for line in lines:
+            if first and is_token_frame(line):
+                first = False
+                TTFT.observe(time.perf_counter() - start, route=route)
+            yield line
+    except (GeneratorExit, asyncio.CancelledError):
+        # 输出结束前被关闭或取消：客户端已断开连接
+        SSE_STREAMS_CANCELLED.inc(route=route)
+        raise
+    finally:
+        SSE_STREAMS_ACTIVE.dec(route=route)
+        SSE_STREAM_DURATION.observe(time.perf_counter() - stream_start, route=route)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def _render_metric(metric):
+    """输出一个指标的 Prometheus 文本格式"""
+    lines = [f'# HELP {metric.name} {metric.documentation}', f'# TYPE {metric.name} {metric.type_name}']
+    for key, value in sorted(metric.collect().items()):
+        if isinstance(metric, Histogram):
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), value):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{metric.name}_bucket{_format_labels(metric.labelnames, key, [("le", le)])} {cumulative}')
+            labels = _format_labels(metric.labelnames, key)
+            lines.append(f'{metric.name}_sum{labels} {_format_value(value[-1])}')
+            lines.append(f'{metric.name}_count{labels} {cumulative}')
+        else:
+            lines.append(f'{metric.name}{_format_labels(metric.labelnames, key)} {_format_value(value)}')
+    return lines
+
+
+def _render_family(name, type_name, documentation, samples):
+    """
+    输出导出时读取的一组指标
+
+    Args:
+        samples: [(标签字典, 值)] 列表
+    """
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {type_name}']
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}')
+    return lines
+
+
+def _render_component_stats():
+    """输出各缓存、请求合并和推测搜索的统计信息"""
+    # 在导出时导入，避免与记录指标的模块循环导入
+    import search_cache
+    import analysis_cache
+    import answer_cache
+    import singleflight
+    import search_executor
+    import query_classifier
+    from log_config import get_dropped_count
+
+    caches = [search_cache.get_stats(), analysis_cache.get_stats(), answer_cache.get_stats()]
+    lines = []
+    for field, type_name, documentation in (
+        ('hits', 'counter', '缓存命中次数'),
+        ('misses', 'counter', '缓存未命中次数'),
+        ('evictions', 'counter', '缓存淘汰次数'),
+        ('entries', 'gauge', '缓存条目数'),
+        ('bytes', 'gauge', '缓存占用的内存字节数')
+    ):
+        suffix = '_total' if type_name == 'counter' else ''
+        lines += _render_family(f'cache_{field}{suffix}', type_name, documentation,
+                                [({'cache': stats['name']}, stats[field]) for stats in caches])
+
+    flight_stats = singleflight.get_stats()
+    lines += _render_family('singleflight_requests_total', 'counter', '请求合并：领头请求和被合并的请求数', [
+        ({'mode': mode, 'role': role}, flight_stats[f'{prefix}{role}s'])
+        for mode, prefix in (('json', ''), ('stream', 'stream_'))
+        for role in ('leader', 'follower')
+    ])
+
+    speculation_stats = search_executor.get_speculation_stats()
+    lines += _render_family('speculative_searches_total', 'counter', '推测搜索的启动、使用、浪费和取消次数', [
+        ({'outcome': outcome}, speculation_stats[outcome]) for outcome in ('started', 'used', 'wasted', 'cancelled')
+    ])
+
+    classifier_stats = query_classifier.get_stats()
+    lines += _render_family('query_classifier_requests_total', 'counter', '本地快速分类：直接使用分类结果和回退到大模型分析的请求数', [
+        ({'path': 'fast'}, classifier_stats['fast_path']), ({'path': 'fallback'}, classifier_stats['fallback'])
+    ])
+    samples = (('all', ''), ('shadow', 'shadow_'))
+    lines += _render_family('query_classifier_comparisons_total', 'counter', '本地分类与大模型分析结果的对比次数', [
+        ({'sample': sample}, classifier_stats[f'{prefix}compared']) for sample, prefix in samples
+    ])
+    lines += _render_family('query_classifier_agreements_total', 'counter', '本地分类与大模型分析结果一致的次数', [
+        ({'sample': sample, 'field': field}, classifier_stats[f'{prefix}{field}_agreed'])
+        for sample, prefix in samples
+        for field in ('need_search', 'question_type')
+    ])
+
+    lines += _render_family('log_records_dropped_total', 'counter', '因日志队列已满而丢弃的日志数',
+                            [({}, get_dropped_count())])
+    return lines
+
+
+def render():
+    """
+    输出所有监控指标
+
+    Returns:
+        str: Prometheus 文本格式（text/plain; version=0.0.4）
+    """
+    lines = []
+    for metric in _registry:
+        lines += _render_metric(metric)
+    lines += _render_component_stats()
+    return '\n'.join(lines) + '\n'
+
+
+# /metrics 端点的响应类型
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
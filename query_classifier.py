@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地查询分类模块
+
+这个模块在调用大模型分析用户问题之前，使用规则和词典对问题进行快速分类，
+判断是否需要搜索、问题类型并给出搜索关键词，同时给出置信度。
+置信度达到阈值时直接使用本地分类结果，否则回退到大模型分析，
+并记录本地分类与大模型分析结果的一致率。
+"""
+
+import os
+import re
+import random
+import threading
+from dotenv import load_dotenv
+
+from cache_store import normalize_query
+from analysis_cache import TIME_SENSITIVE_WORDS
+from format_search_results_new import DATA_KEYWORDS, NEWS_KEYWORDS, TECH_KEYWORDS, HISTORY_KEYWORDS
+
+# 加载环境变量
+load_dotenv()
+
+# 单独的时间关键词模式，如"2024年"、"2023年底"等
+TIME_ONLY_PATTERNS = [
+    r'^\d{4}\s*[年月日]?$',  # 匹配年份，如"2024年"、"2024"
+    r'^\d{4}\s*-\s*\d{4}$',  # 匹配年份范围，如"2023-2024"
+    r'^\d{4}\s*[年]\s*\d{1,2}\s*[月]$',  # 匹配年月，如"2024年1月"
+    r'^[上下本今去明][年月周季度]$',  # 匹配相对时间，如"今年"、"上季度"
+]
+
+# 问题中出现的时间表达式（由单独时间关键词模式去掉首尾锚点得到）
+TIME_EXPRESSION_RE = re.compile('|'.join(p.strip('^$') for p in TIME_ONLY_PATTERNS))
+
+# 问候语和寒暄
+GREETINGS = {
+    "你好", "您好", "你好啊", "你好呀", "嗨", "哈喽", "早上好", "上午好", "中午好", "下午好", "晚上好", "晚安",
+    "在吗", "在不在", "谢谢", "谢谢你", "多谢", "再见", "拜拜", "你是谁", "hi", "hello", "hey", "thanks", "thank you"
+}
+
+# 写作、翻译等不需要搜索的任务：只匹配祈使句式，"这本小说讲的是什么故事"等问题不属于写作任务
+WRITING_TASK_PATTERNS = [
+    r'(帮我|给我|替我|帮忙|请你?)(写|编|创作|续写|改写|润色|翻译|起|取|拟)',  # 请求代为写作，如"帮我写"、"请翻译"
+    r'写(一|几|两)?[首篇段个封份则句副]',  # 如"写一首"、"写篇"、"写个"、"写副对联"
+    r'^(续写|改写|润色|作诗|写诗|编个|编一个|翻译下面|翻译以下|翻译这)',  # 以写作动词开头
+    r'翻译(成|为|一下)',  # 如"翻译成英文"
+    r'(起|取|拟)(一个|个|几个)?(标题|题目|名字)',  # 如"起个标题"
+    r'讲(一个|个)故事',
+]
+WRITING_TASK_RE = re.compile('|'.join(WRITING_TASK_PATTERNS))
+
+# 问题类型提示词（与 ANALYZE_QUERY 提示词中的判断标准一致）
+OPEN_QUESTION_WORDS = ["为什么", "如何", "怎么", "有哪些", "说说", "讨论", "分析", "看法", "怎么看", "影响", "比较"]
+EXACT_QUESTION_WORDS = ["什么是", "多少", "何时", "什么时候", "哪里", "哪个", "哪些国家", "是否", "几", "谁", "是什么"]
+
+# 提取关键词时删除的礼貌用语和提问前缀
+QUERY_PREFIX_RE = re.compile(r'^(请问|请|麻烦|帮我|帮忙|给我|我想知道|我想了解|能否|能不能|可以|查一下|搜一下|搜索|查询)+')
+QUERY_SUFFIX_RE = re.compile(r'(吗|呢|吧|啊|呀)?[？?。！!\s]*$')
+
+# 分类与大模型结果一致率统计
+_stats = {
+    'total': 0,
+    'fast_path': 0,
+    'fallback': 0,
+    'compared': 0,
+    'need_search_agreed': 0,
+    'question_type_agreed': 0,
+    # 置信度达标、抽样调用大模型对比的分类（即快速路径会直接使用的分类）
+    'shadow_compared': 0,
+    'shadow_need_search_agreed': 0,
+    'shadow_question_type_agreed': 0
+}
+_stats_lock = threading.Lock()
+
+
+def is_enabled():
+    """是否启用本地快速分类，默认启用"""
+    return os.getenv('QUERY_CLASSIFIER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def get_threshold():
+    """获取使用本地分类结果的置信度阈值，默认为0.8"""
+    return float(os.getenv('QUERY_CLASSIFIER_THRESHOLD', '0.8'))
+
+
+def get_shadow_rate():
+    """获取置信度达标时仍调用大模型进行对比的抽样比例，默认为0.05"""
+    return float(os.getenv('QUERY_CLASSIFIER_SHADOW_RATE', '0.05'))
+
+
+def _contains_any(text, words):
+    """判断文本是否包含任意一个词，英文单词只匹配完整的单词（如 now 不匹配 know、snow）"""
+    for word in words:
+        if word.isascii():
+            if re.search(rf'(?<![a-z0-9]){re.escape(word)}(?![a-z0-9])', text):
+                return True
+        elif word in text:
+            return True
+    return False
+
+
+def get_question_type(normalized_query):
+    """
+    根据提问方式判断问题类型
+
+    Args:
+        normalized_query: 规范化后的用户问题
+
+    Returns:
+        str: "开放性问题"或"准确答案问题"
+    """
+    if _contains_any(normalized_query, EXACT_QUESTION_WORDS):
+        return "准确答案问题"
+    if _contains_any(normalized_query, OPEN_QUESTION_WORDS):
+        return "开放性问题"
+    return "准确答案问题"
+
+
+def extract_keywords(query):
+    """
+    从用户问题中提取搜索关键词：删除礼貌用语和语气词，不返回单独的时间关键词
+
+    Args:
+        query: 用户问题
+
+    Returns:
+        list: 搜索关键词列表
+    """
+    keyword = QUERY_SUFFIX_RE.sub('', QUERY_PREFIX_RE.sub('', query.strip())).strip()
+    if not keyword or any(re.match(pattern, keyword) for pattern in TIME_ONLY_PATTERNS):
+        return [query]
+    return [keyword]
+
+
+def classify(query):
+    """
+    使用规则和词典对用户问题进行快速分类
+
+    Args:
+        query: 用户问题
+
+    Returns:
+        dict: 包含 need_search、question_type、keywords、confidence 和 rule 的字典
+    """
+    normalized_query = normalize_query(query)
+    question_type = get_question_type(normalized_query)
+
+    # 问候语：整句都是寒暄时不需要搜索
+    if normalized_query in GREETINGS:
+        return {
+            'need_search': False,
+            'question_type': "准确答案问题",
+            'keywords': [query],
+            'confidence': 0.95,
+            'rule': 'greeting'
+        }
+
+    has_time_word = _contains_any(normalized_query, TIME_SENSITIVE_WORDS) or \
+        TIME_EXPRESSION_RE.search(normalized_query) is not None
+    has_news_word = _contains_any(normalized_query, NEWS_KEYWORDS)
+    has_data_word = _contains_any(normalized_query, DATA_KEYWORDS)
+
+    # 写作、翻译等任务：不涉及时间和新闻时不需要搜索
+    if WRITING_TASK_RE.search(normalized_query):
+        if not has_time_word and not has_news_word:
+            return {
+                'need_search': False,
+                'question_type': "开放性问题",
+                'keywords': [query],
+                'confidence': 0.9,
+                'rule': 'writing_task'
+            }
+        return {
+            'need_search': False,
+            'question_type': "开放性问题",
+            'keywords': [query],
+            'confidence': 0.5,
+            'rule': 'writing_task_time_sensitive'
+        }
+
+    # 时效性新闻和数据：同时包含时间限定词和新闻/数据类词语时需要搜索
+    if has_time_word and (has_news_word or has_data_word):
+        return {
+            'need_search': True,
+            'question_type': question_type,
+            'keywords': extract_keywords(query),
+            'confidence': 0.9,
+            'rule': 'time_sensitive_news'
+        }
+
+    # 只有部分信号时给出较低的置信度，由大模型决定
+    if has_time_word or has_news_word or has_data_word:
+        return {
+            'need_search': True,
+            'question_type': question_type,
+            'keywords': extract_keywords(query),
+            'confidence': 0.6,
+            'rule': 'weak_search_signal'
+        }
+
+    is_knowledge_query = _contains_any(normalized_query, TECH_KEYWORDS) or \
+        _contains_any(normalized_query, HISTORY_KEYWORDS)
+    return {
+        'need_search': is_knowledge_query,
+        'question_type': question_type,
+        'keywords': extract_keywords(query),
+        'confidence': 0.3,
+        'rule': 'default'
+    }
+
+
+def should_use(classification):
+    """
+    判断是否直接使用本地分类结果（跳过大模型分析），并记录统计信息
+
+    置信度达标时，按 QUERY_CLASSIFIER_SHADOW_RATE 抽样仍然调用大模型，用于统计快速路径所做判断的一致率，
+    抽样的分类结果中 shadow 为 True。
+
+    Args:
+        classification: classify 的返回值
+
+    Returns:
+        bool: 是否直接使用本地分类结果
+    """
+    use_fast_path = is_enabled() and classification['confidence'] >= get_threshold()
+    if use_fast_path and random.random() < get_shadow_rate():
+        use_fast_path = False
+        classification['shadow'] = True
+
+    with _stats_lock:
+        _stats['total'] += 1
+        if use_fast_path:
+            _stats['fast_path'] += 1
+        else:
+            _stats['fallback'] += 1
+    return use_fast_path
+
+
+def record_agreement(classification, need_search, question_type):
+    """
+    记录本地分类结果与大模型分析结果是否一致
+
+    Args:
+        classification: classify 的返回值
+        need_search: 大模型判断的是否需要搜索
+        question_type: 大模型判断的问题类型
+    """
+    need_search_agreed = classification['need_search'] == bool(need_search)
+    question_type_agreed = classification['question_type'] == question_type
+    with _stats_lock:
+        _stats['compared'] += 1
+        _stats['need_search_agreed'] += need_search_agreed
+        _stats['question_type_agreed'] += question_type_agreed
+        if classification.get('shadow'):
+            _stats['shadow_compared'] += 1
+            _stats['shadow_need_search_agreed'] += need_search_agreed
+            _stats['shadow_question_type_agreed'] += question_type_agreed
+
+
+def get_stats():
+    """
+    获取本地分类的统计信息
+
+    Returns:
+        dict: 快速路径比例以及与大模型结果的一致率（shadow_ 开头的一致率只统计置信度达标的抽样分类）
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['fast_path_rate'] = round(stats['fast_path'] / stats['total'], 4) if stats['total'] else 0.0
+    for prefix in ('', 'shadow_'):
+        compared = stats[f'{prefix}compared']
+        for name in ('need_search', 'question_type'):
+            agreed = stats[f'{prefix}{name}_agreed']
+            stats[f'{prefix}{name}_agreement_rate'] = round(agreed / compared, 4) if compared else 0.0
+    return stats
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+搜索结果去重模块
+
+这个模块对合并后的搜索结果进行两阶段去重：
+1. 规范化URL（忽略 http/https、www.、移动版子域名、结尾斜杠、跟踪参数和锚点）后去除相同链接
+2. 使用 MinHash 和局部敏感哈希（LSH）分桶，在线性时间内找出摘要内容近似重复的结果（如转载文章），
+   只对落入同一个桶的候选结果计算精确的 Jaccard 相似度
+
+去重时保留排名最靠前的结果，并记录被合并的结果。
+"""
+
+import os
+import re
+import random
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 跟踪参数（完全匹配）
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'yclid', 'msclkid', 'igshid', 'mc_cid', 'mc_eid', 'spm', 'scm',
+    'from', 'ref', 'ref_src', 'ref_url', 'share_token', 'share_source', 'share_from', 'sharer',
+    'timestamp', 'wfr', 'isappinstalled', 'source', '_hsenc', '_hsmi', 'vd_source'
+}
+
+# 跟踪参数（前缀匹配）
+TRACKING_PARAM_PREFIXES = ('utm_', 'pk_', 'hmsr', 'hmpl', 'hmcu', 'hmkw', 'hmci')
+
+# 移动版和常见的主机名前缀
+HOST_PREFIXES = ('www.', 'm.', 'mobile.', 'wap.', '3g.')
+
+# 去除摘要中由搜索引擎适配器添加的元数据和HTML标签
+SMALL_TAG_RE = re.compile(r'<small>.*?</small>', re.S)
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+NON_WORD_RE = re.compile(r'[\W_]+')
+
+# MinHash 参数：签名长度 = 分带数量 × 每带行数
+# 相似度为 s 的两个结果成为候选的概率为 1 - (1 - s^行数)^分带数量，分界点约为 (1/分带数量)^(1/行数) ≈ 0.64：
+# 相似度 0.8 的结果约 96% 成为候选，相似度 0.3 的结果约 5% 成为候选，大部分结果不需要计算精确的相似度
+SHINGLE_SIZE = 4
+MINHASH_BANDS = 6
+MINHASH_ROWS = 4
+MIN_TEXT_LENGTH = 20
+_HASH_MASK = (1 << 64) - 1
+_MINHASH_SEEDS = [random.Random(i).getrandbits(64) for i in range(MINHASH_BANDS * MINHASH_ROWS)]
+
+
+def is_near_duplicate_enabled():
+    """是否启用近似重复内容去重，默认启用"""
+    return os.getenv('DEDUP_NEAR_DUPLICATE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def get_similarity_threshold():
+    """获取判定为近似重复的 Jaccard 相似度阈值，默认为0.8"""
+    return float(os.getenv('DEDUP_SIMILARITY_THRESHOLD', '0.8'))
+
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PARAM_PREFIXES)
+
+
+def canonicalize_url(url):
+    """
+    规范化URL，用于判断两个链接是否指向同一页面
+
+    Args:
+        url: 原始链接
+
+    Returns:
+        str: 规范化后的链接（不含协议），无法解析时返回原始链接
+    """
+    if not url or url == '#':
+        return url
+
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    if not parts.netloc:
+        return url
+
+    # 主机名：小写，去除端口、www. 和移动版前缀
+    host = (parts.hostname or '').lower()
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix) and host.count('.') > 1:
+            host = host[len(prefix):]
+            break
+
+    # 路径：合并连续斜杠并去除结尾斜杠
+    path = re.sub(r'/{2,}', '/', parts.path or '/')
+    if len(path) > 1:
+        path = path.rstrip('/')
+    if path == '/':
+        path = ''
+
+    # 查询参数：去除跟踪参数并排序
+    params = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking_param(k)]
+    query = urlencode(sorted(params))
+
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+
+def _content_text(item):
+    """提取用于比较的摘要文本：去除HTML标签、元数据、标点和空白，并转换为小写"""
+    content = item.get('content') or ''
+    content = HTML_TAG_RE.sub(' ', SMALL_TAG_RE.sub(' ', content))
+    return NON_WORD_RE.sub('', content).lower()
+
+
+def _shingles(text):
+    """将文本切分为字符 n-gram 集合"""
+    if len(text) < SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def _minhash_signature(shingles, seeded_hashes):
+    """
+    计算 MinHash 签名（同一进程内哈希值稳定，仅用于本次去重）
+
+    Args:
+        shingles: n-gram 集合
+        seeded_hashes: n-gram -> 各种子的哈希值元组，在一次去重中共享，每个 n-gram 只计算一次
+
+    Returns:
+        list: 各种子的最小哈希值
+    """
+    for shingle in shingles - seeded_hashes.keys():
+        h = hash(shingle) & _HASH_MASK
+        seeded_hashes[shingle] = tuple([h ^ seed for seed in _MINHASH_SEEDS])
+    # 按种子转置后逐列取最小值
+    return list(map(min, zip(*map(seeded_hashes.__getitem__, shingles))))
+
+
+def _jaccard(a, b):
+    """计算两个集合的 Jaccard 相似度"""
+    if not a or not b:
+        return 0.0
+    intersection = len(a & b)
+    return intersection / (len(a) + len(b) - intersection)
+
+
+def deduplicate_results(results, similarity_threshold=None):
+    """
+    对搜索结果去重，保留排名最靠前的结果
+
+    Args:
+        results: 按排名排序的搜索结果列表
+        similarity_threshold: 判定为近似重复的 Jaccard 相似度阈值，默认为 DEDUP_SIMILARITY_THRESHOLD 环境变量
+
+    Returns:
+        tuple: (去重后的结果列表, 被合并的结果记录列表)
+            每条合并记录包含 kept（保留的链接）、removed（被合并的链接）、reason（"url" 或 "content"）
+            和 similarity（内容相似度，仅 reason 为 "content" 时有意义）
+    """
+    if similarity_threshold is None:
+        similarity_threshold = get_similarity_threshold()
+    check_content = is_near_duplicate_enabled()
+
+    unique_results = []
+    merged = []
+    seen_urls = {}
+    shingle_sets = []  # 与 unique_results 对应的 n-gram 集合
+    buckets = {}  # (分带序号, 分带签名) -> unique_results 中的下标列表
+    seeded_hashes = {}  # n-gram -> 各种子的哈希值
+
+    for item in results:
+        url = item.get('link', '')
+        if not url:
+            continue
+
+        # 1. 规范化URL后完全相同的结果
+        canonical_url = canonicalize_url(url)
+        if canonical_url in seen_urls:
+            kept = unique_results[seen_urls[canonical_url]]
+            merged.append({'kept': kept.get('link'), 'removed': url, 'reason': 'url', 'similarity': 1.0})
+            continue
+
+        # 2. 摘要内容近似重复的结果
+        shingles = None
+        band_keys = []
+        text = _content_text(item) if check_content else ''
+        if len(text) >= MIN_TEXT_LENGTH:
+            shingles = _shingles(text)
+            signature = _minhash_signature(shingles, seeded_hashes)
+            band_keys = [
+                (band, tuple(signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]))
+                for band in range(MINHASH_BANDS)
+            ]
+
+            duplicate_of = None
+            best_similarity = 0.0
+            checked = set()
+            for band_key in band_keys:
+                for index in buckets.get(band_key, ()):
+                    if index in checked:
+                        continue
+                    checked.add(index)
+                    similarity = _jaccard(shingles, shingle_sets[index])
+                    if similarity >= similarity_threshold and similarity > best_similarity:
+                        duplicate_of = index
+                        best_similarity = similarity
+
+            if duplicate_of is not None:
+                kept = unique_results[duplicate_of]
+                merged.append({
+                    'kept': kept.get('link'),
+                    'removed': url,
+                    'reason': 'content',
+                    'similarity': round(best_similarity, 4)
+                })
+                continue
+
+        # 保留该结果
+        index = len(unique_results)
+        seen_urls[canonical_url] = index
+        unique_results.append(item)
+        shingle_sets.append(shingles)
+        for band_key in band_keys:
+            buckets.setdefault(band_key, []).append(index)
+
+    return unique_results, merged
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+搜索结果缓存模块
+
+这个模块缓存各搜索引擎的搜索结果，缓存键由规范化后的
+(搜索引擎, 查询, 结果数量, 时间范围, 语言, 引擎列表等) 组成，每个搜索引擎可以设置不同的过期时间。
+"""
+
+import os
+import json
+import threading
+from dotenv import load_dotenv
+
+from cache_store import TTLCache, create_backend
+
+# 加载环境变量
+load_dotenv()
+
+# 默认过期时间（秒）
+DEFAULT_TTL = 600
+
+# 进程内共享的搜索结果缓存
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def is_enabled():
+    """是否启用搜索结果缓存，默认启用"""
+    return os.getenv('SEARCH_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def get_cache():
+    """
+    获取进程内共享的搜索结果缓存
+
+    Returns:
+        TTLCache: 搜索结果缓存
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend = create_backend(
+                    os.getenv('SEARCH_CACHE_BACKEND', 'memory'),
+                    os.getenv('SEARCH_CACHE_SQLITE_PATH', 'search_cache.db')
+                )
+                _cache = TTLCache(
+                    'search',
+                    max_entries=int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', '10000')),
+                    max_bytes=int(os.getenv('SEARCH_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+                    backend=backend
+                )
+    return _cache
+
+
+def get_ttl(engine):
+    """
+    获取指定搜索引擎的缓存过期时间
+
+    优先使用 SEARCH_CACHE_TTL_<引擎名> 环境变量（如 SEARCH_CACHE_TTL_BOCHAAI），
+    其次使用 SEARCH_CACHE_TTL 环境变量。
+
+    Args:
+        engine: 搜索引擎
+
+    Returns:
+        float: 过期时间（秒）
+    """
+    default_ttl = os.getenv('SEARCH_CACHE_TTL', str(DEFAULT_TTL))
+    return float(os.getenv(f'SEARCH_CACHE_TTL_{engine.upper()}', default_ttl))
+
+
+def normalize_query(query):
+    """规范化搜索查询：去除首尾空白、合并连续空白并转换为小写"""
+    return ' '.join(str(query).split()).lower()
+
+
+def make_key(engine, query, count=None, freshness=None, time_range=None, language=None, engines=None, safesearch=None):
+    """
+    生成搜索结果缓存键
+
+    Args:
+        engine: 搜索引擎
+        query: 搜索查询
+        count: 结果数量
+        freshness: Bocha AI 时间范围
+        time_range: SearXNG 时间范围
+        language: SearXNG 语言
+        engines: SearXNG 引擎列表（逗号分隔的字符串或列表）
+        safesearch: SearXNG 安全搜索级别
+
+    Returns:
+        str: 缓存键
+    """
+    if isinstance(engines, str):
+        engines = engines.split(',')
+    engines_list = sorted({e.strip().lower() for e in engines or [] if e.strip()})
+
+    return json.dumps([
+        engine,
+        normalize_query(query),
+        count,
+        freshness or '',
+        time_range or '',
+        (language or '').lower(),
+        engines_list,
+        safesearch
+    ], ensure_ascii=False, separators=(',', ':'))
+
+
+def _is_cacheable(results):
+    """判断搜索结果是否可以缓存：不缓存空结果和错误结果"""
+    if not results:
+        return False
+    return not any(item.get('refer') == '错误' for item in results)
+
+
+def get(key):
+    """
+    读取缓存的搜索结果
+
+    Args:
+        key: make_key 生成的缓存键
+
+    Returns:
+        list: 搜索结果列表，未命中时返回 None
+    """
+    if not is_enabled():
+        return None
+    return get_cache().get(key)
+
+
+def put(key, engine, results):
+    """
+    缓存搜索结果
+
+    Args:
+        key: make_key 生成的缓存键
+        engine: 搜索引擎，用于确定过期时间
+        results: 搜索结果列表
+    """
+    if not is_enabled() or not _is_cacheable(results):
+        return
+    get_cache().set(key, results, get_ttl(engine))
+
+
+def get_stats():
+    """
+    获取搜索结果缓存的统计信息
+
+    Returns:
+        dict: 命中、未命中、淘汰次数等统计信息
+    """
+    return get_cache().stats()
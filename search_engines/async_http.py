@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+搜索引擎异步HTTP连接池
+
+为异步流水线提供共享的 httpx.AsyncClient，与 http_session 使用相同的超时配置。
+httpx.AsyncClient 绑定到创建它的事件循环，因此每个事件循环各自持有一个客户端。
+"""
+
+import os
+import asyncio
+import weakref
+import httpx
+from dotenv import load_dotenv
+
+from search_engines.http_session import get_timeout
+from log_config import get_logger
+
+# 加载环境变量
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# 按事件循环缓存的异步客户端
+_clients = weakref.WeakKeyDictionary()
+
+
+def _create_client():
+    """创建带连接池的异步客户端"""
+    limits = httpx.Limits(
+        max_connections=int(os.getenv('SEARCH_HTTP_ASYNC_MAX_CONNECTIONS', '1000')),
+        max_keepalive_connections=int(os.getenv('SEARCH_HTTP_ASYNC_MAX_KEEPALIVE', '100'))
+    )
+    logger.info("搜索引擎异步HTTP连接池已创建: %s", limits)
+    return httpx.AsyncClient(limits=limits)
+
+
+def get_client():
+    """
+    获取当前事件循环共享的异步HTTP客户端
+
+    Returns:
+        httpx.AsyncClient: 共享客户端
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _create_client()
+        _clients[loop] = client
+    return client
+
+
+def to_httpx_timeout(read_timeout=None):
+    """
+    将 http_session 的 (连接超时, 读取超时) 转换为 httpx.Timeout
+
+    Args:
+        read_timeout (float, optional): 调用方的默认读取超时时间，SEARCH_HTTP_READ_TIMEOUT 环境变量优先
+
+    Returns:
+        httpx.Timeout: 超时设置
+    """
+    connect_timeout, read_timeout = get_timeout(read_timeout)
+    return httpx.Timeout(read_timeout, connect=connect_timeout)
+
+
+async def request(method, url, read_timeout=None, **kwargs):
+    """
+    通过共享客户端发送异步请求
+
+    Args:
+        method (str): 请求方法
+        url (str): 请求URL
+        read_timeout (float, optional): 默认读取超时时间
+        **kwargs: 传递给 httpx.AsyncClient.request 的其他参数
+
+    Returns:
+        httpx.Response: 响应对象
+    """
+    kwargs.setdefault('timeout', to_httpx_timeout(read_timeout))
+    return await get_client().request(method, url, **kwargs)
+
+
+async def get(url, read_timeout=None, **kwargs):
+    """通过共享客户端发送异步GET请求"""
+    return await request('GET', url, read_timeout=read_timeout, **kwargs)
+
+
+async def post(url, read_timeout=None, **kwargs):
+    """通过共享客户端发送异步POST请求"""
+    return await request('POST', url, read_timeout=read_timeout, **kwargs)
+
+
+async def close_clients():
+    """关闭当前事件循环的客户端并释放连接"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -8,28 +8,31 @@ Bocha AI搜索引擎实现
 import os
 import json
 import time
-import requests
+import logging
+from search_engines import http_session, async_http
+from log_config import get_logger
 
-def search(query, freshness=None, summary=None, count=None, page=None):
-    """
-    使用Bocha AI搜索引擎执行搜索
+logger = get_logger(__name__)
 
-    Args:
-        query (str): 搜索查询，必填参数
-        freshness (str, optional): 搜索指定时间范围内的网页。可选值：oneDay，oneWeek，oneMonth，oneYear，noLimit（默认），
-                                  或者日期格式如"YYYY-MM-DD..YYYY-MM-DD"或"YYYY-MM-DD"。
-        summary (bool, optional): 是否显示文本摘要。True为显示，False为不显示（默认）。
-        count (int, optional): 返回结果的条数，范围为1-50，默认为10。
-        page (int, optional): 页码，默认为1。
+# Bocha AI搜索接口的默认地址
+WEB_SEARCH_URL = 'https://api.bochaai.com/v1/web-search'
+
+def get_search_url():
+    """获取Bocha AI搜索接口地址，可以通过 BOCHAAI_API_URL 环境变量修改（如指向本地模拟服务）"""
+    return os.getenv('BOCHAAI_API_URL') or WEB_SEARCH_URL
+
+def build_request(query, freshness=None, summary=None, count=None, page=None):
+    """
+    准备Bocha AI搜索请求的负载和请求头，参数含义见 search
 
     Returns:
-        dict: 搜索结果，格式化为与智谱AI兼容的格式
+        dict: 包含 json 和 headers 的请求参数，API密钥未配置时返回 None
     """
     # 获取API密钥
     api_key = os.getenv('BOCHAAI_API_KEY')
 
     if not api_key:
-        return {'error': 'Bocha AI API密钥未配置'}
+        return None
 
     # 准备请求参数
     payload = {
@@ -56,23 +59,72 @@ def search(query, freshness=None, summary=None, count=None, page=None):
         'Authorization': f'Bearer {api_key}'
     }
 
-    print(f'Bocha AI 请求URL: https://api.bochaai.com/v1/web-search')
-    print(f'Bocha AI 请求负载: {json.dumps(payload)}')
+    logger.debug("Bocha AI 请求URL: %s, 请求负载: %s", get_search_url(), payload)
+    return {'json': payload, 'headers': headers}
+
+def search(query, freshness=None, summary=None, count=None, page=None):
+    """
+    使用Bocha AI搜索引擎执行搜索
+
+    Args:
+        query (str): 搜索查询，必填参数
+        freshness (str, optional): 搜索指定时间范围内的网页。可选值：oneDay，oneWeek，oneMonth，oneYear，noLimit（默认），
+                                  或者日期格式如"YYYY-MM-DD..YYYY-MM-DD"或"YYYY-MM-DD"。
+        summary (bool, optional): 是否显示文本摘要。True为显示，False为不显示（默认）。
+        count (int, optional): 返回结果的条数，范围为1-50，默认为10。
+        page (int, optional): 页码，默认为1。
+
+    Returns:
+        dict: 搜索结果，格式化为与智谱AI兼容的格式
+    """
+    request_args = build_request(query, freshness, summary, count, page)
+    if request_args is None:
+        return {'error': 'Bocha AI API密钥未配置'}
 
     # 发送请求
-    response = requests.post(
-        'https://api.bochaai.com/v1/web-search',
-        json=payload,
-        headers=headers,
-        timeout=10  # 设置超时时间
+    response = http_session.post(
+        get_search_url(),
+        read_timeout=10,  # 设置超时时间
+        **request_args
     )
 
     # 检查响应状态
     response.raise_for_status()
 
     # 获取响应数据
-    result = response.json()
-    print(f'Bocha AI 响应结构: {json.dumps(result, indent=2)}')
+    return convert_response(query, response.json(), summary)
+
+async def search_async(query, freshness=None, summary=None, count=None, page=None):
+    """
+    使用Bocha AI搜索引擎执行异步搜索，参数和返回值与 search 相同
+    """
+    request_args = build_request(query, freshness, summary, count, page)
+    if request_args is None:
+        return {'error': 'Bocha AI API密钥未配置'}
+
+    response = await async_http.post(
+        get_search_url(),
+        read_timeout=10,
+        **request_args
+    )
+    response.raise_for_status()
+    return convert_response(query, response.json(), summary)
+
+def convert_response(query, result, summary=None):
+    """
+    将Bocha AI的响应转换为与智谱AI兼容的格式
+
+    Args:
+        query (str): 搜索查询
+        result (dict): Bocha AI的响应数据
+        summary (bool, optional): 是否请求了文本摘要
+
+    Returns:
+        dict: 搜索结果，格式化为与智谱AI兼容的格式
+    """
+    # 完整响应可能很大，只在启用调试日志时序列化
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Bocha AI 响应结构: %s...", json.dumps(result, ensure_ascii=False)[:1000])
 
     # 创建一个与智谱AI响应格式兼容的结果
     converted_result = {
@@ -91,8 +143,6 @@ def search(query, freshness=None, summary=None, count=None, page=None):
     }
 
     # 根据Bocha AI文档处理响应
-    print('完整响应结构:', json.dumps(result, indent=2, ensure_ascii=False)[:1000], '...')
-
     # 检查是否有data字段，这是Bocha AI响应的最外层结构
     if 'data' in result and isinstance(result['data'], dict):
         data = result['data']
@@ -115,12 +165,9 @@ def search(query, freshness=None, summary=None, count=None, page=None):
                 query_context = data['queryContext']
                 converted_result['meta']['originalQuery'] = query_context.get('originalQuery', query)
 
-            print(f'找到 Bocha AI 搜索结果: {len(web_page_values)} 条，总计: {total_results}')
+            logger.info("找到 Bocha AI 搜索结果: %s 条，总计: %s", len(web_page_values), total_results)
 
             for item in web_page_values:
-                # 输出每个结果项的字段
-                print(f'结果项字段: {list(item.keys())}')
-
                 # 根据文档的WebPageValue字段定义提取数据
                 title = item.get('name', '')
                 url = item.get('url', '#')
@@ -158,7 +205,7 @@ def search(query, freshness=None, summary=None, count=None, page=None):
         elif 'images' in data and isinstance(data['images'], dict) and 'value' in data['images']:
             # 如果有图片结果但没有网页结果，也可以展示图片信息
             image_values = data['images'].get('value', [])
-            print(f'找到 Bocha AI 图片结果: {len(image_values)} 条')
+            logger.info("找到 Bocha AI 图片结果: %s 条", len(image_values))
 
             # 将图片结果转换为搜索结果
             for item in image_values[:5]:  # 只取前5张图片
@@ -191,7 +238,7 @@ def search(query, freshness=None, summary=None, count=None, page=None):
         elif 'videos' in data and isinstance(data['videos'], dict) and 'value' in data['videos']:
             # 如果有视频结果但没有网页和图片结果，也可以展示视频信息
             video_values = data['videos'].get('value', [])
-            print(f'找到 Bocha AI 视频结果: {len(video_values)} 条')
+            logger.info("找到 Bocha AI 视频结果: %s 条", len(video_values))
 
             # 将视频结果转换为搜索结果
             for item in video_values[:5]:  # 只取前5个视频
@@ -230,11 +277,11 @@ def search(query, freshness=None, summary=None, count=None, page=None):
                 return converted_result
 
     # 如果没有找到data字段或者data中没有webPages/images字段
-    print('未找到 Bocha AI 搜索结果字段')
+    logger.warning("未找到 Bocha AI 搜索结果字段")
 
     # 尝试检查是否有 results 字段（兼容其他可能的格式）
     if 'results' in result and isinstance(result['results'], list):
-        print(f'找到备用 results 字段: {len(result["results"])} 条')
+        logger.info("找到备用 results 字段: %s 条", len(result['results']))
 
         for item in result['results']:
             title = item.get('title', '')
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+搜索引擎HTTP连接池
+
+为所有搜索引擎适配器提供进程内共享的 requests.Session，
+通过 keep-alive 复用 TCP/TLS 连接，支持按主机设置连接池大小以及可配置的连接、读取超时时间。
+"""
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from log_config import get_logger
+
+# 加载环境变量
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# 进程内共享的会话
+_session = None
+_session_lock = threading.Lock()
+
+
+def _parse_host_pool_sizes(value):
+    """
+    解析按主机设置的连接池大小
+
+    Args:
+        value (str): 形如 "open.bigmodel.cn=32,api.bochaai.com=16" 的配置字符串
+
+    Returns:
+        dict: 主机名到连接池大小的映射
+    """
+    sizes = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        host, size = item.split('=', 1)
+        host = host.strip()
+        if host and size.strip().isdigit():
+            sizes[host] = int(size.strip())
+    return sizes
+
+
+def _create_session():
+    """创建带连接池的会话"""
+    pool_connections = int(os.getenv('SEARCH_HTTP_POOL_CONNECTIONS', '10'))
+    pool_maxsize = int(os.getenv('SEARCH_HTTP_POOL_MAXSIZE', '20'))
+
+    session = requests.Session()
+
+    # 默认连接池：pool_connections 为缓存的主机数量，pool_maxsize 为每个主机的最大连接数
+    default_adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('http://', default_adapter)
+    session.mount('https://', default_adapter)
+
+    # 按主机单独设置连接池大小
+    host_pool_sizes = _parse_host_pool_sizes(os.getenv('SEARCH_HTTP_HOST_POOL_SIZES', ''))
+    for host, size in host_pool_sizes.items():
+        host_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+        session.mount(f'http://{host}', host_adapter)
+        session.mount(f'https://{host}', host_adapter)
+
+    logger.info("搜索引擎HTTP连接池已创建: pool_connections=%s, pool_maxsize=%s, 按主机设置=%s", pool_connections, pool_maxsize, host_pool_sizes)
+    return session
+
+
+def get_session():
+    """
+    获取进程内共享的HTTP会话
+
+    Returns:
+        requests.Session: 共享会话
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+
+def get_timeout(read_timeout=None):
+    """
+    获取 (连接超时, 读取超时) 元组
+
+    Args:
+        read_timeout (float, optional): 调用方的默认读取超时时间，SEARCH_HTTP_READ_TIMEOUT 环境变量优先
+
+    Returns:
+        tuple: (连接超时, 读取超时)
+    """
+    connect_timeout = float(os.getenv('SEARCH_HTTP_CONNECT_TIMEOUT', '3.05'))
+    configured_read_timeout = os.getenv('SEARCH_HTTP_READ_TIMEOUT')
+    if configured_read_timeout:
+        read_timeout = float(configured_read_timeout)
+    return connect_timeout, float(read_timeout or 10)
+
+
+def request(method, url, read_timeout=None, **kwargs):
+    """
+    通过共享会话发送请求
+
+    Args:
+        method (str): 请求方法
+        url (str): 请求URL
+        read_timeout (float, optional): 默认读取超时时间
+        **kwargs: 传递给 requests.Session.request 的其他参数
+
+    Returns:
+        requests.Response: 响应对象
+    """
+    kwargs.setdefault('timeout', get_timeout(read_timeout))
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, read_timeout=None, **kwargs):
+    """通过共享会话发送GET请求"""
+    return request('GET', url, read_timeout=read_timeout, **kwargs)
+
+
+def post(url, read_timeout=None, **kwargs):
+    """通过共享会话发送POST请求"""
+    return request('POST', url, read_timeout=read_timeout, **kwargs)
@@ -8,54 +8,50 @@ SearXNG搜索引擎实现
 import os
 import json
 import time
+import logging
+import httpx
 import requests
+from search_engines import http_session, async_http
 from urllib.parse import urlparse
 from dotenv import load_dotenv
+from log_config import get_logger
 
 # 加载环境变量
 load_dotenv()
 
-def search(query, engines=None, language=None, safesearch=None, time_range=None, count=None):
-    """
-    使用SearXNG搜索引擎执行搜索
+logger = get_logger(__name__)
 
-    Args:
-        query (str): 搜索查询
-        engines (str, optional): 要使用的搜索引擎，用逗号分隔。默认为None，使用SearXNG默认引擎。
-        language (str, optional): 搜索结果的语言。默认为'auto'。
-        safesearch (int, optional): 安全搜索级别(0-2)。默认为1。
-        time_range (str, optional): 搜索结果的时间范围。可选值: day, week, month, year。
-        count (int, optional): 返回结果的数量。默认为None，使用SearXNG默认值。
+def config_error_result(query):
+    """创建 SEARXNG_API_HOST 未配置时的搜索结果"""
+    return {
+        'id': f'searxng_error_{int(time.time())}',
+        'created': int(time.time()),
+        'search_intent': [
+            {
+                'query': query,
+                'intent': 'SEARCH_NONE',
+                'keywords': query
+            }
+        ],
+        'search_result': [
+            {
+                'title': 'SearXNG API配置错误',
+                'link': '#',
+                'content': 'SearXNG API主机地址未配置。请在.env文件中设置SEARXNG_API_HOST环境变量。',
+                'media': 'SearXNG',
+                'icon': '',
+                'refer': '错误'
+            }
+        ]
+    }
 
-    Returns:
-        dict: 搜索结果，格式化为与智谱AI兼容的格式
+def build_request(query, engines=None, language=None, safesearch=None, time_range=None, count=None):
     """
-    # 获取API主机地址
-    api_host = os.getenv('SEARXNG_API_HOST')
-
-    if not api_host:
-        return {
-            'id': f'searxng_error_{int(time.time())}',
-            'created': int(time.time()),
-            'search_intent': [
-                {
-                    'query': query,
-                    'intent': 'SEARCH_NONE',
-                    'keywords': query
-                }
-            ],
-            'search_result': [
-                {
-                    'title': 'SearXNG API配置错误',
-                    'link': '#',
-                    'content': 'SearXNG API主机地址未配置。请在.env文件中设置SEARXNG_API_HOST环境变量。',
-                    'media': 'SearXNG',
-                    'icon': '',
-                    'refer': '错误'
-                }
-            ]
-        }
+    准备SearXNG搜索请求参数，参数含义见 search
 
+    Returns:
+        tuple: (请求参数, 最多返回的结果数量)
+    """
     # 准备搜索参数
     params = {
         'q': query,
@@ -82,11 +78,13 @@ def search(query, engines=None, language=None, safesearch=None, time_range=None,
     if count is not None:
         max_results = count
 
-    print(f'SearXNG 请求URL: {api_host.rstrip("/")}/search')
-    print(f'SearXNG 请求参数: {json.dumps(params)}')
+    logger.debug("SearXNG 请求参数: %s", params)
+    return params, max_results
 
+def create_result(query, engines=None):
+    """创建与智谱AI响应格式兼容的空搜索结果"""
     # 创建一个与智谱AI响应格式兼容的结果
-    converted_result = {
+    return {
         # 根据智谱AI响应格式添加必要字段
         'id': f'searxng_{int(time.time())}',  # 生成一个任务ID
         'created': int(time.time()),  # 当前时间的Unix时间戳
@@ -110,183 +108,251 @@ def search(query, engines=None, language=None, safesearch=None, time_range=None,
         }
     }
 
-    try:
-        # 执行搜索请求
-        response = requests.get(
-            f"{api_host.rstrip('/')}/search",
-            params=params,
-            timeout=10
-        )
-        response.raise_for_status()
-
-        # 解析结果
-        result = response.json()
-        print(f'SearXNG 响应结构: {json.dumps(result)[:500]}...')
-
-        # 处理搜索结果
-        if 'results' in result and isinstance(result['results'], list):
-            # 限制结果数量
-            results = result['results'][:max_results]
-
-            # 添加元数据
-            converted_result['meta']['totalResults'] = result.get('number_of_results', len(results))
-            converted_result['meta']['time'] = result.get('search_time', 0)
-
-            # 处理建议、纠正和答案
-            if 'suggestions' in result and isinstance(result['suggestions'], list):
-                converted_result['suggestions'] = result['suggestions']
-
-            if 'corrections' in result and isinstance(result['corrections'], list):
-                converted_result['corrections'] = result['corrections']
-
-            if 'answers' in result and isinstance(result['answers'], list):
-                for answer in result['answers']:
-                    answer_item = {
-                        'title': answer.get('title', '答案'),
-                        'content': answer.get('content', ''),
-                        'link': answer.get('url', '#'),
-                        'media': 'SearXNG',
-                        'icon': '',
-                        'refer': '答案'
-                    }
-                    converted_result['answers'].append(answer_item)
-
-            if 'infoboxes' in result and isinstance(result['infoboxes'], list):
-                for infobox in result['infoboxes']:
-                    infobox_item = {
-                        'title': infobox.get('title', '信息框'),
-                        'content': infobox.get('content', ''),
-                        'link': infobox.get('url', '#'),
-                        'media': infobox.get('engine', 'SearXNG'),
-                        'icon': infobox.get('img_src', ''),
-                        'id': infobox.get('id', ''),
-                        'infobox': True
-                    }
-                    converted_result['infoboxes'].append(infobox_item)
-
-            # 转换每个搜索结果
-            for item in results:
-                # 提取必要的字段
-                title = item.get('title', '')
-                url = item.get('url', '#')
-                content = item.get('content', '')
-                engine = item.get('engine', '')
-                template = item.get('template', '')
-
-                # 尝试提取网站名称
-                try:
-                    domain = urlparse(url).netloc
-                    media = domain
-                except:
-                    media = engine or 'SearXNG'
-
-                # 提取更多信息（如果有）
-                img_src = item.get('img_src', '')
-                thumbnail = item.get('thumbnail', '')
-                publishedDate = item.get('publishedDate', '')
-
-                # 确定结果类型
-                refer = ''
-                if template == 'images.html' or 'images' in engine.lower() or img_src or thumbnail:
-                    refer = '图片'
-                elif template == 'videos.html' or 'videos' in engine.lower():
-                    refer = '视频'
-                elif template == 'torrent.html' or 'torrent' in engine.lower():
-                    refer = '种子'
-                elif template == 'map.html' or 'map' in engine.lower():
-                    refer = '地图'
-
-                # 构建内容
-                if img_src:
-                    content += f'<br><img src="{img_src}" alt="{title}" style="max-width:200px;">'
-                elif thumbnail:
-                    content += f'<br><img src="{thumbnail}" alt="{title}" style="max-width:200px;">'
-
-                # 添加元数据到内容
-                if publishedDate:
-                    content += f'<br><small>发布时间: {publishedDate}</small>'
-
-                if engine:
-                    content += f'<br><small>搜索引擎: {engine}</small>'
-
-                # 创建搜索结果项
-                search_item = {
-                    'title': title,
-                    'link': url,
-                    'content': content,
-                    'media': media,
-                    'icon': '',
-                    'refer': refer
-                }
+def error_item(title, content):
+    """创建一条错误信息搜索结果项"""
+    return {
+        'title': title,
+        'link': '#',
+        'content': content,
+        'media': 'SearXNG',
+        'icon': '',
+        'refer': '错误'
+    }
 
-                # 添加其他可能的字段
-                for key in ['score', 'category', 'pretty_url', 'parsed_url', 'positions']:
-                    if key in item:
-                        search_item[key] = item[key]
+def convert_response(converted_result, result, max_results):
+    """
+    将SearXNG的响应转换为与智谱AI兼容的格式
 
-                converted_result['search_result'].append(search_item)
+    Args:
+        converted_result (dict): create_result 创建的搜索结果，转换后的结果项会添加到其中
+        result (dict): SearXNG的响应数据
+        max_results (int): 最多返回的结果数量
 
-        else:
-            # 如果没有找到结果
-            if 'error' in result:
-                error_message = result.get('error', 'SearXNG未返回搜索结果')
-            else:
-                error_message = '未找到搜索结果'
-
-            # 处理其他可能的字段
-            if 'suggestions' in result and isinstance(result['suggestions'], list):
-                converted_result['suggestions'] = result['suggestions']
-
-            if 'corrections' in result and isinstance(result['corrections'], list):
-                converted_result['corrections'] = result['corrections']
-
-            if 'answers' in result and isinstance(result['answers'], list):
-                for answer in result['answers']:
-                    answer_item = {
-                        'title': answer.get('title', '答案'),
-                        'content': answer.get('content', ''),
-                        'link': answer.get('url', '#'),
-                        'media': 'SearXNG',
-                        'icon': '',
-                        'refer': '答案'
-                    }
-                    converted_result['answers'].append(answer_item)
-
-            # 添加错误信息到搜索结果
+    Returns:
+        dict: 搜索结果，格式化为与智谱AI兼容的格式
+    """
+    # 完整响应可能很大，只在启用调试日志时序列化
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("SearXNG 响应结构: %s...", json.dumps(result, ensure_ascii=False)[:500])
+
+    # 处理搜索结果
+    if 'results' in result and isinstance(result['results'], list):
+        # 限制结果数量
+        results = result['results'][:max_results]
+
+        # 添加元数据
+        converted_result['meta']['totalResults'] = result.get('number_of_results', len(results))
+        converted_result['meta']['time'] = result.get('search_time', 0)
+
+        # 处理建议、纠正和答案
+        if 'suggestions' in result and isinstance(result['suggestions'], list):
+            converted_result['suggestions'] = result['suggestions']
+
+        if 'corrections' in result and isinstance(result['corrections'], list):
+            converted_result['corrections'] = result['corrections']
+
+        if 'answers' in result and isinstance(result['answers'], list):
+            for answer in result['answers']:
+                answer_item = {
+                    'title': answer.get('title', '答案'),
+                    'content': answer.get('content', ''),
+                    'link': answer.get('url', '#'),
+                    'media': 'SearXNG',
+                    'icon': '',
+                    'refer': '答案'
+                }
+                converted_result['answers'].append(answer_item)
+
+        if 'infoboxes' in result and isinstance(result['infoboxes'], list):
+            for infobox in result['infoboxes']:
+                infobox_item = {
+                    'title': infobox.get('title', '信息框'),
+                    'content': infobox.get('content', ''),
+                    'link': infobox.get('url', '#'),
+                    'media': infobox.get('engine', 'SearXNG'),
+                    'icon': infobox.get('img_src', ''),
+                    'id': infobox.get('id', ''),
+                    'infobox': True
+                }
+                converted_result['infoboxes'].append(infobox_item)
+
+        # 转换每个搜索结果
+        for item in results:
+            # 提取必要的字段
+            title = item.get('title', '')
+            url = item.get('url', '#')
+            content = item.get('content', '')
+            engine = item.get('engine', '')
+            template = item.get('template', '')
+
+            # 尝试提取网站名称
+            try:
+                domain = urlparse(url).netloc
+                media = domain
+            except:
+                media = engine or 'SearXNG'
+
+            # 提取更多信息（如果有）
+            img_src = item.get('img_src', '')
+            thumbnail = item.get('thumbnail', '')
+            publishedDate = item.get('publishedDate', '')
+
+            # 确定结果类型
+            refer = ''
+            if template == 'images.html' or 'images' in engine.lower() or img_src or thumbnail:
+                refer = '图片'
+            elif template == 'videos.html' or 'videos' in engine.lower():
+                refer = '视频'
+            elif template == 'torrent.html' or 'torrent' in engine.lower():
+                refer = '种子'
+            elif template == 'map.html' or 'map' in engine.lower():
+                refer = '地图'
+
+            # 构建内容
+            if img_src:
+                content += f'<br><img src="{img_src}" alt="{title}" style="max-width:200px;">'
+            elif thumbnail:
+                content += f'<br><img src="{thumbnail}" alt="{title}" style="max-width:200px;">'
+
+            # 添加元数据到内容
+            if publishedDate:
+                content += f'<br><small>发布时间: {publishedDate}</small>'
+
+            if engine:
+                content += f'<br><small>搜索引擎: {engine}</small>'
+
+            # 创建搜索结果项
             search_item = {
-                'title': 'SearXNG 搜索结果',
-                'link': '#',
-                'content': error_message,
-                'media': 'SearXNG',
+                'title': title,
+                'link': url,
+                'content': content,
+                'media': media,
                 'icon': '',
-                'refer': ''
+                'refer': refer
             }
+
+            # 添加其他可能的字段
+            for key in ['score', 'category', 'pretty_url', 'parsed_url', 'positions']:
+                if key in item:
+                    search_item[key] = item[key]
+
             converted_result['search_result'].append(search_item)
 
-    except requests.exceptions.RequestException as e:
-        print(f'SearXNG API请求错误: {str(e)}')
-        # 创建一个错误响应
+    else:
+        # 如果没有找到结果
+        if 'error' in result:
+            error_message = result.get('error', 'SearXNG未返回搜索结果')
+        else:
+            error_message = '未找到搜索结果'
+
+        # 处理其他可能的字段
+        if 'suggestions' in result and isinstance(result['suggestions'], list):
+            converted_result['suggestions'] = result['suggestions']
+
+        if 'corrections' in result and isinstance(result['corrections'], list):
+            converted_result['corrections'] = result['corrections']
+
+        if 'answers' in result and isinstance(result['answers'], list):
+            for answer in result['answers']:
+                answer_item = {
+                    'title': answer.get('title', '答案'),
+                    'content': answer.get('content', ''),
+                    'link': answer.get('url', '#'),
+                    'media': 'SearXNG',
+                    'icon': '',
+                    'refer': '答案'
+                }
+                converted_result['answers'].append(answer_item)
+
+        # 添加错误信息到搜索结果
         search_item = {
-            'title': 'SearXNG 搜索错误',
+            'title': 'SearXNG 搜索结果',
             'link': '#',
-            'content': f'请求SearXNG搜索引擎时发生错误: {str(e)}',
+            'content': error_message,
             'media': 'SearXNG',
             'icon': '',
-            'refer': '错误'
+            'refer': ''
         }
         converted_result['search_result'].append(search_item)
 
+    return converted_result
+
+def search(query, engines=None, language=None, safesearch=None, time_range=None, count=None):
+    """
+    使用SearXNG搜索引擎执行搜索
+
+    Args:
+        query (str): 搜索查询
+        engines (str, optional): 要使用的搜索引擎，用逗号分隔。默认为None，使用SearXNG默认引擎。
+        language (str, optional): 搜索结果的语言。默认为'auto'。
+        safesearch (int, optional): 安全搜索级别(0-2)。默认为1。
+        time_range (str, optional): 搜索结果的时间范围。可选值: day, week, month, year。
+        count (int, optional): 返回结果的数量。默认为None，使用SearXNG默认值。
+
+    Returns:
+        dict: 搜索结果，格式化为与智谱AI兼容的格式
+    """
+    # 获取API主机地址
+    api_host = os.getenv('SEARXNG_API_HOST')
+
+    if not api_host:
+        return config_error_result(query)
+
+    params, max_results = build_request(query, engines, language, safesearch, time_range, count)
+    logger.debug("SearXNG 请求URL: %s/search", api_host.rstrip('/'))
+    converted_result = create_result(query, engines)
+
+    try:
+        # 执行搜索请求
+        response = http_session.get(
+            f"{api_host.rstrip('/')}/search",
+            params=params,
+            read_timeout=10
+        )
+        response.raise_for_status()
+
+        # 解析结果
+        return convert_response(converted_result, response.json(), max_results)
+
+    except requests.exceptions.RequestException as e:
+        logger.error("SearXNG API请求错误: %s", e)
+        # 创建一个错误响应
+        converted_result['search_result'].append(error_item('SearXNG 搜索错误', f'请求SearXNG搜索引擎时发生错误: {str(e)}'))
+
     except json.JSONDecodeError as e:
-        print(f'SearXNG 响应JSON解析错误: {str(e)}')
+        logger.error("SearXNG 响应JSON解析错误: %s", e)
         # 创建一个错误响应
-        search_item = {
-            'title': 'SearXNG 响应格式错误',
-            'link': '#',
-            'content': f'无法解析SearXNG的响应: {str(e)}',
-            'media': 'SearXNG',
-            'icon': '',
-            'refer': '错误'
-        }
-        converted_result['search_result'].append(search_item)
+        converted_result['search_result'].append(error_item('SearXNG 响应格式错误', f'无法解析SearXNG的响应: {str(e)}'))
+
+    return converted_result
+
+async def search_async(query, engines=None, language=None, safesearch=None, time_range=None, count=None):
+    """
+    使用SearXNG搜索引擎执行异步搜索，参数和返回值与 search 相同
+    """
+    api_host = os.getenv('SEARXNG_API_HOST')
+
+    if not api_host:
+        return config_error_result(query)
+
+    params, max_results = build_request(query, engines, language, safesearch, time_range, count)
+    converted_result = create_result(query, engines)
+
+    try:
+        response = await async_http.get(
+            f"{api_host.rstrip('/')}/search",
+            params=params,
+            read_timeout=10
+        )
+        response.raise_for_status()
+        return convert_response(converted_result, response.json(), max_results)
+
+    except httpx.HTTPError as e:
+        logger.error("SearXNG API请求错误: %s", e)
+        converted_result['search_result'].append(error_item('SearXNG 搜索错误', f'请求SearXNG搜索引擎时发生错误: {str(e)}'))
+
+    except json.JSONDecodeError as e:
+        logger.error("SearXNG 响应JSON解析错误: %s", e)
+        converted_result['search_result'].append(error_item('SearXNG 响应格式错误', f'无法解析SearXNG的响应: {str(e)}'))
 
     return converted_result
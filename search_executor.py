@@ -0,0 +1,493 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+并发搜索执行模块
+
+这个模块提供了一个有界的并发搜索执行器，用于并行执行多个关键词的搜索。
+所有关键词的搜索共享同一个截止时间，截止时间到达时使用已返回的结果，
+仍在线程池中排队的搜索被取消（单独统计，用于发现线程池过小），结果按照原始关键词顺序合并，
+并记录每个关键词的搜索耗时。同时提供与问题分析并行执行的推测搜索。
+异步流水线使用基于 asyncio 的同名实现（函数名以 _async 结尾），返回相同格式的结果。
+
+搜索在线程池中执行时复制提交时的 contextvars 上下文，请求 ID 和耗时追踪记录随之传递到搜索线程，
+外层并发搜索的截止时刻也随之传递，嵌套的并发搜索（如联合搜索）据此在外层截止之前返回。
+请求被取消（客户端断开连接）时，排队中的搜索被取消，不再等待正在执行的搜索。
+"""
+
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from log_config import get_logger
+import cancellation
+import metrics
+
+logger = get_logger(__name__)
+
+# 按名称区分的全局线程池（进程内共享）
+_executors = {}
+_executor_lock = threading.Lock()
+
+# 当前搜索所在的并发搜索的截止时刻（time.perf_counter() 的值），不在并发搜索中时为 None
+_cutoff = contextvars.ContextVar('search_cutoff', default=None)
+
+
+def get_max_workers():
+    """获取线程池的最大并发数，默认为8"""
+    return max(1, int(os.getenv('SEARCH_MAX_WORKERS', '8')))
+
+
+def get_search_deadline():
+    """获取每个请求的搜索截止时间（秒），默认为15秒"""
+    return float(os.getenv('SEARCH_DEADLINE', '15'))
+
+
+def get_time_left():
+    """
+    获取当前搜索所在的并发搜索剩余的时间
+
+    Returns:
+        float: 距离外层截止时间的秒数（已超过时为 0），不在并发搜索中时为 None
+    """
+    cutoff = _cutoff.get()
+    if cutoff is None:
+        return None
+    return max(0.0, cutoff - time.perf_counter())
+
+
+def _task_context(cutoff):
+    """复制当前的 contextvars 上下文，并设置搜索任务所在并发搜索的截止时刻"""
+    context = contextvars.copy_context()
+    context.run(_cutoff.set, cutoff)
+    return context
+
+
+def get_executor(name='search', max_workers=None):
+    """
+    获取进程内共享的搜索线程池
+
+    不同层级的并发任务（如关键词搜索与其内部的多引擎搜索）应使用不同名称的线程池，
+    避免外层任务占满线程池后内层任务无法执行。
+
+    Args:
+        name: 线程池名称
+        max_workers: 最大并发数，默认为 SEARCH_MAX_WORKERS 环境变量
+
+    Returns:
+        ThreadPoolExecutor: 搜索线程池
+    """
+    executor = _executors.get(name)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=max_workers or get_max_workers(),
+                    thread_name_prefix=name
+                )
+                _executors[name] = executor
+    return executor
+
+
+def _timed_call(search_func, keyword, args, kwargs, started=None, index=None):
+    """执行单个搜索并记录耗时，started 不为 None 时在 started[index] 中记录开始执行的时间"""
+    start = time.perf_counter()
+    if started is not None:
+        started[index] = start
+    results = search_func(keyword, *args, **kwargs)
+    return results, time.perf_counter() - start
+
+
+def run_concurrent_searches(search_func, keywords, *args, deadline=None, executor=None, **kwargs):
+    """
+    并发执行多个关键词的搜索
+
+    Args:
+        search_func: 搜索函数，签名为 search_func(keyword, *args, **kwargs)，返回结果列表
+        keywords: 搜索关键词列表
+        *args: 传递给搜索函数的位置参数
+        deadline: 本次请求的截止时间（秒），默认为 SEARCH_DEADLINE 环境变量；
+            到达截止时间时仍在线程池中排队的搜索被取消
+        executor: 使用的线程池，默认为共享的搜索线程池
+        **kwargs: 传递给搜索函数的关键字参数
+
+    Returns:
+        list: 与 keywords 顺序一致的列表，每一项为包含以下字段的字典：
+            keyword: 搜索关键词
+            results: 搜索结果列表（超时或出错时为空列表）
+            latency: 搜索耗时（秒），超时的关键词为截止时间
+            status: "ok"、"error"、"timeout"（执行或排队超时）或 "cancelled"（请求被取消）
+    """
+    if deadline is None:
+        deadline = get_search_deadline()
+
+    # 按原始顺序预留结果位置
+    slots = [
+        {'keyword': keyword, 'results': [], 'latency': None, 'status': 'timeout'}
+        for keyword in keywords
+    ]
+    if not keywords:
+        return slots
+
+    executor = executor or get_executor()
+    start = time.perf_counter()
+    # 各关键词的搜索开始执行的时间，排队中的搜索为 None
+    started = [None] * len(keywords)
+    futures = {
+        executor.submit(
+            _task_context(start + deadline).run, _timed_call, search_func, keyword, args, kwargs, started, index
+        ): index
+        for index, keyword in enumerate(keywords)
+    }
+
+    # 请求被取消时唤醒等待，不再等待正在执行的搜索
+    token = cancellation.current_token()
+    cancelled = Future()
+
+    def wake():
+        cancelled.set_result(None)
+
+    if token is not None:
+        token.add_callback(wake)
+
+    # 结果到达后立即放入对应位置，直到全部完成、超过截止时间或请求被取消
+    pending = set(futures)
+    while pending and not cancelled.done():
+        remaining = deadline - (time.perf_counter() - start)
+        if remaining <= 0:
+            break
+
+        done, _ = wait(pending | {cancelled}, timeout=remaining, return_when=FIRST_COMPLETED)
+        done.discard(cancelled)
+        pending -= done
+        for future in done:
+            slot = slots[futures[future]]
+            try:
+                results, latency = future.result()
+                slot['results'] = results or []
+                slot['latency'] = round(latency, 3)
+                slot['status'] = 'ok'
+                logger.info("搜索 '%s' 完成，获取到 %s 条结果，耗时 %.3f 秒", slot['keyword'], len(slot['results']), latency)
+            except Exception as e:
+                slot['latency'] = round(time.perf_counter() - start, 3)
+                slot['status'] = 'error'
+                metrics.record_error('search', type(e).__name__)
+                logger.error("搜索 '%s' 出错: %s", slot['keyword'], e)
+
+    if token is not None:
+        token.remove_callback(wake)
+
+    if cancelled.done():
+        # 请求已取消：取消排队中的搜索，正在执行的搜索的结果被丢弃
+        for future in pending:
+            future.cancel()
+            slot = slots[futures[future]]
+            slot['latency'] = round(time.perf_counter() - start, 3)
+            slot['status'] = 'cancelled'
+            metrics.record_cancellation('search')
+        if pending:
+            logger.info("请求已取消，放弃 %s 个未完成的搜索", len(pending))
+        return slots
+
+    # 超过截止时间仍未完成的搜索：取消排队中的搜索，放弃等待正在执行的搜索
+    for future in pending:
+        slot = slots[futures[future]]
+        slot['latency'] = round(deadline, 3)
+        if started[futures[future]] is None and future.cancel():
+            # 截止时间到达时仍在排队，说明线程池过小
+            metrics.record_error('search', 'QueueTimeout')
+            logger.warning("搜索 '%s' 到达截止时间 %s 秒时仍在排队，已取消", slot['keyword'], deadline)
+        else:
+            metrics.record_error('search', 'Timeout')
+            logger.warning("搜索 '%s' 超过截止时间 %s 秒，已放弃", slot['keyword'], deadline)
+
+    return slots
+
+
+async def _timed_call_async(search_func, keyword, args, kwargs):
+    """执行单个异步搜索并记录耗时"""
+    start = time.perf_counter()
+    results = await search_func(keyword, *args, **kwargs)
+    return results, time.perf_counter() - start
+
+
+async def run_concurrent_searches_async(search_func, keywords, *args, deadline=None, **kwargs):
+    """
+    在当前事件循环中并发执行多个关键词的搜索
+
+    Args:
+        search_func: 异步搜索函数，签名为 search_func(keyword, *args, **kwargs)，返回结果列表
+        keywords: 搜索关键词列表
+        *args: 传递给搜索函数的位置参数
+        deadline: 本次请求的截止时间（秒），默认为 SEARCH_DEADLINE 环境变量
+        **kwargs: 传递给搜索函数的关键字参数
+
+    Returns:
+        list: 与 run_concurrent_searches 格式相同的结果列表
+    """
+    if deadline is None:
+        deadline = get_search_deadline()
+
+    slots = [
+        {'keyword': keyword, 'results': [], 'latency': None, 'status': 'timeout'}
+        for keyword in keywords
+    ]
+    if not keywords:
+        return slots
+
+    start = time.perf_counter()
+    # 任务创建时复制当前上下文，搜索任务中可以读取截止时刻
+    cutoff_token = _cutoff.set(start + deadline)
+    try:
+        tasks = {
+            asyncio.ensure_future(_timed_call_async(search_func, keyword, args, kwargs)): index
+            for index, keyword in enumerate(keywords)
+        }
+    finally:
+        _cutoff.reset(cutoff_token)
+
+    # 结果到达后立即放入对应位置，直到全部完成或超过截止时间
+    pending = set(tasks)
+    while pending:
+        remaining = deadline - (time.perf_counter() - start)
+        if remaining <= 0:
+            break
+
+        try:
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # 请求被取消（客户端断开连接）：搜索任务不会随等待一起取消，需要单独取消
+            for task in pending:
+                task.cancel()
+                metrics.record_cancellation('search')
+            if pending:
+                logger.info("请求已取消，取消 %s 个未完成的搜索", len(pending))
+            raise
+        for task in done:
+            slot = slots[tasks[task]]
+            try:
+                results, latency = task.result()
+                slot['results'] = results or []
+                slot['latency'] = round(latency, 3)
+                slot['status'] = 'ok'
+                logger.info("搜索 '%s' 完成，获取到 %s 条结果，耗时 %.3f 秒", slot['keyword'], len(slot['results']), latency)
+            except Exception as e:
+                slot['latency'] = round(time.perf_counter() - start, 3)
+                slot['status'] = 'error'
+                metrics.record_error('search', type(e).__name__)
+                logger.error("搜索 '%s' 出错: %s", slot['keyword'], e)
+
+    # 超过截止时间仍未完成的搜索：取消任务（协程可以立即取消，不会继续占用连接）
+    for task in pending:
+        task.cancel()
+        slot = slots[tasks[task]]
+        slot['latency'] = round(deadline, 3)
+        metrics.record_error('search', 'Timeout')
+        logger.warning("搜索 '%s' 超过截止时间 %s 秒，已取消", slot['keyword'], deadline)
+
+    return slots
+
+
+def merge_search_results(keyword_searches):
+    """
+    按照原始关键词顺序合并搜索结果
+
+    Args:
+        keyword_searches: run_concurrent_searches 的返回值
+
+    Returns:
+        list: 合并后的搜索结果列表
+    """
+    all_results = []
+    for item in keyword_searches:
+        all_results.extend(item['results'])
+    return all_results
+
+
+def get_keyword_latencies(keyword_searches):
+    """
+    提取每个关键词的搜索耗时信息
+
+    Args:
+        keyword_searches: run_concurrent_searches 的返回值
+
+    Returns:
+        list: 每个关键词的耗时信息
+    """
+    return [
+        {
+            'keyword': item['keyword'],
+            'latency': item['latency'],
+            'status': item['status'],
+            'result_count': len(item['results']),
+            'speculative': item.get('speculative', False)
+        }
+        for item in keyword_searches
+    ]
+
+
+# 推测搜索统计信息
+_speculation_stats = {
+    'started': 0,
+    'used': 0,
+    'wasted': 0,
+    'cancelled': 0
+}
+_speculation_stats_lock = threading.Lock()
+
+
+def _record_speculation(name):
+    with _speculation_stats_lock:
+        _speculation_stats[name] += 1
+
+
+def is_speculative_enabled(override=None):
+    """
+    是否启用推测搜索
+
+    Args:
+        override: 请求级别的设置，为 None 时使用 SPECULATIVE_SEARCH_ENABLED 环境变量（默认不启用）
+
+    Returns:
+        bool: 是否启用推测搜索
+    """
+    if override is not None:
+        return bool(override)
+    return os.getenv('SPECULATIVE_SEARCH_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+
+class SpeculativeSearch:
+    """
+    推测搜索
+
+    在分析用户问题的同时，使用原始问题提前开始搜索。
+    分析结果需要搜索时合并推测搜索的结果，不需要搜索时丢弃结果并尝试取消搜索。
+    """
+
+    def __init__(self, search_func, query, *args, **kwargs):
+        self.query = query
+        self.start = time.perf_counter()
+        self.future = get_executor().submit(contextvars.copy_context().run, _timed_call, search_func, query, args, kwargs)
+        _record_speculation('started')
+
+    def collect(self, deadline=None):
+        """
+        等待推测搜索完成并返回结果
+
+        Args:
+            deadline: 截止时间（秒，从推测搜索开始时计算），默认为 SEARCH_DEADLINE 环境变量
+
+        Returns:
+            dict: 与 run_concurrent_searches 返回的列表项格式相同，并带有 speculative 标记
+        """
+        if deadline is None:
+            deadline = get_search_deadline()
+
+        slot = {'keyword': self.query, 'results': [], 'latency': round(deadline, 3), 'status': 'timeout', 'speculative': True}
+        remaining = deadline - (time.perf_counter() - self.start)
+        try:
+            results, latency = self.future.result(timeout=max(0, remaining))
+            slot['results'] = results or []
+            slot['latency'] = round(latency, 3)
+            slot['status'] = 'ok'
+            _record_speculation('used')
+            logger.info("推测搜索 '%s' 结果已使用，获取到 %s 条结果，耗时 %.3f 秒", self.query, len(slot['results']), latency)
+        except FutureTimeoutError:
+            self.future.cancel()
+            _record_speculation('wasted')
+            logger.warning("推测搜索 '%s' 超过截止时间 %s 秒，已放弃", self.query, deadline)
+        except Exception as e:
+            slot['status'] = 'error'
+            _record_speculation('wasted')
+            logger.error("推测搜索 '%s' 出错: %s", self.query, e)
+        return slot
+
+    def discard(self):
+        """丢弃推测搜索：尚未开始时取消执行，已开始时忽略其结果"""
+        _record_speculation('wasted')
+        if self.future.cancel():
+            _record_speculation('cancelled')
+            logger.info("不需要搜索，推测搜索 '%s' 已取消", self.query)
+        else:
+            logger.info("不需要搜索，推测搜索 '%s' 的结果已丢弃", self.query)
+
+
+class AsyncSpeculativeSearch:
+    """
+    异步推测搜索，与 SpeculativeSearch 相同，但在当前事件循环中以任务的形式执行
+    """
+
+    def __init__(self, search_func, query, *args, **kwargs):
+        self.query = query
+        self.start = time.perf_counter()
+        self.task = asyncio.ensure_future(_timed_call_async(search_func, query, args, kwargs))
+        _record_speculation('started')
+        # 推测搜索是独立的任务，发起请求的任务被取消（客户端断开连接）时需要单独取消
+        request_task = asyncio.current_task()
+        if request_task is not None:
+            request_task.add_done_callback(self._cancel_with_request)
+
+    def _cancel_with_request(self, request_task):
+        if request_task.cancelled() and not self.task.done():
+            self.task.cancel()
+            metrics.record_cancellation('search')
+
+    async def collect(self, deadline=None):
+        """
+        等待推测搜索完成并返回结果
+
+        Args:
+            deadline: 截止时间（秒，从推测搜索开始时计算），默认为 SEARCH_DEADLINE 环境变量
+
+        Returns:
+            dict: 与 SpeculativeSearch.collect 的返回值格式相同
+        """
+        if deadline is None:
+            deadline = get_search_deadline()
+
+        slot = {'keyword': self.query, 'results': [], 'latency': round(deadline, 3), 'status': 'timeout', 'speculative': True}
+        remaining = deadline - (time.perf_counter() - self.start)
+        try:
+            results, latency = await asyncio.wait_for(asyncio.shield(self.task), timeout=max(0, remaining))
+            slot['results'] = results or []
+            slot['latency'] = round(latency, 3)
+            slot['status'] = 'ok'
+            _record_speculation('used')
+            logger.info("推测搜索 '%s' 结果已使用，获取到 %s 条结果，耗时 %.3f 秒", self.query, len(slot['results']), latency)
+        except asyncio.TimeoutError:
+            self.task.cancel()
+            _record_speculation('wasted')
+            logger.warning("推测搜索 '%s' 超过截止时间 %s 秒，已放弃", self.query, deadline)
+        except Exception as e:
+            slot['status'] = 'error'
+            _record_speculation('wasted')
+            logger.error("推测搜索 '%s' 出错: %s", self.query, e)
+        return slot
+
+    def discard(self):
+        """丢弃推测搜索并取消尚未完成的任务"""
+        _record_speculation('wasted')
+        if not self.task.done():
+            self.task.cancel()
+            _record_speculation('cancelled')
+            logger.info("不需要搜索，推测搜索 '%s' 已取消", self.query)
+        else:
+            logger.info("不需要搜索，推测搜索 '%s' 的结果已丢弃", self.query)
+
+
+def get_speculation_stats():
+    """
+    获取推测搜索的统计信息
+
+    Returns:
+        dict: 启动、使用、浪费和取消的次数以及使用率
+    """
+    with _speculation_stats_lock:
+        stats = dict(_speculation_stats)
+    finished = stats['used'] + stats['wasted']
+    stats['used_rate'] = round(stats['used'] / finished, 4) if finished else 0.0
+    return stats
@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求合并模块（single-flight）
+
+多个用户在同一时间提交相同的问题时，只执行一次分析、搜索和回答，
+其他相同的请求等待并共享这一次执行的结果：
+- 非流式请求：等待领头请求完成后返回相同的结果
+- 流式请求：由后台任务读取一次上游输出，生成的每个数据块分发给所有订阅者，
+  中途加入的订阅者会先收到已经生成的数据块；所有订阅者都断开连接后停止后台任务，
+  不再继续搜索和读取上游输出
+
+请求键由规范化后的问题、搜索引擎、结果数量、模型、是否跳过分析、是否推测搜索和搜索参数组成；
+流式和非流式请求分别合并，不会互相共享结果。上游出错时所有订阅者都收到相同的错误数据块和结束标记。
+同时提供基于 asyncio 的同名实现（函数名以 _async 结尾），用于异步服务模式。
+"""
+
+import os
+import json
+import asyncio
+import threading
+import contextvars
+from dotenv import load_dotenv
+
+from cache_store import normalize_query
+from log_config import get_logger
+import cancellation
+import search_executor
+import sse_events
+import metrics
+
+# 加载环境变量
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# 正在执行的请求（同步）
+_flights = {}
+_stream_flights = {}
+_lock = threading.Lock()
+
+# 正在执行的请求（异步，在事件循环内访问，不需要加锁）
+_async_flights = {}
+_async_stream_flights = {}
+
+# 合并统计信息
+_stats = {
+    'leaders': 0,
+    'followers': 0,
+    'stream_leaders': 0,
+    'stream_followers': 0
+}
+_stats_lock = threading.Lock()
+
+
+def is_enabled():
+    """是否启用请求合并，默认不启用"""
+    return os.getenv('SINGLEFLIGHT_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+
+def make_key(query, engine, count, model_id, skip_analysis=False, speculative=None, **search_params):
+    """
+    生成请求键
+
+    Args:
+        query: 用户问题
+        engine: 搜索引擎
+        count: 结果数量
+        model_id: 模型标识符
+        skip_analysis: 是否跳过分析步骤
+        speculative: 是否启用推测搜索，为 None 时使用环境变量配置
+        **search_params: 其他搜索参数
+
+    Returns:
+        str: 请求键
+    """
+    # 推测搜索使用原始问题搜索，搜索结果可能与分析后的关键词不同
+    speculative = search_executor.is_speculative_enabled(speculative)
+    return json.dumps(
+        [normalize_query(query), engine, count, model_id or '', bool(skip_analysis), speculative, search_params],
+        ensure_ascii=False, sort_keys=True
+    )
+
+
+def _record(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class _Flight:
+    """一次非流式执行，等待者通过 event 获取结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _StreamFlight:
+    """一次流式执行，已生成的数据块保存在 chunks 中，订阅者按顺序读取"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.condition = threading.Condition()
+        self.subscribers = 0
+        # 所有订阅者都断开连接时取消，后台线程和搜索线程随之停止
+        self.token = cancellation.CancelToken()
+
+
+def do(key, fn):
+    """
+    执行非流式请求，相同键的并发请求只执行一次
+
+    Args:
+        key: 请求键
+        fn: 执行请求的函数，无参数
+
+    Returns:
+        fn 的返回值（所有等待者共享同一个对象，调用方不应修改）
+    """
+    with _lock:
+        flight = _flights.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = _Flight()
+            _flights[key] = flight
+
+    if not is_leader:
+        _record('followers')
+        logger.info("合并相同的请求，等待正在执行的请求完成")
+        flight.event.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    _record('leaders')
+    try:
+        flight.result = fn()
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+        flight.event.set()
+
+
+def _produce(key, flight, generator_fn):
+    """在后台线程中读取上游流式输出，并通知所有订阅者；所有订阅者都断开连接后停止读取"""
+    cancellation.set_token(flight.token)
+    chunks = None
+    try:
+        chunks = generator_fn()
+        for chunk in chunks:
+            if flight.token.cancelled:
+                break
+            with flight.condition:
+                flight.chunks.append(chunk)
+                flight.condition.notify_all()
+    except cancellation.Cancelled:
+        logger.info("合并的流式请求已取消")
+    except Exception as e:
+        logger.exception("合并的流式请求出错: %s", e)
+        metrics.record_error('stream', type(e).__name__)
+        # 所有订阅者都收到错误消息和结束标记
+        with flight.condition:
+            flight.chunks.append(sse_events.stream_error_frames(e))
+    finally:
+        # 提前停止时关闭上游输出
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+        with _lock:
+            if _stream_flights.get(key) is flight:
+                del _stream_flights[key]
+        with flight.condition:
+            flight.done = True
+            flight.condition.notify_all()
+
+
+def _subscribe(key, flight):
+    """
+    按顺序读取流式执行生成的数据块，直到执行结束
+
+    等待期间（分析问题、搜索）每隔 SSE_HEARTBEAT_INTERVAL 秒输出一个心跳数据块，
+    客户端断开连接时写入失败，服务器随之关闭订阅，不需要等到搜索完成。
+    在其他线程中读取订阅时（见 sse_events.batch_frames），读取线程的取消令牌被取消后立即结束订阅。
+    """
+    index = 0
+    interval = sse_events.heartbeat_interval()
+    token = cancellation.current_token()
+
+    def wake():
+        with flight.condition:
+            flight.condition.notify_all()
+
+    if token is not None:
+        token.add_callback(wake)
+    try:
+        while True:
+            with flight.condition:
+                ready = flight.condition.wait_for(
+                    lambda: index < len(flight.chunks) or flight.done or (token is not None and token.cancelled),
+                    interval
+                )
+                chunks = flight.chunks[index:]
+                done = flight.done
+            if token is not None and token.cancelled:
+                return
+            if not ready:
+                yield sse_events.HEARTBEAT_FRAME
+                continue
+            index += len(chunks)
+            for chunk in chunks:
+                yield chunk
+            if done:
+                return
+    finally:
+        if token is not None:
+            token.remove_callback(wake)
+        _unsubscribe(key, flight)
+
+
+def _unsubscribe(key, flight):
+    """订阅者结束读取，所有订阅者都提前断开连接时取消执行"""
+    with _lock:
+        flight.subscribers -= 1
+        abandoned = flight.subscribers == 0 and not flight.done
+        # 已取消的执行不再接受新的订阅者
+        if abandoned and _stream_flights.get(key) is flight:
+            del _stream_flights[key]
+    if abandoned:
+        logger.info("合并的流式请求的所有订阅者都已断开连接，停止执行")
+        metrics.record_cancellation('singleflight')
+        flight.token.cancel()
+
+
+def stream(key, generator_fn):
+    """
+    执行流式请求，相同键的并发请求共享同一个上游输出
+
+    Args:
+        key: 请求键
+        generator_fn: 返回数据块迭代器的函数，无参数
+
+    Returns:
+        generator: 数据块生成器
+    """
+    with _lock:
+        flight = _stream_flights.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = _StreamFlight()
+            _stream_flights[key] = flight
+        flight.subscribers += 1
+
+    if is_leader:
+        _record('stream_leaders')
+        # 后台任务在领头请求的上下文中执行，日志中的请求 ID 与领头请求相同
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(_produce, key, flight, generator_fn), daemon=True).start()
+    else:
+        _record('stream_followers')
+        logger.info("合并相同的流式请求，订阅正在执行的输出")
+    return _subscribe(key, flight)
+
+
+async def do_async(key, coro_fn):
+    """
+    执行非流式异步请求，相同键的并发请求只执行一次
+
+    Args:
+        key: 请求键
+        coro_fn: 返回协程的函数，无参数
+
+    Returns:
+        协程的返回值（所有等待者共享同一个对象，调用方不应修改）
+    """
+    future = _async_flights.get(key)
+    if future is not None:
+        _record('followers')
+        logger.info("合并相同的请求，等待正在执行的请求完成")
+        return await asyncio.shield(future)
+
+    _record('leaders')
+    future = asyncio.get_running_loop().create_future()
+    _async_flights[key] = future
+    try:
+        result = await coro_fn()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        # 没有等待者时避免"异常未被获取"的警告
+        future.exception()
+        raise
+    finally:
+        _async_flights.pop(key, None)
+
+
+class _AsyncStreamFlight:
+    """一次异步流式执行"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.condition = asyncio.Condition()
+        self.subscribers = 0
+        self.task = None
+
+
+async def _produce_async(key, flight, generator_fn):
+    """在后台任务中读取上游流式输出，并通知所有订阅者"""
+    try:
+        async for chunk in generator_fn():
+            async with flight.condition:
+                flight.chunks.append(chunk)
+                flight.condition.notify_all()
+    except Exception as e:
+        logger.exception("合并的流式请求出错: %s", e)
+        metrics.record_error('stream', type(e).__name__)
+        flight.chunks.append(sse_events.stream_error_frames(e))
+    finally:
+        if _async_stream_flights.get(key) is flight:
+            del _async_stream_flights[key]
+        async with flight.condition:
+            flight.done = True
+            flight.condition.notify_all()
+
+
+async def _subscribe_async(key, flight):
+    """按顺序读取异步流式执行生成的数据块，直到执行结束"""
+    index = 0
+    try:
+        while True:
+            async with flight.condition:
+                await flight.condition.wait_for(lambda: index < len(flight.chunks) or flight.done)
+                chunks = flight.chunks[index:]
+                done = flight.done
+            index += len(chunks)
+            for chunk in chunks:
+                yield chunk
+            if done:
+                return
+    finally:
+        _unsubscribe_async(key, flight)
+
+
+def _unsubscribe_async(key, flight):
+    """订阅者结束读取，所有订阅者都提前断开连接时取消后台任务"""
+    flight.subscribers -= 1
+    if flight.subscribers == 0 and not flight.done:
+        if _async_stream_flights.get(key) is flight:
+            del _async_stream_flights[key]
+        logger.info("合并的流式请求的所有订阅者都已断开连接，停止执行")
+        metrics.record_cancellation('singleflight')
+        flight.task.cancel()
+
+
+def stream_async(key, generator_fn):
+    """
+    执行异步流式请求，相同键的并发请求共享同一个上游输出
+
+    Args:
+        key: 请求键
+        generator_fn: 返回异步数据块生成器的函数，无参数
+
+    Returns:
+        异步生成器: 数据块生成器
+    """
+    flight = _async_stream_flights.get(key)
+    if flight is None:
+        _record('stream_leaders')
+        flight = _AsyncStreamFlight()
+        _async_stream_flights[key] = flight
+        flight.task = asyncio.ensure_future(_produce_async(key, flight, generator_fn))
+    else:
+        _record('stream_followers')
+        logger.info("合并相同的流式请求，订阅正在执行的输出")
+    flight.subscribers += 1
+    return _subscribe_async(key, flight)
+
+
+def get_stats():
+    """
+    获取请求合并的统计信息
+
+    Returns:
+        dict: 领头请求和被合并请求的数量，以及合并比例（被合并请求数 / 总请求数）
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats['leaders'] + stats['followers']
+    stream_total = stats['stream_leaders'] + stats['stream_followers']
+    all_total = total + stream_total
+    stats['coalescing_ratio'] = round(stats['followers'] / total, 4) if total else 0.0
+    stats['stream_coalescing_ratio'] = round(stats['stream_followers'] / stream_total, 4) if stream_total else 0.0
+    stats['overall_coalescing_ratio'] = round(
+        (stats['followers'] + stats['stream_followers']) / all_total, 4
+    ) if all_total else 0.0
+    return stats
@@ -0,0 +1,583 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+流式输出事件模块
+
+上游模型的流式输出（智谱AI的 SSE 数据行、DeepSeek 的 OpenAI 流式响应块）在进入流水线时
+解析为紧凑的事件对象，每个上游事件只解析一次；事件经过格式化等处理后，
+在离开流水线时只序列化一次为前端使用的数据块格式：
+
+    data: {"content": "..."}                     回答内容
+    data: {"is_reasoning": true, "content": "..."}  推理内容（DeepSeek Reasoner）
+    data: {"error": "..."}                       错误消息
+    data: {"done": true} 和 data: [DONE]          结束标记
+    data: {...}                                  其他数据（完整推理内容、搜索结果信息等）原样输出
+
+序列化后的数据块都以空行结尾，后续的转发、缓存和监控只把它们当作不透明的字符串处理。
+
+流式路由在写出数据块之前可以使用 FrameBatcher 合并短时间内连续到达的内容数据块，
+减少每个连接的写入次数（见 batch_frames）。
+"""
+
+import os
+import json
+import time
+import queue
+import asyncio
+import threading
+import contextvars
+from json.encoder import encode_basestring_ascii
+
+from log_config import get_logger, ChunkSampler
+import cancellation
+import metrics
+
+try:
+    from gevent import monkey as gevent_monkey
+except ImportError:
+    gevent_monkey = None
+
+logger = get_logger(__name__)
+
+# 逐个数据块的调试日志只记录一部分
+_chunk_sampler = ChunkSampler()
+
+# 事件类型
+CONTENT = 'content'
+REASONING = 'reasoning'
+ERROR = 'error'
+DONE = 'done'
+DATA = 'data'
+
+# 流式输出开始时发送的初始空消息，前端需要它来初始化
+ROLE_FRAME = 'data: {"role": "assistant", "content": ""}\n\n'
+# 结束标记，同时使用两种格式，确保前端能正确处理
+DONE_FRAMES = 'data: {"done": true}\n\ndata: [DONE]\n\n'
+# 心跳数据块（SSE 注释行，前端忽略），等待期间定期写出以便及时发现客户端已断开连接
+HEARTBEAT_FRAME = ': keepalive\n\n'
+
+# 回答内容和推理内容数据块的固定前缀和后缀（与 serialize 的输出相同），合并数据块时使用
+CONTENT_FRAME_PREFIX = 'data: {"content": "'
+REASONING_FRAME_PREFIX = 'data: {"is_reasoning": true, "content": "'
+TEXT_FRAME_SUFFIX = '"}\n\n'
+
+
+class Event:
+    """流式输出事件：CONTENT、REASONING、ERROR 类型的文本保存在 content 中，DATA 类型的数据保存在 data 中"""
+
+    __slots__ = ('type', 'content', 'data')
+
+    def __init__(self, type, content='', data=None):
+        self.type = type
+        self.content = content
+        self.data = data
+
+    def __repr__(self):
+        return f'Event({self.type!r}, {self.content!r}, {self.data!r})'
+
+
+DONE_EVENT = Event(DONE)
+
+
+def error_events(message):
+    """只包含错误消息和结束标记的事件列表"""
+    return [Event(ERROR, message), DONE_EVENT]
+
+
+def stream_error_frames(error):
+    """
+    转发流式输出时出错，发送给前端的错误数据块和结束标记
+
+    Args:
+        error: 异常
+
+    Returns:
+        str: 错误数据块和结束标记
+    """
+    return serialize(Event(ERROR, f"处理响应流时发生服务器错误: {error}")) + DONE_FRAMES
+
+
+def _error_message(error):
+    """智谱AI的错误为 {"code", "message"} 对象，转发给前端的错误为字符串"""
+    if isinstance(error, dict):
+        return str(error.get('message') or error)
+    return str(error)
+
+
+def from_dict(data):
+    """
+    将一个已解析的数据块转换为事件
+
+    支持智谱AI和 OpenAI 兼容格式的流式响应块（choices[0].delta），以及前端格式的数据块。
+    带有 usage 的响应块计入 token 消耗。
+
+    Args:
+        data: 解析后的 JSON 数据
+
+    Returns:
+        Event: 事件，没有需要输出的内容（如空的 delta）时返回 None
+    """
+    if not isinstance(data, dict):
+        return None
+
+    choices = data.get('choices')
+    if choices is not None:
+        usage = data.get('usage')
+        if usage:
+            metrics.record_token_usage(data.get('model'), usage)
+        if not choices:
+            return None
+        delta = choices[0].get('delta') or choices[0].get('message') or {}
+        reasoning = delta.get('reasoning_content')
+        if reasoning:
+            return Event(REASONING, reasoning)
+        content = delta.get('content')
+        return Event(CONTENT, content) if content else None
+
+    if 'error' in data:
+        return Event(ERROR, _error_message(data['error']))
+    if data.get('done') is True:
+        return DONE_EVENT
+    if 'content' in data and set(data) <= {'content', 'role', 'is_reasoning'}:
+        content = data['content']
+        if not content:
+            return None
+        return Event(REASONING if data.get('is_reasoning') else CONTENT, content)
+    return Event(DATA, data=data)
+
+
+def parse_line(line):
+    """
+    解析流式输出的一行
+
+    Args:
+        line: SSE 数据行（字符串或字节），如 data: {...}
+
+    Returns:
+        Event: 事件，空行、注释行和没有内容的数据块返回 None
+    """
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    if _chunk_sampler.should_log(logger):
+        logger.debug("原始数据块: %s...", line[:100])
+    if not line.startswith('data:'):
+        return None
+    payload = line[5:].strip()
+    if not payload:
+        return None
+    if payload == '[DONE]':
+        return DONE_EVENT
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        logger.warning("无法解析的流式数据块: %s", payload[:100])
+        return None
+    return from_dict(data)
+
+
+def parse_lines(lines, response=None):
+    """
+    逐行解析流式输出
+
+    Args:
+        lines: 数据行迭代器（如 requests 响应的 iter_lines()）
+        response: 数据行所属的响应对象，读取结束或提前停止读取（客户端断开连接）时关闭，
+            未读完的上游连接随之断开，上游不再继续生成
+
+    Returns:
+        generator: 事件
+    """
+    try:
+        for line in lines:
+            event = parse_line(line)
+            if event is not None:
+                yield event
+    finally:
+        if response is not None:
+            response.close()
+
+
+async def parse_lines_async(lines):
+    """parse_lines 的异步版本，lines 为异步迭代器（如 httpx 响应的 aiter_lines()）"""
+    async for line in lines:
+        event = parse_line(line)
+        if event is not None:
+            yield event
+
+
+def serialize(event):
+    """
+    将事件序列化为前端格式的数据块
+
+    Args:
+        event: 事件
+
+    Returns:
+        str: 以空行结尾的 SSE 数据块
+    """
+    event_type = event.type
+    # 文本内容直接转义为 JSON 字符串，不经过 json.dumps 的对象编码
+    if event_type == CONTENT:
+        return f'data: {{"content": {encode_basestring_ascii(event.content)}}}\n\n'
+    if event_type == REASONING:
+        return f'data: {{"is_reasoning": true, "content": {encode_basestring_ascii(event.content)}}}\n\n'
+    if event_type == DONE:
+        return DONE_FRAMES
+    if event_type == ERROR:
+        return f'data: {{"error": {encode_basestring_ascii(event.content)}}}\n\n'
+    return f"data: {json.dumps(event.data)}\n\n"
+
+
+def to_frames(events):
+    """逐个序列化事件，返回数据块生成器"""
+    for event in events:
+        yield serialize(event)
+
+
+async def to_frames_async(events):
+    """to_frames 的异步版本"""
+    async for event in events:
+        yield serialize(event)
+
+
+def _format_event(event, formatter):
+    """使用增量格式化器处理一个事件，返回需要输出的事件列表"""
+    if event.type == CONTENT:
+        content = formatter.feed(event.content)
+        return [Event(CONTENT, content)] if content else []
+    # 其他事件之前先输出暂存的内容
+    pending = formatter.flush()
+    if pending:
+        return [Event(CONTENT, pending), event]
+    return [event]
+
+
+def format_content(events, formatter=None):
+    """
+    使用增量格式化器格式化回答内容
+
+    格式化器在遇到安全的分段位置前会暂存内容；遇到其他事件（推理内容、结束标记、错误消息）时
+    先输出暂存的内容，保证拼接后的内容与整体格式化的结果相同。
+
+    Args:
+        events: 事件迭代器
+        formatter: 带有 feed 和 flush 方法的增量格式化器（如 StreamingFormatter），为 None 时不格式化
+
+    Returns:
+        generator: 格式化后的事件
+    """
+    if formatter is None:
+        yield from events
+        return
+    for event in events:
+        yield from _format_event(event, formatter)
+    # 模型流没有以结束标记结尾时，输出格式化器中剩余的内容
+    pending = formatter.flush()
+    if pending:
+        yield Event(CONTENT, pending)
+
+
+async def format_content_async(events, formatter=None):
+    """format_content 的异步版本"""
+    if formatter is None:
+        async for event in events:
+            yield event
+        return
+    async for event in events:
+        for formatted in _format_event(event, formatter):
+            yield formatted
+    pending = formatter.flush()
+    if pending:
+        yield Event(CONTENT, pending)
+
+
+def _text_frame_prefix(frame):
+    """
+    判断数据块是否为只包含文本内容的回答或推理数据块
+
+    Returns:
+        str: 数据块的前缀，其他数据块返回 None
+    """
+    if frame.startswith(CONTENT_FRAME_PREFIX):
+        prefix = CONTENT_FRAME_PREFIX
+    elif frame.startswith(REASONING_FRAME_PREFIX):
+        prefix = REASONING_FRAME_PREFIX
+    else:
+        return None
+    if not frame.endswith(TEXT_FRAME_SUFFIX):
+        return None
+    # 转义后的内容中不能有未转义的引号，排除带有其他字段的数据块（如之前版本缓存的 {"content": ..., "role": ...}）
+    text = frame[len(prefix):-len(TEXT_FRAME_SUFFIX)]
+    if '"' in text and '"' in text.replace('\\\\', '').replace('\\"', ''):
+        return None
+    return prefix
+
+
+class FrameBatcher:
+    """
+    合并连续的内容数据块
+
+    第一个内容数据块立即写出；之后的回答内容和推理内容数据块暂存，同类的连续数据块合并为一个数据块，
+    暂存时间达到合并窗口或暂存的字节数达到上限时一起写出。其他数据块（结束标记、错误消息、搜索结果信息等）
+    和暂存的内容一起立即写出。合并后的内容与逐个数据块输出时拼接的内容相同。
+    """
+
+    def __init__(self, window, max_bytes):
+        """
+        Args:
+            window: 合并窗口（秒）
+            max_bytes: 暂存的字节数上限
+        """
+        self.window = window
+        self.max_bytes = max_bytes
+        self._frames = []
+        self._prefix = None
+        self._texts = []
+        self._size = 0
+        self._started = None
+        self._first = True
+
+    def time_left(self, now):
+        """
+        暂存的内容距离合并窗口结束的时间
+
+        Returns:
+            float: 剩余时间（秒），没有暂存的内容时返回 None
+        """
+        if self._started is None:
+            return None
+        return self._started + self.window - now
+
+    def add(self, frame, now):
+        """
+        添加一个数据块
+
+        Args:
+            frame: serialize 输出的数据块
+            now: 当前时间（time.monotonic()）
+
+        Returns:
+            str: 需要立即写出的数据，不需要写出时返回 None
+        """
+        prefix = _text_frame_prefix(frame)
+        if prefix is None:
+            return self.flush() + frame
+        if self._first:
+            # 第一个内容数据块立即写出，不影响首个 token 的时间
+            self._first = False
+            return self.flush() + frame
+        if prefix is not self._prefix:
+            self._close()
+            self._prefix = prefix
+        self._texts.append(frame[len(prefix):-len(TEXT_FRAME_SUFFIX)])
+        self._size += len(frame)
+        if self._started is None:
+            self._started = now
+        if self._size >= self.max_bytes or now - self._started >= self.window:
+            return self.flush()
+        return None
+
+    def _close(self):
+        """结束当前正在合并的数据块"""
+        if self._texts:
+            self._frames.append(f"{self._prefix}{''.join(self._texts)}{TEXT_FRAME_SUFFIX}")
+            self._texts = []
+        self._prefix = None
+
+    def flush(self):
+        """
+        取出所有暂存的内容
+
+        Returns:
+            str: 合并后的数据块，没有暂存的内容时返回空字符串
+        """
+        if self._started is None:
+            return ''
+        self._close()
+        output = ''.join(self._frames)
+        self._frames = []
+        self._size = 0
+        self._started = None
+        return output
+
+
+def batch_settings(route):
+    """
+    读取路由的数据块合并配置
+
+    使用 SSE_BATCH_WINDOW_MS 和 SSE_BATCH_MAX_BYTES 环境变量，
+    可以使用 SSE_BATCH_WINDOW_MS_<路由> 和 SSE_BATCH_MAX_BYTES_<路由> 为单个路由单独配置。
+
+    Args:
+        route: 路由名称，如 chat、chat_with_search
+
+    Returns:
+        tuple: (合并窗口（秒）, 字节数上限)，合并窗口为 0 时不合并
+    """
+    key = route.upper()
+    window_ms = float(os.getenv(f'SSE_BATCH_WINDOW_MS_{key}', os.getenv('SSE_BATCH_WINDOW_MS', '20')))
+    max_bytes = int(os.getenv(f'SSE_BATCH_MAX_BYTES_{key}', os.getenv('SSE_BATCH_MAX_BYTES', '4096')))
+    return window_ms / 1000, max_bytes
+
+
+def heartbeat_interval():
+    """
+    获取等待期间输出心跳数据块的间隔（SSE_HEARTBEAT_INTERVAL 环境变量，默认为 2 秒）
+
+    Returns:
+        float: 间隔（秒），为 None 时不输出心跳数据块
+    """
+    interval = float(os.getenv('SSE_HEARTBEAT_INTERVAL', '2'))
+    return interval if interval > 0 else None
+
+
+def batch_frames(frames, window, max_bytes):
+    """
+    合并数据块后写出（同步版本）
+
+    上游数据块由后台读取并放入有界队列，写出时等待队列以合并窗口的剩余时间为超时，
+    上游暂停输出时暂存的内容也在合并窗口结束时写出；客户端读取较慢时队列写满，后台读取随之暂停。
+    后台读取使用单独的取消令牌，关闭返回的生成器（客户端断开连接）时取消令牌：
+    等待中的搜索和合并请求的订阅立即停止，后台读取在读到下一个数据块时停止并关闭上游迭代器。
+
+    后台读取只在 gevent 工作进程中进行（此时是一个协程）；线程工作进程（gthread、sync）
+    和直接运行时不合并，避免每个流式连接多占用一个操作系统线程。
+
+    Args:
+        frames: 数据块迭代器
+        window: 合并窗口（秒），为 0 时不合并
+        max_bytes: 暂存的字节数上限
+
+    Returns:
+        iterator: 合并后的数据块
+    """
+    if window <= 0 or not _reader_is_greenlet():
+        return frames
+    return _batch_frames(frames, FrameBatcher(window, max_bytes))
+
+
+# 后台读取结束的标记
+_END = object()
+
+# 后台读取的队列长度上限
+FRAME_QUEUE_SIZE = 64
+
+
+def _reader_is_greenlet():
+    """后台读取是否以协程执行（gevent 已对 threading 打补丁）"""
+    return gevent_monkey is not None and gevent_monkey.is_module_patched('threading')
+
+
+def _read_frames(frames, frame_queue, token):
+    """在后台读取上游数据块放入队列，队列已满时等待，出错时放入 (_END, 异常)"""
+    cancellation.set_token(token)
+    error = None
+    try:
+        for frame in frames:
+            if token.cancelled:
+                break
+            frame_queue.put((frame, None))
+    except BaseException as e:
+        error = e
+    finally:
+        # 提前停止时关闭上游迭代器（在读取它的线程中关闭）
+        close = getattr(frames, 'close', None)
+        if close is not None:
+            close()
+        frame_queue.put((_END, error))
+
+
+def _batch_frames(frames, batcher):
+    frame_queue = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    token = cancellation.CancelToken()
+    # 后台读取在当前请求的上下文中执行（请求 ID 等）
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(_read_frames, frames, frame_queue, token), daemon=True).start()
+    try:
+        while True:
+            time_left = batcher.time_left(time.monotonic())
+            if time_left is not None and time_left <= 0:
+                yield batcher.flush()
+                continue
+            try:
+                frame, error = frame_queue.get(timeout=time_left)
+            except queue.Empty:
+                # 合并窗口结束时下一个数据块还没有到达
+                yield batcher.flush()
+                continue
+            if frame is _END:
+                break
+            output = batcher.add(frame, time.monotonic())
+            if output:
+                yield output
+        output = batcher.flush()
+        if output:
+            yield output
+        if error is not None:
+            raise error
+    finally:
+        token.cancel()
+        # 清空队列，等待放入数据块的后台读取得以继续，随后读到取消标记并停止
+        try:
+            while True:
+                frame_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+
+def batch_frames_async(frames, window, max_bytes):
+    """
+    合并数据块后写出（异步版本），暂存的内容在合并窗口结束时写出，不需要等待下一个数据块
+
+    Args:
+        frames: 数据块异步迭代器
+        window: 合并窗口（秒），为 0 时不合并
+        max_bytes: 暂存的字节数上限
+
+    Returns:
+        异步迭代器: 合并后的数据块
+    """
+    if window <= 0:
+        return frames
+    return _batch_frames_async(frames, FrameBatcher(window, max_bytes))
+
+
+async def _batch_frames_async(frames, batcher):
+    loop = asyncio.get_running_loop()
+    iterator = frames.__aiter__()
+    next_frame = None
+    try:
+        while True:
+            time_left = batcher.time_left(loop.time())
+            if time_left is None and next_frame is None:
+                # 没有暂存的内容时直接等待下一个数据块
+                try:
+                    frame = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+            else:
+                if time_left is not None and time_left <= 0:
+                    yield batcher.flush()
+                    continue
+                if next_frame is None:
+                    next_frame = asyncio.ensure_future(iterator.__anext__())
+                done, _ = await asyncio.wait((next_frame,), timeout=time_left)
+                if not done:
+                    # 合并窗口结束时下一个数据块还没有到达
+                    yield batcher.flush()
+                    continue
+                task, next_frame = next_frame, None
+                try:
+                    frame = task.result()
+                except StopAsyncIteration:
+                    break
+            output = batcher.add(frame, loop.time())
+            if output:
+                yield output
+        output = batcher.flush()
+        if output:
+            yield output
+    finally:
+        if next_frame is not None:
+            next_frame.cancel()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试回答缓存
+
+验证缓存键区分模型、提示词版本、调用来源和输出方式，以及调用出错的回答不会被缓存。
+"""
+
+import pytest
+
+import answer_cache
+import chat_api
+import sse_events
+
+
+@pytest.fixture(autouse=True)
+def enabled_cache(monkeypatch):
+    """每个测试使用新的回答缓存"""
+    monkeypatch.setenv('ANSWER_CACHE_ENABLED', 'true')
+    monkeypatch.setattr(answer_cache, '_cache', None)
+
+
+def test_key_parts():
+    """问题规范化后相同时共享缓存键，模型、提示词、调用来源或输出方式不同时使用不同的缓存键"""
+    base = answer_cache.make_key('什么是 Python？', 'zhipuai', '提示词A')
+    assert answer_cache.make_key('什么是python', 'zhipuai', '提示词A') == base
+    variants = [
+        answer_cache.make_key('什么是 Python？', 'deepseek-chat', '提示词A'),
+        answer_cache.make_key('什么是 Python？', 'zhipuai', '提示词B'),
+        answer_cache.make_key('什么是 Python？', 'zhipuai', '提示词A', stream=True),
+        answer_cache.make_key('什么是 Python？', 'zhipuai', '提示词A', source='chat'),
+    ]
+    assert len({base, *variants}) == len(variants) + 1
+
+
+def test_key_is_none_when_disabled(monkeypatch):
+    """未启用回答缓存时不生成缓存键，读写都被跳过"""
+    monkeypatch.setenv('ANSWER_CACHE_ENABLED', 'false')
+    key = answer_cache.make_key('问题', 'zhipuai', '提示词')
+    assert key is None
+    answer_cache.put(key, '回答')
+    assert answer_cache.get(key) is None
+
+
+def test_error_flag_decides_caching():
+    """是否缓存由错误标记决定，与回答内容无关"""
+    key = answer_cache.make_key('HTTP 错误码', 'zhipuai', '提示词')
+    answer = '调用接口出错时返回 error 字段，常见的错误码有 404 和 500。'
+    answer_cache.put(key, answer)
+    assert answer_cache.get(key) == answer
+
+    key = answer_cache.make_key('另一个问题', 'zhipuai', '提示词')
+    answer_cache.put(key, answer_cache.ErrorResponse('请求超时'))
+    assert answer_cache.get(key) is None
+
+
+def test_llm_error_path_is_not_cached(monkeypatch):
+    """普通聊天调用大模型出错（API密钥未配置）时不缓存错误消息"""
+    monkeypatch.delenv('ZHIPUAI_API_KEY', raising=False)
+    result = chat_api.chat('什么是缓存', 'zhipuai')
+    assert isinstance(result['response'], answer_cache.ErrorResponse)
+    key = answer_cache.make_key('什么是缓存', 'zhipuai', chat_api.get_intelligent_search_prompt(), source='chat')
+    assert answer_cache.get(key) is None
+
+
+def test_stream_with_error_frame_is_not_cached():
+    """流式回答完整输出后缓存，包含错误数据块时不缓存"""
+    frames = [sse_events.serialize(sse_events.Event(sse_events.CONTENT, '回答中提到 "error"')), sse_events.DONE_FRAMES]
+    key = answer_cache.make_key('问题', 'zhipuai', '提示词', stream=True)
+    assert list(answer_cache.record_stream(key, frames)) == frames
+    assert answer_cache.get(key) == frames
+
+    frames = list(sse_events.to_frames(sse_events.error_events('请求超时')))
+    key = answer_cache.make_key('另一个问题', 'zhipuai', '提示词', stream=True)
+    list(answer_cache.record_stream(key, frames))
+    assert answer_cache.get(key) is None
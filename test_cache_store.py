@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试缓存键的问题规范化
+
+规范化后的问题用于分析缓存、回答缓存和请求合并的键：
+仅有空白、大小写、全半角或句末标点差异的问题应得到相同的结果，含义不同的问题不能得到相同的结果。
+"""
+
+import pytest
+
+from cache_store import normalize_query
+
+
+@pytest.mark.parametrize('first, second', [
+    ('Python 是什么？', 'python是什么'),
+    ('ＡＩ  最新进展!', 'ai 最新进展'),
+    ('  你好 ！！', '你好'),
+    ('今天天气怎么样。', '今天天气怎么样'),
+])
+def test_equivalent_queries_share_key(first, second):
+    """空白、大小写、全半角和句末标点不影响规范化结果"""
+    assert normalize_query(first) == normalize_query(second)
+
+
+@pytest.mark.parametrize('first, second', [
+    ('C#是什么', 'C是什么'),
+    ('C++是什么', 'C是什么'),
+    ('.NET 是什么', 'NET 是什么'),
+    ('Python 3.5', 'Python 35'),
+    ('node.js', 'node js'),
+    ('什么是C#?', '什么是C?'),
+])
+def test_different_queries_do_not_collide(first, second):
+    """与单词相连的标点符号保留，含义不同的问题不会得到相同的结果"""
+    assert normalize_query(first) != normalize_query(second)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试请求取消
+
+验证客户端断开连接后关闭上游响应、取消排队中的搜索，以及合并的流式请求在所有订阅者断开后停止执行。
+"""
+
+import time
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import cancellation
+import deepseek_api
+import singleflight
+import sse_events
+import search_executor
+
+
+class _Response:
+    """记录是否被关闭的上游响应"""
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_parse_lines_closes_response():
+    """提前关闭事件生成器时关闭上游响应"""
+    response = _Response()
+    lines = (b'data: {"choices": [{"delta": {"content": "x"}}]}' for _ in range(100))
+    events = sse_events.parse_lines(lines, response)
+    assert next(events).content == 'x'
+    events.close()
+    assert response.closed
+
+
+class _FakeStream:
+    """模拟 openai 的 Stream：每隔 1 毫秒返回一个响应块，记录是否被关闭"""
+
+    def __init__(self, count):
+        self.count = count
+        self.sent = 0
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        while self.sent < self.count:
+            time.sleep(0.001)
+            self.sent += 1
+            delta = SimpleNamespace(content='字', reasoning_content=None)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)], usage=None)
+
+    def close(self):
+        self.closed.set()
+
+
+def test_disconnect_closes_deepseek_stream(monkeypatch):
+    """客户端在流式输出中途断开连接时关闭 DeepSeek 的 HTTP 响应"""
+    import app as app_module
+
+    upstream = _FakeStream(1000)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **params: upstream)))
+    monkeypatch.setattr(deepseek_api, 'get_client', lambda api_key, base_url: client)
+    monkeypatch.setenv('DEEPSEEK_API_KEY', 'test')
+    monkeypatch.setenv('ANSWER_CACHE_ENABLED', 'false')
+
+    response = app_module.app.test_client().post(
+        '/api/chat', json={'query': '你好', 'model_id': 'deepseek-chat', 'stream': True}, buffered=False)
+    frames = iter(response.response)
+    for _ in range(5):
+        next(frames)
+    response.close()
+
+    # 读取上游的后台线程在下一个响应块到达时停止
+    assert upstream.closed.wait(1)
+    assert upstream.sent < upstream.count
+
+
+def test_cancel_token_stops_waiting_for_searches():
+    """令牌取消后不再等待正在执行的搜索，未完成的关键词标记为已取消"""
+    release = threading.Event()
+
+    def search(keyword):
+        if keyword == 'slow':
+            release.wait(5)
+        return [keyword]
+
+    token = cancellation.CancelToken()
+    cancellation.set_token(token)
+    threading.Timer(0.1, token.cancel).start()
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        start = time.perf_counter()
+        slots = search_executor.run_concurrent_searches(search, ['fast', 'slow'], deadline=5, executor=executor)
+        elapsed = time.perf_counter() - start
+    finally:
+        cancellation.set_token(None)
+        release.set()
+        executor.shutdown()
+
+    assert elapsed < 1
+    assert [(slot['status'], slot['results']) for slot in slots] == [('ok', ['fast']), ('cancelled', [])]
+
+
+def test_stream_cancelled_when_all_subscribers_leave():
+    """所有订阅者都断开连接后取消令牌，并关闭上游输出"""
+    closed = threading.Event()
+    tokens = []
+
+    def generate():
+        tokens.append(cancellation.current_token())
+        try:
+            yield 'a'
+            while not cancellation.is_cancelled():
+                time.sleep(0.01)
+            yield 'b'
+        finally:
+            closed.set()
+
+    key = ('test_stream_cancelled', time.time())
+    first = singleflight.stream(key, generate)
+    second = singleflight.stream(key, generate)
+    assert next(first) == 'a'
+    assert next(second) == 'a'
+    first.close()
+    assert not tokens[0].cancelled
+    second.close()
+    assert tokens[0].cancelled
+    assert closed.wait(1)
+    # 已取消的执行不再接受新的订阅者
+    assert key not in singleflight._stream_flights
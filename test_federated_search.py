@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试多引擎联合搜索
+
+验证线程池繁忙时联合搜索仍在截止时间返回已到达的结果，
+以及在关键词搜索中执行时在外层截止之前返回融合后的结果。
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import federated_search
+import search_executor
+
+
+@pytest.fixture
+def federated_pool(monkeypatch):
+    """替换联合搜索使用的线程池"""
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setitem(search_executor._executors, 'federated', pool)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def _engine_search(delays):
+    """按搜索引擎等待相应的秒数后返回一条结果"""
+    def search(query, engine, count, **kwargs):
+        time.sleep(delays[engine])
+        return [{'title': engine, 'link': f'https://{engine}.example.com/', 'content': query}]
+    return search
+
+
+def test_saturated_pool_returns_at_deadline(monkeypatch, federated_pool):
+    """线程池被其他请求占用时，排队时间计入截止时间，到达截止时间时返回已到达的结果"""
+    monkeypatch.setenv('FEDERATED_SEARCH_ENGINES', 'search_std,bochaai,searxng')
+    monkeypatch.setenv('FEDERATED_SEARCH_DEADLINE', '0.2')
+    # 其他请求占用一个线程，剩余的一个线程依次执行各搜索引擎
+    federated_pool.submit(time.sleep, 0.6)
+    search = _engine_search({'search_std': 0, 'bochaai': 0.6, 'searxng': 0})
+
+    start = time.perf_counter()
+    results = federated_search.search(search, '问题')
+    elapsed = time.perf_counter() - start
+    assert elapsed < 0.3
+    assert [item['federated_engines'] for item in results] == [['search_std']]
+
+
+def test_nested_search_returns_before_outer_deadline(monkeypatch, federated_pool):
+    """在关键词搜索中执行时，联合搜索在外层截止之前返回，融合后的结果不会被丢弃"""
+    monkeypatch.setenv('FEDERATED_SEARCH_ENGINES', 'search_std,bochaai')
+    monkeypatch.setenv('FEDERATED_SEARCH_DEADLINE', '5')
+    search = _engine_search({'search_std': 0, 'bochaai': 2})
+
+    def keyword_search(keyword):
+        return federated_search.search(search, keyword)
+
+    outer = ThreadPoolExecutor(max_workers=1)
+    try:
+        start = time.perf_counter()
+        slots = search_executor.run_concurrent_searches(keyword_search, ['问题'], deadline=0.8, executor=outer)
+        elapsed = time.perf_counter() - start
+    finally:
+        outer.shutdown(wait=True)
+    assert elapsed < 0.8
+    assert slots[0]['status'] == 'ok'
+    assert [item['federated_engines'] for item in slots[0]['results']] == [['search_std']]
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试 DeepSeek 输出格式化功能
+
+验证增量格式化器 StreamingFormatter 在各种分块方式下的输出，
+拼接后与对完整内容调用 format_deepseek_output 的结果完全相同。
+"""
+
+import random
+
+from format_deepseek_output import format_deepseek_output, fix_numbering, StreamingFormatter
+
+# 测试文档：包含标题、带引用的编号列表、嵌套编号和表格
+SAMPLE_CONTENT = """
+#### 一、历史起源与学术自治传统 欧洲现代大学体系可追溯至12-13世纪的中世纪大学。巴黎大学作为早期代表 (来源[1][3][9])：
+
+1. 教会与王权的双重影响: 中世纪大学最初在教廷与封建君主控制下萌芽。
+
+2. 知识传承与创新: 早期大学以神学、法学、医学为核心学科。
+
+#### 二、国家特色与体系分化 欧洲各国大学体系呈现显著的多样性:
+
+1. 法国双轨制 (来源[3]):
+
+   1. 大学校（Grandes Écoles）与公立大学分立
+
+   2. 1968年教育改革后，巴黎大学拆分为13所独立院校
+
+1. 北欧实践导向模式 (来源[7]):
+
+   1. 芬兰建立应用科学大学（UAS）
+
+#### 三、现代体系的核心架构 当前欧洲大学体系呈现三层结构 (来源[5][9]): | 类型 | 代表机构 | |------|------| | 研究型大学联盟 | LERU | | 专业应用型院校 | 德国FH |
+
+#### 四、挑战与改革方向
+"""
+
+# 随机文档的组成片段
+FRAGMENTS = [
+    '#### 标题', '### 小节', '## 章节', '\n', '\n\n', '   ', '1. ', '2. ', '12. ', '• ', '· ',
+    '正文内容', '**加粗**', ' (来源[1])', '(来源[2][3])', '（括号）', ' | 列A | 列B |', '|---|---|',
+    ':', '：', '一、', '二、', 'text ', '- 列表项'
+]
+
+
+def stream_format(content, chunk_sizes):
+    """按给定的分块大小依次输入格式化器，返回拼接后的输出"""
+    formatter = StreamingFormatter()
+    output = []
+    pos = 0
+    index = 0
+    while pos < len(content):
+        size = chunk_sizes[index % len(chunk_sizes)]
+        output.append(formatter.feed(content[pos:pos + size]))
+        pos += size
+        index += 1
+    output.append(formatter.flush())
+    return ''.join(output)
+
+
+def test_stream_matches_batch_for_sample():
+    """示例文档在不同分块大小下与整体格式化的结果相同"""
+    expected = format_deepseek_output(SAMPLE_CONTENT)
+    for chunk_sizes in ([1], [2], [3], [7], [16], [64], [len(SAMPLE_CONTENT)], [1, 5, 2, 11]):
+        assert stream_format(SAMPLE_CONTENT, chunk_sizes) == expected
+
+
+def test_stream_matches_batch_for_random_documents():
+    """随机组合的文档在随机分块下与整体格式化的结果相同"""
+    rng = random.Random(20240501)
+    for _ in range(500):
+        content = ''.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 40)))
+        chunk_sizes = [rng.randint(1, 20) for _ in range(rng.randint(1, 5))]
+        assert stream_format(content, chunk_sizes) == format_deepseek_output(content), (content, chunk_sizes)
+
+
+def test_stream_outputs_before_end():
+    """遇到安全的行边界后立即输出，不需要等到整个回答结束"""
+    formatter = StreamingFormatter()
+    assert formatter.feed('第一段内容\n') == ''
+    assert formatter.feed('第二段') != ''
+    assert formatter.flush() != ''
+
+
+def test_formatter_can_be_reused_after_flush():
+    """flush() 之后重置状态，可以继续格式化新的内容"""
+    formatter = StreamingFormatter()
+    first = formatter.feed(SAMPLE_CONTENT) + formatter.flush()
+    second = formatter.feed(SAMPLE_CONTENT) + formatter.flush()
+    assert first == second == format_deepseek_output(SAMPLE_CONTENT)
+
+
+def test_fix_numbering_counts_each_item_once():
+    """同时匹配多个编号规则的列表项只重新编号一次"""
+    content = "## 一、标题\n\n1. 第一项 [参考文献1]:\n\n1. 第二项 [参考文献2]:\n\n1. 第三项 [参考文献3]:\n"
+    result = fix_numbering(content)
+    assert '1. 第一项' in result
+    assert '2. 第二项' in result
+    assert '3. 第三项' in result
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试监控指标模块
+
+验证多个线程分别记录的指标在导出时正确汇总（包括已结束线程的分片），
+gevent 协程共用所在线程的分片，以及直方图的 Prometheus 文本格式输出。
+"""
+
+import os
+import sys
+import textwrap
+import threading
+import subprocess
+
+import metrics
+
+
+def test_counter_sums_thread_shards():
+    """各线程的计数在导出时相加，已结束线程的分片合并后仍然计入"""
+    counter = metrics.Counter('test_events_total', '测试计数器', ('kind',))
+    counter.inc(kind='a')
+
+    def work():
+        for _ in range(1000):
+            counter.inc(kind='a')
+        counter.inc(5, kind='b')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.collect() == {('a',): 4001, ('b',): 20}
+    # 已结束线程的分片已经合并，再次导出的结果不变
+    assert len(counter._shards) == 1
+    assert counter.collect() == {('a',): 4001, ('b',): 20}
+
+
+def test_gauge_balances_across_threads():
+    """在一个线程中增加、在另一个线程中减少的仪表盘导出时为 0"""
+    gauge = metrics.Gauge('test_active', '测试仪表盘', ('route',))
+    gauge.inc(route='/x')
+    thread = threading.Thread(target=gauge.dec, kwargs={'route': '/x'})
+    thread.start()
+    thread.join()
+    assert gauge.collect() == {('/x',): 0}
+
+
+def test_gevent_greenlets_share_thread_shard():
+    """gevent 打补丁后大量协程记录指标，分片数量不随协程数量增长"""
+    script = textwrap.dedent("""
+        from gevent import monkey
+        monkey.patch_all()
+        import gevent
+        import gevent.event
+        import metrics
+
+        counter = metrics.Counter('test_greenlet_events_total', '测试计数器', ('kind',))
+        release = gevent.event.Event()
+
+        def work():
+            counter.inc(kind='a')
+            release.wait()
+            counter.inc(kind='a')
+
+        greenlets = [gevent.spawn(work) for _ in range(500)]
+        gevent.sleep(0)
+        # 协程仍在进行（如长时间的流式输出）时导出
+        assert counter.collect() == {('a',): 500}, counter.collect()
+        assert len(counter._shards) == 1, len(counter._shards)
+        release.set()
+        gevent.joinall(greenlets)
+        assert counter.collect() == {('a',): 1000}, counter.collect()
+    """)
+    result = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+
+def test_histogram_render():
+    """直方图输出累计分桶、总和与次数"""
+    histogram = metrics.Histogram('test_latency_seconds', '测试直方图', ('engine',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, engine='bing')
+
+    lines = metrics._render_metric(histogram)
+    assert 'test_latency_seconds_bucket{engine="bing",le="0.1"} 2' in lines
+    assert 'test_latency_seconds_bucket{engine="bing",le="1.0"} 3' in lines
+    assert 'test_latency_seconds_bucket{engine="bing",le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_sum{engine="bing"} 3.65' in lines
+    assert 'test_latency_seconds_count{engine="bing"} 4' in lines
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试本地查询分类
+
+验证问候语、写作任务、时效性问题的分类规则和置信度，以及置信度达标时的抽样对比统计。
+"""
+
+import pytest
+
+import query_classifier
+
+
+@pytest.mark.parametrize('query, need_search, rule', [
+    # 问候语
+    ('你好！', False, 'greeting'),
+    ('Hello', False, 'greeting'),
+    ('谢谢你。', False, 'greeting'),
+    # 写作任务（祈使句式）
+    ('帮我写一首关于春天的诗', False, 'writing_task'),
+    ('把这句话翻译成英文', False, 'writing_task'),
+    ('给这篇文章起个标题', False, 'writing_task'),
+    ('讲个故事', False, 'writing_task'),
+    ('续写这段小说', False, 'writing_task'),
+    # 写作任务涉及时效性内容时降低置信度，由大模型决定
+    ('帮我写一篇今天的新闻稿', False, 'writing_task_time_sensitive'),
+    ('写一段最新的股价分析', False, 'writing_task_time_sensitive'),
+    # 时效性新闻和数据
+    ('今天的股价是多少', True, 'time_sensitive_news'),
+    ('最新的新闻有哪些', True, 'time_sensitive_news'),
+    ('2024年的GDP数据', True, 'time_sensitive_news'),
+    # 只有部分信号
+    ('最近怎么样', True, 'weak_search_signal'),
+    ('what is the news today', True, 'weak_search_signal'),
+])
+def test_classify_rules(query, need_search, rule):
+    """各类问题命中对应的规则"""
+    result = query_classifier.classify(query)
+    assert (result['need_search'], result['rule']) == (need_search, rule)
+
+
+@pytest.mark.parametrize('query', [
+    '三体这本小说讲的是什么故事',
+    '标题党是什么意思',
+    '翻译的历史',
+    'I know nothing about snow',
+    'nowhere to go',
+])
+def test_not_writing_task_or_time_sensitive(query):
+    """陈述中出现的"故事"、"标题"、"翻译"和包含 now 的英文单词不会命中写作任务或时效性规则"""
+    result = query_classifier.classify(query)
+    assert result['rule'] == 'default'
+    assert result['confidence'] < query_classifier.get_threshold()
+
+
+def test_confidence_relative_to_threshold():
+    """高置信度规则达到默认阈值，降级和弱信号规则低于阈值"""
+    threshold = query_classifier.get_threshold()
+    assert query_classifier.classify('帮我写一首诗')['confidence'] >= threshold
+    assert query_classifier.classify('帮我写一篇今天的新闻稿')['confidence'] < threshold
+    assert query_classifier.classify('最近怎么样')['confidence'] < threshold
+
+
+def test_shadow_comparison_recorded_separately(monkeypatch):
+    """置信度达标时按抽样比例回退到大模型，对比结果单独统计"""
+    monkeypatch.setenv('QUERY_CLASSIFIER_ENABLED', 'true')
+    monkeypatch.setenv('QUERY_CLASSIFIER_SHADOW_RATE', '1')
+    before = query_classifier.get_stats()
+
+    classification = query_classifier.classify('帮我写一首诗')
+    assert not query_classifier.should_use(classification)
+    query_classifier.record_agreement(classification, False, "开放性问题")
+    # 置信度不足的分类只计入整体的一致率
+    weak = query_classifier.classify('最近怎么样')
+    assert not query_classifier.should_use(weak)
+    query_classifier.record_agreement(weak, False, "准确答案问题")
+
+    after = query_classifier.get_stats()
+    assert after['shadow_compared'] - before['shadow_compared'] == 1
+    assert after['shadow_need_search_agreed'] - before['shadow_need_search_agreed'] == 1
+    assert after['compared'] - before['compared'] == 2
+    assert after['need_search_agreed'] - before['need_search_agreed'] == 1
+
+    monkeypatch.setenv('QUERY_CLASSIFIER_SHADOW_RATE', '0')
+    assert query_classifier.should_use(query_classifier.classify('帮我写一首诗'))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试搜索结果去重
+
+验证规范化链接后相同的结果和摘要近似重复的结果被合并，内容不同的结果保留，
+以及 LSH 分桶只对少量候选结果计算精确的相似度。
+"""
+
+import random
+
+import result_dedup
+
+
+def _item(index, content):
+    return {'title': f'结果{index}', 'link': f'https://site{index}.example.com/article', 'content': content}
+
+
+def _article(rng, length=300):
+    """生成随机的中文摘要"""
+    return ''.join(chr(rng.randint(0x4e00, 0x4fff)) for _ in range(length))
+
+
+def test_url_and_near_duplicate_content_merged():
+    """规范化链接后相同的结果和转载的近似重复摘要被合并，保留排名靠前的结果"""
+    rng = random.Random(1)
+    article = _article(rng)
+    results = [
+        _item(1, article),
+        {'title': '移动版', 'link': 'http://m.site1.example.com/article/?utm_source=x', 'content': '摘要'},
+        _item(2, article[:-3] + '（转载）'),
+        _item(3, _article(rng)),
+    ]
+    unique, merged = result_dedup.deduplicate_results(results, similarity_threshold=0.8)
+    assert [item['title'] for item in unique] == ['结果1', '结果3']
+    assert [(item['reason'], item['kept']) for item in merged] == [
+        ('url', 'https://site1.example.com/article'),
+        ('content', 'https://site1.example.com/article'),
+    ]
+
+
+def test_distinct_results_rarely_compared(monkeypatch):
+    """内容互不相同的结果很少落入同一个桶，精确相似度的计算次数远小于结果两两比较的次数"""
+    rng = random.Random(2)
+    results = [_item(index, _article(rng)) for index in range(100)]
+    calls = []
+    jaccard = result_dedup._jaccard
+
+    def counting_jaccard(a, b):
+        calls.append(1)
+        return jaccard(a, b)
+
+    monkeypatch.setattr(result_dedup, '_jaccard', counting_jaccard)
+    unique, merged = result_dedup.deduplicate_results(results, similarity_threshold=0.8)
+    assert len(unique) == 100 and not merged
+    assert len(calls) < 100
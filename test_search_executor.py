@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试并发搜索执行器
+
+验证每个请求共享的截止时间（包括排队时间，到达截止时间时仍在排队的搜索被取消）、请求取消，
+以及 contextvars 上下文传递到搜索线程。
+"""
+
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import cancellation
+import metrics
+import search_executor
+
+
+@pytest.fixture
+def executor():
+    pool = ThreadPoolExecutor(max_workers=1)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def _sleepy_search(delays, calls=None):
+    """按关键词等待相应的秒数后返回关键词本身"""
+    def search(keyword):
+        if calls is not None:
+            calls.append(keyword)
+        time.sleep(delays[keyword])
+        return [keyword]
+    return search
+
+
+def test_deadline_abandons_slow_search():
+    """超过截止时间的搜索被放弃，不影响已完成的搜索"""
+    pool = ThreadPoolExecutor(max_workers=2)
+    try:
+        start = time.perf_counter()
+        slots = search_executor.run_concurrent_searches(
+            _sleepy_search({'fast': 0, 'slow': 0.5}), ['fast', 'slow'], deadline=0.2, executor=pool)
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.shutdown(wait=True)
+    assert elapsed < 0.45
+    assert [(slot['status'], slot['results']) for slot in slots] == [('ok', ['fast']), ('timeout', [])]
+    assert slots[1]['latency'] == 0.2
+
+
+def test_queue_time_counts_toward_deadline(executor):
+    """排队等待的时间计入截止时间：线程池繁忙时请求也在截止时间返回，只使用已返回的结果"""
+    start = time.perf_counter()
+    slots = search_executor.run_concurrent_searches(
+        _sleepy_search({'a': 0.2, 'b': 0.2}), ['a', 'b'], deadline=0.3, executor=executor)
+    elapsed = time.perf_counter() - start
+    assert elapsed < 0.38
+    assert [slot['status'] for slot in slots] == ['ok', 'timeout']
+
+
+def test_queued_search_cancelled_at_deadline(executor):
+    """到达截止时间时仍在排队的搜索被取消，不会再执行，并单独记录排队超时"""
+    calls = []
+    before = metrics.ERRORS.collect().get(('search', 'QueueTimeout'), 0)
+    slots = search_executor.run_concurrent_searches(
+        _sleepy_search({'a': 0.3, 'b': 0}, calls), ['a', 'b'], deadline=0.1, executor=executor)
+    assert [slot['status'] for slot in slots] == ['timeout', 'timeout']
+    assert metrics.ERRORS.collect().get(('search', 'QueueTimeout'), 0) - before == 1
+    executor.shutdown(wait=True)
+    assert calls == ['a']
+
+
+def test_cancel_skips_queued_searches(executor):
+    """请求取消时排队中的搜索被取消，标记为 cancelled"""
+    calls = []
+    token = cancellation.CancelToken()
+    threading.Timer(0.05, token.cancel).start()
+    context = contextvars.copy_context()
+    context.run(cancellation.set_token, token)
+    slots = context.run(search_executor.run_concurrent_searches,
+                        _sleepy_search({'a': 0.3, 'b': 0}, calls), ['a', 'b'], deadline=5, executor=executor)
+    assert [slot['status'] for slot in slots] == ['cancelled', 'cancelled']
+    executor.shutdown(wait=True)
+    assert calls == ['a']
+
+
+def test_context_reaches_search_threads(executor):
+    """搜索线程中可以读取提交时的 contextvars（请求 ID、追踪记录等）"""
+    request_var = contextvars.ContextVar('request_var', default=None)
+
+    def search(keyword):
+        return [request_var.get()]
+
+    context = contextvars.copy_context()
+    context.run(request_var.set, 'req-1')
+    slots = context.run(search_executor.run_concurrent_searches, search, ['a', 'b'], executor=executor)
+    assert [slot['results'] for slot in slots] == [['req-1'], ['req-1']]
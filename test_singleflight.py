@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试请求合并
+
+验证合并的流式请求中领头请求和跟随请求收到相同的数据块，中途加入的请求先收到已生成的数据块，
+上游出错时所有订阅者都收到错误消息和结束标记，以及不同的请求不会被合并。
+"""
+
+import asyncio
+import threading
+import itertools
+
+import pytest
+
+import singleflight
+import sse_events
+
+_keys = itertools.count()
+
+
+@pytest.fixture(autouse=True)
+def no_heartbeat(monkeypatch):
+    """等待期间不输出心跳数据块，便于比较收到的数据块"""
+    monkeypatch.setenv('SSE_HEARTBEAT_INTERVAL', '0')
+
+
+def _key():
+    return singleflight.make_key(f'问题{next(_keys)}', 'searxng', 10, 'zhipuai')
+
+
+def _gated_generator(gate, calls, fail=False):
+    """第一个数据块之后等待 gate，fail 为 True 时随后抛出异常"""
+    def generate():
+        calls.append(1)
+        yield 'data: {"content": "a"}\n\n'
+        gate.wait(5)
+        if fail:
+            raise RuntimeError('上游断开')
+        yield 'data: {"content": "b"}\n\n'
+        yield sse_events.DONE_FRAMES
+    return generate
+
+
+def test_leader_and_follower_receive_same_frames():
+    """同时进行的相同请求只执行一次，所有订阅者收到相同的数据块"""
+    gate, calls = threading.Event(), []
+    key = _key()
+    leader = singleflight.stream(key, _gated_generator(gate, calls))
+    follower = singleflight.stream(key, _gated_generator(gate, calls))
+    gate.set()
+    assert list(leader) == list(follower) == ['data: {"content": "a"}\n\n', 'data: {"content": "b"}\n\n',
+                                               sse_events.DONE_FRAMES]
+    assert len(calls) == 1
+
+
+def test_late_joiner_receives_earlier_frames():
+    """中途加入的请求先收到已经生成的数据块"""
+    gate, calls = threading.Event(), []
+    key = _key()
+    leader = singleflight.stream(key, _gated_generator(gate, calls))
+    first = next(leader)
+    joiner = singleflight.stream(key, _gated_generator(gate, calls))
+    gate.set()
+    assert [first] + list(leader) == list(joiner)
+    assert len(calls) == 1
+
+
+def test_leader_error_reaches_followers():
+    """上游出错时所有订阅者都收到错误消息和结束标记"""
+    gate, calls = threading.Event(), []
+    key = _key()
+    leader = singleflight.stream(key, _gated_generator(gate, calls, fail=True))
+    follower = singleflight.stream(key, _gated_generator(gate, calls, fail=True))
+    gate.set()
+    expected = ['data: {"content": "a"}\n\n', sse_events.stream_error_frames(RuntimeError('上游断开'))]
+    assert list(leader) == list(follower) == expected
+    assert expected[1].endswith(sse_events.DONE_FRAMES)
+
+
+def test_async_leader_error_reaches_followers():
+    """异步版本：上游出错时所有订阅者都收到错误消息和结束标记"""
+    async def generate():
+        yield 'data: {"content": "a"}\n\n'
+        await asyncio.sleep(0.01)
+        raise RuntimeError('上游断开')
+
+    async def collect(stream):
+        return [chunk async for chunk in stream]
+
+    async def run():
+        key = _key()
+        leader = singleflight.stream_async(key, generate)
+        follower = singleflight.stream_async(key, generate)
+        return await asyncio.gather(collect(leader), collect(follower))
+
+    leader, follower = asyncio.run(run())
+    expected = ['data: {"content": "a"}\n\n', sse_events.stream_error_frames(RuntimeError('上游断开'))]
+    assert leader == follower == expected
+
+
+def test_different_requests_are_not_merged():
+    """请求键包含所有影响输出的参数，不同的请求不会被合并"""
+    base = dict(query='C#是什么', engine='searxng', count=10, model_id='zhipuai', skip_analysis=False,
+                speculative=False)
+    variants = [
+        dict(query='C是什么'),
+        dict(engine='bochaai'),
+        dict(count=5),
+        dict(model_id='deepseek-chat'),
+        dict(skip_analysis=True),
+        dict(speculative=True),
+        dict(time_range='day'),
+    ]
+    keys = {singleflight.make_key(**base)}
+    for variant in variants:
+        keys.add(singleflight.make_key(**dict(base, **variant)))
+    assert len(keys) == len(variants) + 1
+    # 仅有空白、大小写和句末标点差异的问题被合并
+    assert singleflight.make_key(**dict(base, query=' c# 是什么？')) == singleflight.make_key(**base)
+
+    gate, calls = threading.Event(), []
+    gate.set()
+    first = singleflight.stream(_key(), _gated_generator(gate, calls))
+    second = singleflight.stream(_key(), _gated_generator(gate, calls))
+    assert list(first) == list(second)
+    assert len(calls) == 2
+
+
+def test_route_reports_pipeline_error_to_subscribers(monkeypatch):
+    """联网搜索流式路由在调用搜索流水线时出错，合并的请求收到错误消息和结束标记"""
+    import app as app_module
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('分析失败')
+
+    monkeypatch.setenv('SINGLEFLIGHT_ENABLED', 'true')
+    monkeypatch.setattr(app_module.chat_with_intelligent_search, 'chat_with_intelligent_search', fail)
+    response = app_module.app.test_client().post(
+        '/api/chat_with_search', json={'query': f'问题{next(_keys)}', 'engine': 'searxng', 'stream': True})
+    assert response.get_data(as_text=True) == sse_events.stream_error_frames(RuntimeError('分析失败'))
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试流式输出事件模块
+
+验证上游数据行解析为事件、事件序列化为前端格式的数据块，
+增量格式化时暂存的内容在其他事件之前输出，以及内容数据块的合并。
+"""
+
+import json
+import time
+import asyncio
+
+import pytest
+
+import sse_events
+from format_deepseek_output import StreamingFormatter
+
+
+def _frames_to_json(frames):
+    """拆分数据块并解析 JSON，[DONE] 原样保留"""
+    payloads = []
+    for frame in ''.join(frames).split('\n\n'):
+        if not frame:
+            continue
+        assert frame.startswith('data: ')
+        payload = frame[6:]
+        payloads.append(payload if payload == '[DONE]' else json.loads(payload))
+    return payloads
+
+
+def test_parse_zhipu_lines():
+    """智谱AI数据行解析为内容事件，空 delta 和空行被跳过，[DONE] 为结束标记"""
+    lines = [
+        b'data: {"id": "1", "choices": [{"index": 0, "delta": {"role": "assistant", "content": "\xe4\xbd\xa0\xe5\xa5\xbd"}}]}',
+        b'',
+        b'data: {"id": "1", "choices": [{"index": 0, "delta": {"content": ""}}]}',
+        b'data: {"id": "1", "choices": [{"index": 0, "delta": {"reasoning_content": "think"}}]}',
+        b'data: [DONE]'
+    ]
+    events = list(sse_events.parse_lines(lines))
+    assert [(event.type, event.content) for event in events] == [
+        (sse_events.CONTENT, '你好'),
+        (sse_events.REASONING, 'think'),
+        (sse_events.DONE, '')
+    ]
+
+
+def test_serialize_round_trip():
+    """序列化后的数据块以空行结尾，前端解析得到原来的内容"""
+    events = [
+        sse_events.Event(sse_events.CONTENT, '引号"和\n换行'),
+        sse_events.Event(sse_events.REASONING, '推理'),
+        sse_events.Event(sse_events.DATA, data={'search_results': [], 'question_type': ''}),
+        sse_events.Event(sse_events.ERROR, '出错'),
+        sse_events.DONE_EVENT
+    ]
+    frames = list(sse_events.to_frames(events))
+    assert all(frame.endswith('\n\n') for frame in frames)
+    assert _frames_to_json(frames) == [
+        {'content': '引号"和\n换行'},
+        {'is_reasoning': True, 'content': '推理'},
+        {'search_results': [], 'question_type': ''},
+        {'error': '出错'},
+        {'done': True},
+        '[DONE]'
+    ]
+    # 再次解析得到相同的事件
+    reparsed = [sse_events.parse_line(frame.rstrip('\n')) for frame in frames[:2]]
+    assert [(event.type, event.content) for event in reparsed] == [
+        (sse_events.CONTENT, '引号"和\n换行'),
+        (sse_events.REASONING, '推理')
+    ]
+
+
+def test_format_content_flushes_before_other_events():
+    """格式化器暂存的内容在推理内容和结束标记之前输出，拼接结果与整体格式化相同"""
+    tokens = ['## 标题', '\n正文', '内容**加粗**', '\n\n1. 第一', '项\n']
+    events = [sse_events.Event(sse_events.CONTENT, token) for token in tokens[:3]]
+    events.append(sse_events.Event(sse_events.REASONING, '推理'))
+    events.extend(sse_events.Event(sse_events.CONTENT, token) for token in tokens[3:])
+    events.append(sse_events.DONE_EVENT)
+
+    formatted = list(sse_events.format_content(events, StreamingFormatter()))
+    types = [event.type for event in formatted]
+    assert types[-1] == sse_events.DONE
+    reasoning_index = types.index(sse_events.REASONING)
+    before = ''.join(event.content for event in formatted[:reasoning_index])
+    after = ''.join(event.content for event in formatted[reasoning_index + 1:-1])
+
+    expected = StreamingFormatter()
+    assert before == expected.feed(''.join(tokens[:3])) + expected.flush()
+    expected = StreamingFormatter()
+    assert after == expected.feed(''.join(tokens[3:])) + expected.flush()
+
+
+def test_batcher_merges_content_frames():
+    """第一个内容数据块立即写出，之后的同类数据块合并，控制数据块和暂存的内容一起写出"""
+    batcher = sse_events.FrameBatcher(window=1.0, max_bytes=4096)
+    content = [sse_events.serialize(sse_events.Event(sse_events.CONTENT, text)) for text in ('你', '好"', '\\', '！')]
+    reasoning = sse_events.serialize(sse_events.Event(sse_events.REASONING, '想'))
+
+    assert batcher.add(sse_events.ROLE_FRAME, 0) == sse_events.ROLE_FRAME
+    assert batcher.add(content[0], 0) == content[0]
+    assert batcher.add(content[1], 0.1) is None
+    assert batcher.add(content[2], 0.2) is None
+    assert batcher.add(reasoning, 0.3) is None
+    assert batcher.add(content[3], 0.4) is None
+    output = batcher.add(sse_events.DONE_FRAMES, 0.5)
+
+    assert output.endswith(sse_events.DONE_FRAMES)
+    assert _frames_to_json([output]) == [
+        {'content': '好"\\'},
+        {'is_reasoning': True, 'content': '想'},
+        {'content': '！'},
+        {'done': True},
+        '[DONE]'
+    ]
+    assert batcher.flush() == ''
+
+
+def test_batcher_flushes_on_window_and_size():
+    """暂存时间达到合并窗口或字节数达到上限时写出"""
+    frames = [sse_events.serialize(sse_events.Event(sse_events.CONTENT, 'x' * 10)) for _ in range(4)]
+    batcher = sse_events.FrameBatcher(window=0.02, max_bytes=4096)
+    assert batcher.add(frames[0], 0) == frames[0]
+    assert batcher.add(frames[1], 0.001) is None
+    assert abs(batcher.time_left(0.011) - 0.01) < 1e-9
+    assert _frames_to_json([batcher.add(frames[2], 0.021)]) == [{'content': 'x' * 20}]
+
+    batcher = sse_events.FrameBatcher(window=1.0, max_bytes=len(frames[0]) * 2)
+    batcher.add(frames[0], 0)
+    assert batcher.add(frames[1], 0) is None
+    assert _frames_to_json([batcher.add(frames[2], 0)]) == [{'content': 'x' * 20}]
+
+
+def test_batcher_keeps_frames_with_other_fields():
+    """带有其他字段的数据块（如之前版本缓存的数据块）不合并"""
+    legacy = 'data: {"content": "a", "role": "assistant"}\n\n'
+    batcher = sse_events.FrameBatcher(window=1.0, max_bytes=4096)
+    batcher.add(sse_events.serialize(sse_events.Event(sse_events.CONTENT, 'x')), 0)
+    assert batcher.add(sse_events.serialize(sse_events.Event(sse_events.CONTENT, 'y')), 0) is None
+    assert batcher.add(legacy, 0) == 'data: {"content": "y"}\n\n' + legacy
+
+
+@pytest.fixture
+def greenlet_reader(monkeypatch):
+    """按 gevent 工作进程的方式合并（后台读取使用线程代替协程，行为相同）"""
+    monkeypatch.setattr(sse_events, '_reader_is_greenlet', lambda: True)
+
+
+def test_batch_frames_skipped_for_thread_workers(monkeypatch):
+    """线程工作进程中不合并，不为每个连接创建后台读取线程"""
+    monkeypatch.setattr(sse_events, '_reader_is_greenlet', lambda: False)
+    frames = iter([sse_events.ROLE_FRAME])
+    assert sse_events.batch_frames(frames, 0.02, 4096) is frames
+
+
+def test_batch_frames_flushes_when_upstream_stalls(greenlet_reader):
+    """同步版本在上游暂停输出时也在合并窗口结束时写出暂存的内容"""
+    frames = [sse_events.serialize(sse_events.Event(sse_events.CONTENT, text)) for text in 'ab']
+
+    def upstream():
+        yield frames[0]
+        yield frames[1]
+        time.sleep(0.3)
+        yield sse_events.DONE_FRAMES
+
+    received = []
+    start = time.monotonic()
+    for output in sse_events.batch_frames(upstream(), 0.02, 4096):
+        received.append((output, time.monotonic() - start))
+    assert [output for output, _ in received] == frames + [sse_events.DONE_FRAMES]
+    assert received[1][1] < 0.15
+
+
+def test_batch_frames_queue_is_bounded(greenlet_reader):
+    """客户端读取较慢时后台读取在队列写满后暂停，不会无限制地缓存上游输出"""
+    produced = []
+
+    def upstream():
+        for index in range(10000):
+            produced.append(index)
+            yield sse_events.serialize(sse_events.Event(sse_events.CONTENT, 'x'))
+
+    batched = sse_events.batch_frames(upstream(), 10, 1 << 30)
+    next(batched)
+    time.sleep(0.2)
+    assert len(produced) <= sse_events.FRAME_QUEUE_SIZE + 2
+    # 关闭后等待放入队列的后台读取也会停止
+    batched.close()
+    time.sleep(0.05)
+    stopped = len(produced)
+    time.sleep(0.1)
+    assert len(produced) == stopped < 10000
+
+
+def test_batch_frames_closes_upstream(greenlet_reader):
+    """关闭合并后的生成器时关闭上游迭代器，上游异常传递给调用方"""
+    closed = []
+
+    def upstream():
+        try:
+            while True:
+                yield sse_events.serialize(sse_events.Event(sse_events.CONTENT, 'x'))
+                time.sleep(0.001)
+        finally:
+            closed.append(True)
+
+    batched = sse_events.batch_frames(upstream(), 0.02, 4096)
+    next(batched)
+    batched.close()
+    deadline = time.monotonic() + 1
+    while not closed and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert closed
+
+    def failing():
+        yield sse_events.ROLE_FRAME
+        raise RuntimeError('上游断开')
+
+    batched = sse_events.batch_frames(failing(), 0.02, 4096)
+    assert next(batched) == sse_events.ROLE_FRAME
+    with pytest.raises(RuntimeError, match='上游断开'):
+        next(batched)
+
+
+def test_batch_frames_async_flushes_after_window():
+    """异步版本在合并窗口结束时写出暂存的内容，不等待下一个数据块"""
+    frames = [sse_events.serialize(sse_events.Event(sse_events.CONTENT, text)) for text in 'abc']
+
+    async def upstream():
+        yield frames[0]
+        yield frames[1]
+        yield frames[2]
+        await asyncio.sleep(0.2)
+        yield sse_events.DONE_FRAMES
+
+    async def collect():
+        received = []
+        start = time.monotonic()
+        async for output in sse_events.batch_frames_async(upstream(), 0.02, 4096):
+            received.append((output, time.monotonic() - start))
+        return received
+
+    received = asyncio.run(collect())
+    assert [output for output, _ in received] == [frames[0], 'data: {"content": "bc"}\n\n', sse_events.DONE_FRAMES]
+    assert received[1][1] < 0.15
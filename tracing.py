@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求耗时追踪模块
+
+记录智能联网搜索聊天请求各阶段的耗时（分析问题、每次搜索引擎调用、组装提示词、大模型调用、
+首个数据块时间和流式输出总时间），用于分析慢回答的时间花在哪里。
+
+- 每个请求的追踪记录保存在 contextvars 中，与请求 ID 一起传递到搜索线程和异步任务
+- 未启用时 span() 返回共享的空操作对象，几乎没有额外开销
+- 请求结束时输出一条耗时汇总日志；非流式结果中包含 timings 字段，
+  流式输出在最后发送一个 data: {"timings": {...}} 数据块
+
+默认不启用，需要设置 TRACING_ENABLED=true。
+"""
+
+import os
+import json
+import time
+import functools
+import threading
+import contextvars
+from dotenv import load_dotenv
+
+from log_config import get_logger, get_request_id
+import metrics
+
+# 加载环境变量
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# 当前请求的追踪记录，未启用追踪或未处于请求中时为 None
+_current_trace = contextvars.ContextVar('trace', default=None)
+
+
+def is_enabled():
+    """是否启用耗时追踪，默认不启用"""
+    return os.getenv('TRACING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+class Trace:
+    """一个请求的追踪记录：各阶段的耗时和关键时间点"""
+
+    def __init__(self):
+        self.request_id = get_request_id()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.marks = {}
+        self.total = None
+        self._lock = threading.Lock()
+
+    def add_span(self, name, start, end, attrs=None):
+        """
+        记录一个阶段的耗时
+
+        Args:
+            name: 阶段名称
+            start: 开始时间（time.perf_counter()）
+            end: 结束时间（time.perf_counter()）
+            attrs: 阶段的附加属性，如搜索引擎、模型等
+        """
+        span = {'name': name, 'start_ms': _ms(start - self.start), 'duration_ms': _ms(end - start)}
+        if attrs:
+            span.update(attrs)
+        with self._lock:
+            self.spans.append(span)
+
+    def mark(self, name):
+        """记录关键时间点（如首个数据块），同名时间点只记录第一次"""
+        with self._lock:
+            self.marks.setdefault(name, _ms(time.perf_counter() - self.start))
+
+    def finish(self):
+        """
+        结束追踪并输出耗时汇总日志，重复调用时只在第一次输出日志
+
+        Returns:
+            dict: 追踪记录，格式见 to_dict
+        """
+        if self.total is None:
+            self.total = _ms(time.perf_counter() - self.start)
+            timings = self.to_dict()
+            summary = ', '.join(f"{span['name']}={span['duration_ms']}ms" for span in timings['spans'])
+            logger.info("请求耗时: 总计 %sms, %s", self.total, summary, extra={'fields': {'timings': timings}})
+            return timings
+        return self.to_dict()
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: {"request_id", "total_ms", "<时间点>_ms"..., "spans": [{"name", "start_ms", "duration_ms", ...}]}
+        """
+        total = self.total if self.total is not None else _ms(time.perf_counter() - self.start)
+        timings = {'request_id': self.request_id, 'total_ms': total}
+        with self._lock:
+            for name, value in self.marks.items():
+                timings[f'{name}_ms'] = value
+            timings['spans'] = sorted(self.spans, key=lambda span: span['start_ms'])
+        return timings
+
+
+class _Span:
+    """记录一个阶段耗时的上下文管理器"""
+
+    __slots__ = ('trace', 'name', 'attrs', 'start')
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """在阶段执行过程中补充附加属性"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.trace.add_span(self.name, self.start, time.perf_counter(), self.attrs)
+        return False
+
+
+class _NullSpan:
+    """未启用追踪时使用的空操作上下文管理器"""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def current_trace():
+    """获取当前请求的追踪记录，未启用追踪时返回 None"""
+    return _current_trace.get()
+
+
+def span(name, **attrs):
+    """
+    记录一个阶段的耗时
+
+    用法：
+        with tracing.span('perform_search', engine=engine):
+            ...
+
+    Args:
+        name: 阶段名称
+        **attrs: 阶段的附加属性
+
+    Returns:
+        上下文管理器，当前请求未启用追踪时为空操作对象
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name, attrs)
+
+
+def trace_request(func):
+    """
+    装饰器：在新的追踪记录中执行请求处理函数，函数返回后恢复原来的追踪记录
+
+    函数内部通过 current_trace() 获取追踪记录。未启用追踪时当前追踪记录为 None，
+    同一线程处理的上一个请求的追踪记录也不会被沿用。
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current_trace.set(Trace() if is_enabled() else None)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_trace.reset(token)
+    return wrapper
+
+
+def trace_request_async(func):
+    """trace_request 的异步版本，用于装饰协程函数"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _current_trace.set(Trace() if is_enabled() else None)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _current_trace.reset(token)
+    return wrapper
+
+
+def timings_event(trace):
+    """
+    结束追踪并生成流式输出的耗时数据块
+
+    Args:
+        trace: 追踪记录
+
+    Returns:
+        str: SSE 数据块 data: {"timings": {...}}
+    """
+    return f"data: {json.dumps({'timings': trace.finish()}, ensure_ascii=False)}\n\n"
+
+
+def trace_stream(trace, lines):
+    """
+    逐个传递流式输出的数据块，记录首个数据块时间和流式输出总时间，最后发送耗时数据块
+
+    Args:
+        trace: 追踪记录
+        lines: 数据块迭代器
+
+    Returns:
+        generator: 输入的数据块，以及最后的耗时数据块
+    """
+    start = time.perf_counter()
+    first = True
+    for line in lines:
+        if first and metrics.is_token_frame(line):
+            trace.mark('first_token')
+            first = False
+        yield line
+    trace.add_span('stream', start, time.perf_counter())
+    yield timings_event(trace)
+
+
+async def trace_stream_async(trace, lines):
+    """
+    trace_stream 的异步版本
+
+    Args:
+        trace: 追踪记录
+        lines: 数据块异步生成器
+
+    Returns:
+        异步生成器: 输入的数据块，以及最后的耗时数据块
+    """
+    start = time.perf_counter()
+    first = True
+    async for line in lines:
+        if first and metrics.is_token_frame(line):
+            trace.mark('first_token')
+            first = False
+        yield line
+    trace.add_span('stream', start, time.perf_counter())
+    yield timings_event(trace)